@@ -0,0 +1,169 @@
+# ==============================================================================
+#           识别模型自动选择 (ASR Model Calibration) v1.0
+# ==============================================================================
+# 版本说明:
+# - 【核心新增】ASR_MODEL_AUTO=on 时，第一次加载识别模型前在本机实测候选模型 (tiny/base/small，
+#              仅英文时还包括 .en 版本) 的识别实时率 (识别耗时 / 音频时长)，选出满足 ASR_TARGET_RTF 的
+#              最准确的模型，代替代码里写死的 'base' / 'base.en'。每个候选都会测到，每个模型识别
+#              ASR_CALIBRATION_RUNS 遍 (默认3) 取中位数；按准确度从低到高，选“连续达标”的最后一个，
+#              较小的模型没达标而更大的模型反而达标 (测量波动) 时只打印警告，不选那个更大的模型。
+# - 【测试音频】按实时字幕同样的VAD规则切成语段再逐段识别，与实际使用时的开销一致。依次使用：
+#              ASR_CALIBRATION_CLIP 指定的录音 → 最近一次会议保存的音频 (audio_spool/)。
+#              注意：仓库里不附带测试录音。ASR_CALIBRATION_CLIP 默认指向本目录下的 calibration_clip.wav，
+#              需要自己放一段 30 秒左右的说话录音 (WAV/FLAC，任意采样率)；没放的话要等开过一次会议
+#              (AUDIO_SPOOL=on) 才有音频可测，在那之前每次启动都沿用默认模型，并打印提示。
+# - 【按机器缓存】结果按“主机名 + CPU”记录在 asr_calibration.json，之后启动直接使用，不再重复测试；
+#              换了电脑、改了 ASR_TARGET_RTF 或加上 --force 才重新校准。
+# - 【独立进程】校准在子进程中运行，测试过的模型随子进程退出一并释放，不占主程序内存。
+# - 【用法】python asr_calibration.py [--english] [--target 0.5] [--clip 录音.wav] [--force]
+# ==============================================================================
+import argparse
+import gc
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+load_dotenv()
+ASR_MODEL_AUTO = os.getenv("ASR_MODEL_AUTO", "off").lower() == "on"
+ASR_TARGET_RTF = float(os.getenv("ASR_TARGET_RTF", "0.5"))  # 留出余量：实时率到 0.9 附近时背压就要开始追赶了
+ASR_CALIBRATION_CLIP = os.getenv("ASR_CALIBRATION_CLIP", os.path.join(os.path.dirname(os.path.abspath(__file__)), "calibration_clip.wav"))
+ASR_CALIBRATION_FILE = os.getenv("ASR_CALIBRATION_FILE", "asr_calibration.json")
+CALIBRATION_SECONDS = 30  # 最多用多长的语音来测试
+CALIBRATION_RUNS = int(os.getenv("ASR_CALIBRATION_RUNS", "3"))  # 每个模型识别几遍取中位数，避免偶然一次卡顿误判
+# 候选模型按准确度从低到高排列；同一档大小的 .en 模型英文更准，速度相同
+MULTILINGUAL_CANDIDATES = ["tiny", "base", "small"]
+ENGLISH_CANDIDATES = ["tiny", "tiny.en", "base", "base.en", "small", "small.en"]
+
+
+def machine_key():
+    """标识这台机器：主机名 + 系统 + CPU型号 + 核数。"""
+    return f"{platform.node()}|{platform.system()}|{platform.machine()}|{platform.processor() or '-'}|{os.cpu_count()}核"
+
+
+def load_cache(path=ASR_CALIBRATION_FILE):
+    try:
+        with open(path, encoding="utf-8") as f: return json.load(f)
+    except (OSError, json.JSONDecodeError): return {}
+
+
+def cached_choice(english_only, target_rtf=ASR_TARGET_RTF):
+    """本机已缓存的校准结果 (目标实时率相同才算数)，没有时返回 None。"""
+    record = load_cache().get(machine_key(), {}).get("english" if english_only else "multilingual")
+    return record if record and record.get("target_rtf") == target_rtf else None
+
+
+def save_choice(english_only, record, path=ASR_CALIBRATION_FILE):
+    cache = load_cache(path)
+    cache.setdefault(machine_key(), {})["english" if english_only else "multilingual"] = record
+    with open(path, "w", encoding="utf-8") as f: json.dump(cache, f, ensure_ascii=False, indent=2)
+
+
+def choose_asr_model(default, english_only=False):
+    """入口脚本加载识别模型前调用：ASR_MODEL_AUTO 关闭时原样返回 default；否则返回本机校准选出的模型，
+    尚未校准时在子进程中校准一次 (会阻塞到校准结束)，校准失败则返回 default。"""
+    if not ASR_MODEL_AUTO: return default
+    record = cached_choice(english_only)
+    if record is None:
+        print("[校准] 本机尚未校准识别模型，正在测试各候选模型的实时率 (只需进行一次)...")
+        subprocess.run([sys.executable, os.path.abspath(__file__)] + (["--english"] if english_only else []))
+        record = cached_choice(english_only)
+    if record is None:
+        print(f"[警告] 识别模型校准未完成 (没有测试录音时，请把一段说话录音放到 {ASR_CALIBRATION_CLIP})，继续使用默认模型 '{default}'。"); return default
+    print(f"[校准] 使用本机校准选出的识别模型 '{record['model']}' (实时率 {record['results'][record['model']]['rtf']:.2f})。")
+    return record["model"]
+
+
+def load_calibration_segments(clip=ASR_CALIBRATION_CLIP, seconds=CALIBRATION_SECONDS):
+    """取测试用的语段 (16kHz float32)，返回 (语段列表, 来源说明)；没有可用的录音时返回 ([], None)。"""
+    from audio_capture import TARGET_RATE, load_audio_file, split_recording
+    segments, source = [], None
+    if clip and os.path.exists(clip):
+        audio, spans = split_recording(*load_audio_file(clip))
+        segments, source = [audio[start:end] for start, end, _ in spans], clip
+    else:
+        from audio_spool import SPOOL_DIR, open_spool
+        for index_path in sorted(glob.glob(os.path.join(SPOOL_DIR, "*.jsonl")), key=os.path.getmtime, reverse=True):
+            try: _, audio, spool_segments = open_spool(index_path[:-len(".jsonl")])
+            except (OSError, ValueError): continue
+            if spool_segments:
+                segments, source = [audio[s["start"]:s["end"]] for s in spool_segments], index_path[:-len(".jsonl")]; break
+    kept, total = [], 0
+    for segment in segments:
+        if total >= seconds * TARGET_RATE: break
+        kept.append(segment); total += len(segment)
+    return kept, source
+
+
+def measure(model_name, segments, english_only, runs=CALIBRATION_RUNS):
+    """加载模型并逐段识别 runs 遍，返回 {"rtf" (各遍中位数), "load_seconds"}；测完立即释放模型。"""
+    import whisper
+    from audio_capture import TARGET_RATE
+    started = time.perf_counter()
+    model = whisper.load_model(model_name)
+    load_seconds = time.perf_counter() - started
+    options = {"fp16": False, "language": "en"} if english_only or model_name.endswith(".en") else {"fp16": False}
+    model.transcribe(segments[0], **options)  # 预热，排除首次调用的初始化耗时
+    audio_seconds, rtfs = sum(len(s) for s in segments) / TARGET_RATE, []
+    for _ in range(max(1, runs)):
+        started = time.perf_counter()
+        for segment in segments: model.transcribe(segment, **options)
+        rtfs.append((time.perf_counter() - started) / audio_seconds)
+    del model; gc.collect()
+    return {"rtf": round(statistics.median(rtfs), 3), "load_seconds": round(load_seconds, 2)}
+
+
+def calibrate(segments, candidates, target_rtf, english_only):
+    """逐个测试全部候选，返回 (选中的模型, 各模型结果)。
+
+    候选按准确度从低到高排列，选第一个不达标的模型之前最后一个达标的；更大的模型不可能比已经不达标的
+    小模型更快，它之后再“达标”只是测量波动，打印警告但不选用。
+    """
+    chosen, failed, results = None, None, {}
+    for name in candidates:
+        print(f"[校准] 正在测试模型 '{name}' ...")
+        try: results[name] = measure(name, segments, english_only)
+        except Exception as e: print(f"[警告] 模型 '{name}' 测试失败: {e}"); continue
+        print(f"[校准] '{name}': 实时率 {results[name]['rtf']:.2f}，加载 {results[name]['load_seconds']:.1f} 秒")
+        if results[name]["rtf"] > target_rtf: failed = failed or name
+        elif failed: print(f"[警告] '{name}' 达标但更小的 '{failed}' 没达标，测量结果不单调 (可能是偶然波动)，不选用 '{name}'。")
+        else: chosen = name
+    if chosen is None and results:
+        chosen = min(results, key=lambda n: results[n]["rtf"])  # 都不达标：用最快的，由背压兜底
+        print(f"[警告] 没有模型能达到目标实时率 {target_rtf}，选用最快的 '{chosen}'。")
+    return chosen, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="实测本机各Whisper模型的识别实时率，选出满足目标的最准确模型")
+    parser.add_argument("--english", action="store_true", help="只识别英文 (候选模型包括 .en 版本)")
+    parser.add_argument("--target", type=float, default=ASR_TARGET_RTF, help="目标实时率 (识别耗时/音频时长)")
+    parser.add_argument("--clip", default=ASR_CALIBRATION_CLIP, help="测试录音 (WAV/FLAC)；不存在时使用最近一次会议的音频")
+    parser.add_argument("--force", action="store_true", help="忽略已缓存的结果，重新校准")
+    args = parser.parse_args()
+    record = cached_choice(args.english, args.target)
+    if record and not args.force: print(f"[校准] 本机已校准过，选用 '{record['model']}' (加 --force 重新校准)。"); return
+    segments, source = load_calibration_segments(args.clip)
+    if not segments:
+        print(f"[错误] 没有可用于校准的录音：请把一段说话录音放到 {args.clip} (或设置 ASR_CALIBRATION_CLIP)，或先开一次会议。")
+        sys.exit(1)
+    print(f"[校准] 测试音频: {source} ({len(segments)} 段)，目标实时率 {args.target}。")
+    chosen, results = calibrate(segments, ENGLISH_CANDIDATES if args.english else MULTILINGUAL_CANDIDATES, args.target, args.english)
+    if chosen is None: print("[错误] 所有候选模型都测试失败。"); sys.exit(1)
+    save_choice(args.english, {"model": chosen, "target_rtf": args.target, "results": results, "clip": source,
+                               "at": datetime.now().isoformat(timespec="seconds")})
+    print(f"{'模型':>10} | {'实时率':>8} | {'加载 (秒)':>9}")
+    print("-" * 34)
+    for name, result in results.items(): print(f"{name:>10} | {result['rtf']:>8.2f} | {result['load_seconds']:>9.1f}{'  <- 选用' if name == chosen else ''}")
+    print(f"[校准] 已选用 '{chosen}'，结果保存在 {ASR_CALIBRATION_FILE}。")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+# ==============================================================================
+#           共享语音识别服务 (Shared Whisper ASR Server) v1.3
+# ==============================================================================
+# 版本说明:
+# - 【核心新增】Whisper 模型只在一个常驻后台进程里加载一次，
+#              会议模式、实时字幕模式以及 main.py / mai.py 都通过本地套接字复用它。
+# - 【即开即用】再次按 1/2 开始新任务时不再重新 load_model，会话启动几乎瞬间完成，
+#              多个程序同时运行也只占用一份模型内存。
+# - 【用法】无需手动启动：客户端首次连接不上时会自动拉起本服务；
+#          也可以直接运行 `python asr_server.py [模型名]` 让它提前常驻。
+#          连接密钥首次使用时随机生成，保存在只有当前用户可读的 ASR_SERVER_KEY_FILE 中。
+# - 【v1.1 新增】多路采集共用一个识别模型：FairAsrScheduler 为每一路音频 (麦克风、系统声音等)
+#              各建一个等待队列，识别线程按轮询顺序取任务，一路说个不停也不会饿死另一路。
+# - 【v1.2 新增】空闲回收：模型超过 MODEL_IDLE_MINUTES 分钟没有识别请求就从服务中释放，归还内存；
+#              新增 load 操作 (AsrClient.preload())，界面被激活时提前在后台重新加载，并返回加载耗时和服务内存。
+# - 【v1.3 新增】发给服务的音频默认会序列化复制一份。会议模式的语段是落盘文件 (audio_spool) 上的视图，
+#              改为只发送“文件路径 + 偏移 + 长度”，服务端直接映射同一文件读取，不再复制；
+#              实时字幕模式的语段在进程内存的环形缓冲区里，仍按原样复制发送 (每段几百KB)。
+# ==============================================================================
+import os
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from multiprocessing.connection import Client, Listener
+
+from dotenv import load_dotenv
+
+from model_residency import MODEL_IDLE_MINUTES, RESIDENCY_CHECK_SECONDS, format_mb, process_rss
+
+load_dotenv()
+ASR_SERVER_MODE = os.getenv("ASR_SERVER_MODE", "on").lower()  # on=使用共享服务 | off=在本进程内加载模型
+ASR_SERVER_HOST = "127.0.0.1"
+ASR_SERVER_PORT = int(os.getenv("ASR_SERVER_PORT", "50717"))
+ASR_SERVER_AUTHKEY = os.getenv("ASR_SERVER_AUTHKEY", "")  # 留空则使用 ASR_SERVER_KEY_FILE 中随机生成的密钥
+ASR_SERVER_KEY_FILE = os.getenv("ASR_SERVER_KEY_FILE", os.path.join(os.path.expanduser("~"), ".ai_assistant_asr_key"))
+ASR_SERVER_START_TIMEOUT = float(os.getenv("ASR_SERVER_START_TIMEOUT", "120"))
+ASR_DEFAULT_MODEL = os.getenv("ASR_DEFAULT_MODEL", "base")
+ASR_WORKERS = int(os.getenv("ASR_WORKERS", "1"))  # 多路共享时的识别线程数 (本进程内加载的模型请保持1)
+
+
+def spool_reference(audio):
+    """audio 是落盘文件 (np.memmap) 上的连续 float32 视图时，返回 (文件路径, 字节偏移, 采样数)，否则返回 None。"""
+    import numpy as np
+    root = audio
+    while isinstance(root, np.ndarray) and isinstance(root.base, np.ndarray): root = root.base  # 切片的 base 一直追到直接映射文件的那个数组
+    if not isinstance(root, np.memmap) or not getattr(root, "filename", None): return None
+    if audio.dtype != np.float32 or not audio.flags.c_contiguous: return None
+    return root.filename, root.offset + (audio.ctypes.data - root.ctypes.data), len(audio)
+
+
+def server_authkey():
+    """服务与客户端共用的连接密钥。连接上的请求会被反序列化，密钥绝不能写死在公开的代码里：
+    首次使用时随机生成，写入只有当前用户可读的文件，之后服务端和客户端都从这里读取。"""
+    if ASR_SERVER_AUTHKEY: return ASR_SERVER_AUTHKEY.encode("utf-8")
+    try:
+        fd = os.open(ASR_SERVER_KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f: f.write(secrets.token_hex(32))
+    except FileExistsError: pass
+    with open(ASR_SERVER_KEY_FILE, encoding="utf-8") as f: return f.read().strip().encode("utf-8")
+
+
+# ==============================================================================
+#  服务端
+# ==============================================================================
+class AsrServer:
+    """常驻的Whisper推理服务：按模型名缓存已加载的模型，串行处理各客户端的识别请求。"""
+
+    def __init__(self):
+        self.models = {}
+        self.last_used, self.load_seconds = {}, {}  # 模型名 -> 最近一次使用时间 / 加载耗时
+        self.infer_lock = threading.Lock()  # 同一时刻只跑一个推理，避免多个会话互相抢CPU
+        self.load_lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    def get_model(self, model_name):
+        with self.load_lock:
+            if model_name not in self.models:
+                import whisper
+                print(f"[ASR服务] 正在加载模型 '{model_name}' ...")
+                started = time.time()
+                self.models[model_name] = whisper.load_model(model_name)
+                self.load_seconds[model_name] = time.time() - started
+                print(f"[ASR服务] 模型 '{model_name}' 加载完毕，用时 {self.load_seconds[model_name]:.1f} 秒，服务内存 {format_mb(process_rss())}。")
+            self.last_used[model_name] = time.time()
+            return self.models[model_name]
+
+    def evict_idle(self, idle_seconds):
+        """释放超过 idle_seconds 没用过的模型 (等正在进行的识别结束后再释放)。"""
+        with self.load_lock, self.infer_lock:
+            idle = [name for name in self.models if time.time() - self.last_used[name] >= idle_seconds]
+            for name in idle: del self.models[name]
+        if idle:
+            import gc; gc.collect()
+            print(f"[ASR服务] 模型 {', '.join(idle)} 空闲超过 {idle_seconds / 60:.0f} 分钟，已释放，服务内存 {format_mb(process_rss())}。")
+
+    def _evict_loop(self):
+        while not self.stop_event.wait(RESIDENCY_CHECK_SECONDS):
+            self.evict_idle(MODEL_IDLE_MINUTES * 60)
+
+    def handle(self, request):
+        op = request.get("op")
+        if op == "ping": return {"ok": True, "models": list(self.models)}
+        if op == "transcribe":
+            model = self.get_model(request.get("model", ASR_DEFAULT_MODEL))
+            audio = request.get("audio")
+            if audio is None and request.get("spool"):  # 落盘音频：直接映射客户端正在写的同一个文件
+                import numpy as np
+                path, offset, length = request["spool"]
+                audio = np.memmap(path, dtype=np.float32, mode="r", offset=offset, shape=(length,))
+            with self.infer_lock:
+                result = model.transcribe(audio, **request.get("options", {}))
+            self.last_used[request.get("model", ASR_DEFAULT_MODEL)] = time.time()  # 空闲从识别结束时算起
+            return {"ok": True, "result": result}
+        if op == "load":
+            model_name = request.get("model", ASR_DEFAULT_MODEL)
+            self.get_model(model_name)
+            return {"ok": True, "load_seconds": self.load_seconds[model_name], "rss": process_rss()}
+        if op == "shutdown":
+            self.stop_event.set(); return {"ok": True}
+        return {"ok": False, "error": f"未知操作: {op}"}
+
+    def serve_connection(self, conn):
+        with conn:
+            while not self.stop_event.is_set():
+                try: request = conn.recv()
+                except (EOFError, OSError): return
+                try: response = self.handle(request)
+                except Exception as e: response = {"ok": False, "error": repr(e)}
+                try: conn.send(response)
+                except (EOFError, OSError): return
+
+    def serve_forever(self, preload=ASR_DEFAULT_MODEL):
+        listener = Listener((ASR_SERVER_HOST, ASR_SERVER_PORT), authkey=server_authkey())
+        print(f"[ASR服务] 已在 {ASR_SERVER_HOST}:{ASR_SERVER_PORT} 监听。")
+        if preload: threading.Thread(target=self.get_model, args=(preload,), daemon=True).start()
+        if MODEL_IDLE_MINUTES > 0: threading.Thread(target=self._evict_loop, daemon=True).start()
+        threading.Thread(target=self._accept_loop, args=(listener,), daemon=True).start()
+        self.stop_event.wait()
+        listener.close()
+        print("[ASR服务] 已退出。")
+
+    def _accept_loop(self, listener):
+        while not self.stop_event.is_set():
+            try: conn = listener.accept()
+            except Exception as e:
+                if self.stop_event.is_set(): return
+                print(f"[ASR服务] 接受连接失败: {e}"); continue
+            threading.Thread(target=self.serve_connection, args=(conn,), daemon=True).start()
+
+
+# ==============================================================================
+#  客户端
+# ==============================================================================
+def _connect():
+    return Client((ASR_SERVER_HOST, ASR_SERVER_PORT), authkey=server_authkey())
+
+
+def ensure_asr_server(model_name=ASR_DEFAULT_MODEL):
+    """确保共享识别服务在运行：连不上就在后台拉起一个独立进程 (并让它预加载 model_name)，等待它就绪。"""
+    try:
+        _connect().close(); return True
+    except OSError: pass
+    print("[日志] 共享识别服务未运行，正在后台启动...")
+    creationflags = getattr(subprocess, "CREATE_NEW_PROCESS_GROUP", 0)  # Windows下与本窗口的Ctrl+C隔离
+    subprocess.Popen([sys.executable, os.path.abspath(__file__), model_name], creationflags=creationflags)
+    deadline = time.time() + ASR_SERVER_START_TIMEOUT
+    while time.time() < deadline:
+        try:
+            _connect().close(); print("[日志] 共享识别服务已就绪。"); return True
+        except OSError: time.sleep(0.5)
+    print("[错误] 共享识别服务启动超时。")
+    return False
+
+
+class AsrClient:
+    """识别服务的客户端，接口与 whisper 模型一致：client.transcribe(audio, **options) -> result。"""
+
+    def __init__(self, model_name=ASR_DEFAULT_MODEL):
+        self.model_name = model_name
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def request(self, payload):
+        with self.lock:
+            for attempt in range(2):  # 服务重启过时自动重连一次
+                try:
+                    if self.conn is None: self.conn = _connect()
+                    self.conn.send(payload)
+                    response = self.conn.recv()
+                    break
+                except (EOFError, OSError):
+                    self.close_locked()
+                    if attempt: raise
+                    ensure_asr_server(self.model_name)
+        if not response.get("ok"): raise RuntimeError(f"识别服务返回错误: {response.get('error')}")
+        return response
+
+    def transcribe(self, audio, **options):
+        spool = spool_reference(audio)  # 落盘音频只发位置，服务端自己映射读取；其他音频 (环形缓冲区) 复制发送
+        if spool:
+            try: return self.request({"op": "transcribe", "model": self.model_name, "audio": None, "spool": spool, "options": options})["result"]
+            except RuntimeError: pass  # 还在运行的旧版服务不认识 spool：退回复制发送
+        return self.request({"op": "transcribe", "model": self.model_name, "audio": audio, "options": options})["result"]
+
+    def preload(self):
+        """让服务提前加载本客户端的模型 (已加载则立即返回)。"""
+        return self.request({"op": "load", "model": self.model_name})
+
+    def close_locked(self):
+        if self.conn is not None:
+            try: self.conn.close()
+            except OSError: pass
+        self.conn = None
+
+    def close(self):
+        with self.lock: self.close_locked()
+
+
+class FairAsrScheduler:
+    """让多路音频公平地共用同一个识别模型。scheduler.client(来源名) 返回的对象接口与 whisper 模型一致。"""
+
+    def __init__(self, model, workers=ASR_WORKERS):
+        self.model = model
+        self.queues = {}  # 来源名 -> 等待中的任务，按来源加入的先后轮询
+        self.next_index = 0
+        self.served = {}
+        self.cond = threading.Condition()
+        for i in range(max(1, workers)):
+            threading.Thread(target=self._worker, name=f"识别调度{i + 1}", daemon=True).start()
+
+    def client(self, source):
+        with self.cond: self.queues.setdefault(source, deque()); self.served.setdefault(source, 0)
+        return _ScheduledModel(self, source)
+
+    def transcribe(self, source, audio, model=None, **options):
+        """model 可临时指定别的模型 (如背压换用的更小模型)，仍按来源排队轮询。"""
+        job = {"audio": audio, "model": model, "options": options, "done": threading.Event(), "result": None, "error": None}
+        with self.cond:
+            self.queues[source].append(job); self.cond.notify()
+        job["done"].wait()
+        if job["error"] is not None: raise job["error"]
+        return job["result"]
+
+    def _next_job(self):
+        """从上次服务的来源之后开始找第一个有任务的来源 (轮询)。调用时需持有 cond。"""
+        sources = list(self.queues)
+        for offset in range(len(sources)):
+            index = (self.next_index + offset) % len(sources)
+            if self.queues[sources[index]]:
+                self.next_index = index + 1
+                self.served[sources[index]] += 1
+                return self.queues[sources[index]].popleft()
+        return None
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                job = self._next_job()
+                while job is None:
+                    self.cond.wait(); job = self._next_job()
+            try: job["result"] = (job["model"] or self.model).transcribe(job["audio"], **job["options"])
+            except Exception as e: job["error"] = e
+            job["done"].set()
+
+    def stats_line(self):
+        with self.cond:
+            served = ", ".join(f"{source}={count}" for source, count in self.served.items())
+            waiting = sum(len(q) for q in self.queues.values())
+        return f"[识别调度] 各来源已识别 {served} | 排队 {waiting}"
+
+
+class _ScheduledModel:
+    def __init__(self, scheduler, source, model=None):
+        self.scheduler, self.source, self.model = scheduler, source, model
+
+    def using(self, model):
+        """同一来源、改用 model 识别 (model 为调度器自己的模型时原样返回)。"""
+        return self if model is self.scheduler.model else _ScheduledModel(self.scheduler, self.source, model)
+
+    def transcribe(self, audio, **options):
+        return self.scheduler.transcribe(self.source, audio, model=self.model, **options)
+
+
+def get_asr_model(model_name=ASR_DEFAULT_MODEL):
+    """按配置返回识别模型：默认连接共享服务；ASR_SERVER_MODE=off 或服务起不来时在本进程内加载。"""
+    if ASR_SERVER_MODE != "off" and ensure_asr_server(model_name):
+        return AsrClient(model_name)
+    import whisper
+    print(f"[日志] 在本进程内加载Whisper模型 '{model_name}'...")
+    return whisper.load_model(model_name)
+
+
+if __name__ == '__main__':
+    AsrServer().serve_forever(sys.argv[1] if len(sys.argv) > 1 else ASR_DEFAULT_MODEL)  # 由客户端拉起时预加载它要用的模型
@@ -0,0 +1,377 @@
+# ==============================================================================
+#           音频采集公共模块 (Audio Capture Utils) v1.5
+# ==============================================================================
+# 版本说明:
+# - 【v1.5 新增】CaptureHost：持有 PyAudio 实例和在用的采集流，音频流中断 (如USB麦克风接触不良) 时
+#              重新初始化 PortAudio、按设备名称重新找到设备并重开，供流水线在不中断会话的情况下快速恢复。
+#              断流检测时间 STREAM_STALL_SECONDS 缩短为1秒并可配置。
+# - 【v1.4 新增】VadSegmenter.set_max_seconds()：运行中调整单段最长时长，供识别背压控制加长或缩短分段。
+# - 【v1.3 新增】读取录音文件 (WAV，装了 soundfile 时也支持FLAC) 并按与实时采集相同的
+#              重采样和VAD规则切分，供离线批量转写和基准测试使用。
+# - 【v1.2 新增】PyAudio 改为回调模式，int16 直接写入预分配的环形缓冲区；
+#              重采样后的16kHz float32 也存入镜像环形缓冲区，语段以零拷贝视图交给识别，
+#              不再为每段音频反复分配 float64/float32 临时数组，长会议内存占用恒定。
+#              注意：ASR_SERVER_MODE=on (默认) 时识别在另一个进程里，环形缓冲区上的视图发给识别服务时
+#              仍会序列化复制一份；只有本进程内识别 (ASR_SERVER_MODE=off) 才完全零拷贝。
+#              会议模式落盘的音频 (audio_spool) 只发送文件位置，见 asr_server.py v1.3。
+# - 【v1.1 新增】采样率协商优先尝试16kHz原生采集；设备不支持时改用带状态的
+#              多相重采样器，逐帧以float32处理，滤波器按采样率比缓存，块边界无毛刺。
+# - 【核心新增】流式采集：不再一次阻塞读取8秒，而是按30ms小帧读取。
+# - 【核心新增】能量VAD切分器：在说话的自然停顿处把整句送给Whisper，
+#              并设置最长时长上限，首条字幕延迟从“8秒+识别”降到约“一句话”。
+# - 【兼容保留】.env 中设置 CAPTURE_MODE=fixed 可回到旧版的8秒定长切分。
+# ==============================================================================
+import os
+import threading
+import wave
+from fractions import Fraction
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+TARGET_RATE = 16000  # Whisper 要求的输入采样率
+RAW_RING_SECONDS = int(os.getenv("RAW_RING_SECONDS", "5"))  # 驱动回调与采集线程之间的原始int16缓冲
+RING_BUFFER_SECONDS = int(os.getenv("RING_BUFFER_SECONDS", "120"))  # 16kHz float32 语音缓冲，识别积压超过此时长的语段会失效
+STREAM_STALL_SECONDS = float(os.getenv("STREAM_STALL_SECONDS", "1.0"))  # 回调模式下超过此时长没有任何数据，视为音频流中断
+STREAM_STALLED_ERRNO = -9999
+PA_INPUT_OVERFLOW, PA_CONTINUE = 0x2, 0  # pyaudio.paInputOverflow / pyaudio.paContinue
+RESAMPLER_ZERO_CROSSINGS = int(os.getenv("RESAMPLER_ZERO_CROSSINGS", "10"))  # 滤波器半长(过零点数)，越大越陡峭越耗CPU
+CAPTURE_MODE = os.getenv("CAPTURE_MODE", "vad").lower()  # vad=按停顿切分 | fixed=旧版定长切分
+VAD_FRAME_MS = int(os.getenv("VAD_FRAME_MS", "30"))
+VAD_SILENCE_MS = int(os.getenv("VAD_SILENCE_MS", "600"))  # 静音持续多久算一句话结束
+VAD_MIN_SPEECH_MS = int(os.getenv("VAD_MIN_SPEECH_MS", "250"))  # 短于此的“语音”视为噪声丢弃
+VAD_PRE_ROLL_MS = int(os.getenv("VAD_PRE_ROLL_MS", "300"))  # 保留起音前的一小段，避免吞掉首字
+VAD_MAX_SEGMENT_SECONDS = float(os.getenv("VAD_MAX_SEGMENT_SECONDS", "8"))
+VAD_OVERLAP_MS = int(os.getenv("VAD_OVERLAP_MS", "1000"))  # 强制切断时相邻两段的重叠长度
+VAD_THRESHOLD_RATIO = float(os.getenv("VAD_THRESHOLD_RATIO", "3.0"))  # 能量高于底噪多少倍算语音
+VAD_MIN_RMS = float(os.getenv("VAD_MIN_RMS", "300"))  # int16 幅度下的绝对最低门限
+VAD_NOISE_FLOOR_CAP = float(os.getenv("VAD_NOISE_FLOOR_CAP", "2"))  # 底噪最多升到 VAD_MIN_RMS 的几倍
+
+
+def frame_samples(sample_rate, frame_ms=VAD_FRAME_MS):
+    """一帧对应的采样点数。"""
+    return max(1, int(sample_rate * frame_ms / 1000))
+
+
+def frame_rms(frame):
+    """计算一帧音频的均方根能量，统一按int16幅度计 (float32输入视为已归一化到[-1, 1])。"""
+    if frame.size == 0: return 0.0
+    samples = frame.astype(np.float32, copy=False)
+    rms = float(np.sqrt(np.mean(samples * samples)))
+    return rms if frame.dtype == np.int16 else rms * 32768.0
+
+
+def int16_to_float32(frame, out=None):
+    """int16 PCM -> 归一化的float32，一步完成，不经过float64中间数组；可传入预分配的 out 复用内存。"""
+    if out is not None: out = out[:len(frame)]
+    return np.multiply(frame, np.float32(1.0 / 32768.0), out=out, dtype=np.float32)
+
+
+_FILTER_CACHE = {}
+
+
+def polyphase_filter(up, down, zero_crossings=RESAMPLER_ZERO_CROSSINGS):
+    """为 up/down 重采样设计凯泽窗低通滤波器并拆成多相形式，结果按参数缓存。
+
+    返回形状为 (up, taps_per_phase) 的 float32 数组，第 p 行是第 p 个相位的系数。
+    """
+    key = (up, down, zero_crossings)
+    if key not in _FILTER_CACHE:
+        cutoff = 0.5 / max(up, down)  # 以上采样后的采样率为基准的归一化截止频率
+        taps_per_phase = int(np.ceil(2 * zero_crossings * max(up, down) / up))
+        length = taps_per_phase * up
+        n = np.arange(length) - (length - 1) / 2.0
+        h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, 8.0) * up
+        # h[p + j*up] 归入第 p 相的第 j 个抽头
+        _FILTER_CACHE[key] = np.ascontiguousarray(h.reshape(taps_per_phase, up).T, dtype=np.float32)
+    return _FILTER_CACHE[key]
+
+
+class PolyphaseResampler:
+    """带状态的流式多相重采样器：逐帧喂入float32音频，帧与帧之间保留滤波器历史，输出连续无拼接痕迹。"""
+
+    def __init__(self, in_rate, out_rate=TARGET_RATE):
+        ratio = Fraction(out_rate, in_rate)
+        self.up, self.down = ratio.numerator, ratio.denominator
+        phases = polyphase_filter(self.up, self.down)
+        self.taps = phases.shape[1]
+        # 窗口按时间正序取样 x[i-taps+1 .. i]，所以系数也倒过来排：第 j 列对应 h[p + (taps-1-j)*up]
+        self.coefficients = np.ascontiguousarray(phases[:, ::-1])
+        self.offsets = np.arange(self.taps) - (self.taps - 1)
+        self.history = np.zeros(self.taps - 1, dtype=np.float32)
+        self.consumed = 0  # 已喂入的输入采样总数
+        self.produced = 0  # 已输出的采样总数
+
+    def process(self, frame):
+        """喂入一帧float32音频，返回本帧新产生的输出采样 (float32)。"""
+        if self.up == self.down: return frame
+        buffer = np.concatenate((self.history, frame))
+        base = self.consumed - (self.taps - 1)  # buffer[0] 对应的全局输入下标
+        self.consumed += len(frame)
+        end = -(-self.consumed * self.up // self.down)  # 当前输入足以计算的输出下标上限
+        n = np.arange(self.produced, end, dtype=np.int64)
+        self.produced = end
+        self.history = buffer[len(buffer) - (self.taps - 1):]
+        if n.size == 0: return np.zeros(0, dtype=np.float32)
+        position = n * self.down
+        newest = position // self.up - base  # 每个输出对应的最新输入在buffer中的位置
+        windows = buffer[newest[:, None] + self.offsets[None, :]]
+        return np.einsum("ij,ij->i", windows, self.coefficients[position % self.up]).astype(np.float32, copy=False)
+
+
+class VadSegmenter:
+    """基于能量的语音切分器：逐帧喂入音频，在自然停顿处(或达到最长时长时)切出一整句。
+
+    切分器本身不保存音频，只记录位置：每帧连同它在环形缓冲区中的结束位置一起喂入，
+    切出的语段以 (起点, 终点, 是否承接上一段) 返回，由调用方从缓冲区中取出零拷贝视图。
+    因达到最长时长而被强制切断时，下一段会回退 overlap 重叠一小段，避免边界上的字词被切掉；
+    这类语段标记为“承接上一段”，由识别级去掉重复的开头。
+    """
+
+    def __init__(self, sample_rate=TARGET_RATE, mode=CAPTURE_MODE, silence_ms=VAD_SILENCE_MS, min_speech_ms=VAD_MIN_SPEECH_MS,
+                 pre_roll_ms=VAD_PRE_ROLL_MS, max_segment_s=VAD_MAX_SEGMENT_SECONDS, overlap_ms=VAD_OVERLAP_MS):
+        self.sample_rate = sample_rate
+        self.mode = mode
+        self.silence_samples = int(sample_rate * silence_ms / 1000)
+        self.min_speech_samples = int(sample_rate * min_speech_ms / 1000)
+        self.pre_roll_samples = int(sample_rate * pre_roll_ms / 1000)
+        self.overlap_ms = overlap_ms
+        self.set_max_seconds(max_segment_s)
+        self.noise_floor = VAD_MIN_RMS / VAD_THRESHOLD_RATIO
+        self.start = None  # 当前语段起点；None 表示尚未开始
+        self.continued = False  # 当前语段是否承接上一段 (开头与上一段重叠)
+        self.last_end = 0  # 上一语段终点，预卷不会越过它，避免两段重叠
+        self.speech_samples, self.silence_run = 0, 0
+
+    @property
+    def max_seconds(self):
+        return self.max_samples / self.sample_rate
+
+    def set_max_seconds(self, seconds):
+        """调整单段最长时长 (定长模式下即每段的长度)；从下一帧起生效。"""
+        self.max_samples = int(self.sample_rate * seconds)
+        self.overlap_samples = min(int(self.sample_rate * self.overlap_ms / 1000), self.max_samples // 2)
+
+    def is_speech(self, frame):
+        rms = frame_rms(frame)
+        speech = rms > max(VAD_MIN_RMS, self.noise_floor * VAD_THRESHOLD_RATIO)
+        # 底噪自适应：静音帧快速跟随，语音帧极慢跟随，防止环境变吵后永远判为“有人说话”；
+        # 设上限，否则连续十几秒的大声说话会把底噪抬到语音本身的水平，后面的话全被当成静音丢掉
+        alpha = 0.001 if speech else 0.05
+        self.noise_floor = min((1 - alpha) * self.noise_floor + alpha * rms, VAD_MIN_RMS * VAD_NOISE_FLOOR_CAP)
+        return speech
+
+    def feed(self, frame, end):
+        """喂入一帧音频及其结束位置，返回因本帧而完成的语段 [(起点, 终点, 是否承接), ...] (大多数时候为空)。"""
+        frame_start = end - len(frame)
+        if self.mode == "fixed":
+            if self.start is None: self.start = frame_start
+            return [self._cut(end)] if end - self.start >= self.max_samples else []
+        speech = self.is_speech(frame)
+        if self.start is None:
+            if not speech: return []
+            self.start = max(frame_start - self.pre_roll_samples, self.last_end, 0)
+        if speech: self.speech_samples += len(frame); self.silence_run = 0
+        else: self.silence_run += len(frame)
+        if self.silence_run >= self.silence_samples: segment = self._emit(end)
+        elif end - self.start >= self.max_samples: segment = self._cut(end)
+        else: return []
+        return [segment] if segment is not None else []
+
+    def flush(self, end):
+        """停止采集时取出尚未结束的最后一句 (可能为None)。"""
+        return self._emit(end) if self.start is not None else None
+
+    def _cut(self, end):
+        """说话仍在继续但已达最长时长：切出当前段，下一段从 end - overlap 处接着开始。"""
+        segment = (self.start, end, self.continued) if self.mode == "fixed" or self.speech_samples >= self.min_speech_samples else None
+        self.start, self.continued, self.speech_samples = end - self.overlap_samples, segment is not None, 0
+        return segment
+
+    def _emit(self, end):
+        start, continued, speech_samples = self.start, self.continued, self.speech_samples
+        self.start, self.continued, self.speech_samples, self.silence_run, self.last_end = None, False, 0, 0, end
+        if self.mode != "fixed" and speech_samples < self.min_speech_samples: return None
+        return start, end, continued
+
+
+class AudioRingBuffer:
+    """预分配的环形缓冲区。每个采样镜像写入两份，因此任意不超过容量的区间都能以连续视图零拷贝读出。
+
+    位置是单调递增的累计采样数；写入方超过读取方一整圈后，旧区间即失效 (view 返回 None)。
+    """
+
+    def __init__(self, capacity, dtype=np.float32):
+        self.capacity = int(capacity)
+        self.data = np.zeros(self.capacity * 2, dtype=dtype)
+        self.written = 0
+        self.cond = threading.Condition()
+
+    def write(self, samples):
+        n = len(samples)
+        if n > self.capacity: self.written += n - self.capacity; samples = samples[-self.capacity:]; n = self.capacity
+        pos, cap = self.written % self.capacity, self.capacity
+        first = min(n, cap - pos)
+        self.data[pos:pos + first] = samples[:first]; self.data[pos + cap:pos + cap + first] = samples[:first]
+        if first < n:
+            rest = n - first
+            self.data[:rest] = samples[first:]; self.data[cap:cap + rest] = samples[first:]
+        with self.cond:
+            self.written += n; self.cond.notify_all()
+        return self.written
+
+    def is_valid(self, start):
+        return start >= self.written - self.capacity
+
+    def view(self, start, end):
+        """返回 [start, end) 区间的只读连续视图；区间已被覆盖或尚未写入时返回 None。"""
+        if not self.is_valid(start) or end > self.written or end - start > self.capacity: return None
+        pos = start % self.capacity
+        view = self.data[pos:pos + (end - start)]
+        view.flags.writeable = False
+        return view
+
+    def wait_for(self, position, timeout=None):
+        """阻塞直到累计写入量达到 position，超时返回 False。"""
+        with self.cond:
+            return self.cond.wait_for(lambda: self.written >= position, timeout)
+
+
+class CallbackCapture:
+    """PyAudio 回调模式采集：驱动线程把 int16 直接写进预分配的环形缓冲区，采集线程按帧取走视图。
+
+    接口兼容原来的 stream 用法 (stop_stream / close)，额外提供 read_frame(n)。
+    """
+
+    def __init__(self, sample_rate, channels=1, seconds=RAW_RING_SECONDS):
+        self.sample_rate, self.channels = sample_rate, channels
+        self.ring = AudioRingBuffer(sample_rate * seconds, dtype=np.int16)
+        self.read_pos = 0
+        self.overflows = 0  # 驱动报告的输入溢出次数
+        self.overruns = 0  # 采集线程读得太慢、被写入方追上而跳过的次数
+        self.stream = None
+
+    def callback(self, in_data, frame_count, time_info, status):
+        if status & PA_INPUT_OVERFLOW: self.overflows += 1
+        samples = np.frombuffer(in_data, dtype=np.int16)
+        self.ring.write(samples[::self.channels] if self.channels > 1 else samples)
+        return (None, PA_CONTINUE)
+
+    def read_frame(self, n, timeout=STREAM_STALL_SECONDS):
+        """取出下一帧 n 个采样 (int16 只读视图)。超时仍无数据说明音频流已中断，抛出IOError。"""
+        if not self.ring.wait_for(self.read_pos + n, timeout):
+            raise IOError(STREAM_STALLED_ERRNO, "音频流长时间没有数据")
+        if not self.ring.is_valid(self.read_pos):
+            self.overruns += 1; self.read_pos = self.ring.written - n
+        frame = self.ring.view(self.read_pos, self.read_pos + n)
+        self.read_pos += n
+        return frame
+
+    def stop_stream(self):
+        if self.stream is not None: self.stream.stop_stream()
+
+    def close(self):
+        if self.stream is not None: self.stream.close()
+
+
+def open_callback_stream(p_instance, dev_index, rates, channels=1):
+    """按 rates 顺序尝试以回调模式打开输入设备，返回 (CallbackCapture, 采样率)，全部失败返回 (None, None)。"""
+    import pyaudio
+    for rate in dict.fromkeys(rates):
+        capture = CallbackCapture(rate, channels)
+        try:
+            capture.stream = p_instance.open(format=pyaudio.paInt16, channels=channels, rate=rate, input=True, input_device_index=dev_index,
+                                             frames_per_buffer=1024, stream_callback=capture.callback)
+            print(f"[日志] 音频流以 {rate}Hz 成功开启 (回调模式)。")
+            return capture, rate
+        except Exception: continue
+    return None, None
+
+
+class CaptureHost:
+    """PyAudio 实例及其上打开的采集流。open_fn(p_instance, dev_index) -> (CallbackCapture, 采样率) 即入口脚本的 open_resilient_stream。
+
+    PortAudio 只在初始化时枚举设备，reopen() 在没有其他流在用时会重新初始化，才能看到重新插上的设备；
+    设备按名称重新查找 (USB设备重新插入后索引可能变化)，找不到时沿用原来的索引。
+    """
+
+    def __init__(self, pyaudio_module, open_fn):
+        self.pyaudio, self.open_fn = pyaudio_module, open_fn
+        self.p = pyaudio_module.PyAudio()
+        self.captures = []  # 在用的 CallbackCapture
+        self.lock = threading.Lock()
+
+    def open(self, dev_index, name=None):
+        """打开输入设备，返回 (CallbackCapture, 采样率)，失败返回 (None, None)。"""
+        with self.lock: return self._open(dev_index, name)
+
+    def _open(self, dev_index, name):
+        index = self.find_input_device(name, dev_index)
+        capture, rate = self.open_fn(self.p, index)
+        if capture is not None:
+            capture.device_index, capture.device_name = index, name or self.device_name(index)
+            self.captures.append(capture)
+        return capture, rate
+
+    def reopen(self, capture):
+        """关闭已中断的流并重新打开同一设备；设备暂时不可用时返回 (None, None)，可稍后再试。"""
+        with self.lock:
+            if capture in self.captures:
+                self.captures.remove(capture)
+                try: capture.stop_stream(); capture.close()
+                except Exception: pass  # 设备已经没了，关闭出错无所谓
+                capture.stream = None  # 会话结束时不再重复关闭
+            if not self.captures:
+                try: self.p.terminate()
+                except Exception: pass
+                self.p = self.pyaudio.PyAudio()
+            return self._open(getattr(capture, "device_index", None), getattr(capture, "device_name", None))
+
+    def device_name(self, dev_index):
+        try: return self.p.get_device_info_by_index(dev_index)["name"] if dev_index is not None else None
+        except Exception: return None
+
+    def find_input_device(self, name, dev_index):
+        if not name: return dev_index
+        try:
+            for i in range(self.p.get_device_count()):
+                info = self.p.get_device_info_by_index(i)
+                if info.get("name") == name and info.get("maxInputChannels", 0) > 0: return i
+        except Exception: pass
+        return dev_index
+
+    def terminate(self):
+        with self.lock: self.p.terminate()
+
+
+def load_audio_file(path):
+    """读取录音文件，返回 (单声道int16, 采样率)。WAV用标准库读取，FLAC等格式需要安装 soundfile。"""
+    if path.lower().endswith(".wav"):
+        with wave.open(path, "rb") as wav:
+            if wav.getsampwidth() != 2: raise ValueError(f"只支持16位PCM的WAV文件: {path}")
+            rate, channels = wav.getframerate(), wav.getnchannels()
+            pcm = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+        if channels > 1: pcm = pcm.reshape(-1, channels).mean(axis=1).astype(np.int16)
+        return pcm, rate
+    try:
+        import soundfile
+    except ImportError:
+        raise ValueError(f"读取 {os.path.splitext(path)[1]} 文件需要先 pip install soundfile: {path}")
+    pcm, rate = soundfile.read(path, dtype="int16", always_2d=True)
+    return pcm.mean(axis=1).astype(np.int16) if pcm.shape[1] > 1 else pcm[:, 0].copy(), rate
+
+
+def split_recording(pcm, sample_rate, segmenter=None):
+    """按实时采集同样的方式逐帧重采样并用VAD切分整段录音，返回 (16kHz float32音频, [(起点, 终点, 是否续接), ...])。"""
+    resampler, segmenter = PolyphaseResampler(sample_rate, TARGET_RATE), segmenter or VadSegmenter()
+    frame_len = frame_samples(sample_rate)
+    audio = np.empty(int(len(pcm) * TARGET_RATE / sample_rate) + frame_len, dtype=np.float32)
+    scratch, spans, end = np.empty(frame_len, dtype=np.float32), [], 0
+    for i in range(0, len(pcm) - frame_len + 1, frame_len):
+        frame = resampler.process(int16_to_float32(pcm[i:i + frame_len], out=scratch))
+        audio[end:end + len(frame)] = frame; end += len(frame)
+        spans += segmenter.feed(frame, end)
+    last = segmenter.flush(end)
+    if last is not None: spans.append(last)
+    return audio[:end], spans
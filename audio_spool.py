@@ -0,0 +1,131 @@
+# ==============================================================================
+#           会话音频落盘 (Session Audio Spool) v1.0
+# ==============================================================================
+# 版本说明:
+# - 【核心新增】会议模式把重采样后的16kHz float32音频顺序写入 audio_spool/ 下的内存映射文件，
+#              并在旁边的 .jsonl 索引里记录每个语段的起止位置，识别或翻译效果不好时可以事后重做。
+# - 【零拷贝】SessionSpool 与 AudioRingBuffer 接口相同，直接替代环形缓冲区交给流水线：
+#              识别级拿到的是映射文件上的视图，音频由系统页缓存管理，不占进程内存，也不会过期。
+# - 【重新转写】python audio_spool.py audio_spool/session_xxx [--model medium] [--language zh]
+#              用更大的模型按索引重新识别全部语段，结果写入 session_xxx.<模型名>.txt。
+# ==============================================================================
+import argparse
+import json
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+from dotenv import load_dotenv
+
+from audio_capture import TARGET_RATE
+
+load_dotenv()
+AUDIO_SPOOL = os.getenv("AUDIO_SPOOL", "on").lower() != "off"  # 会议模式是否保存原始音频
+SPOOL_DIR = os.getenv("SPOOL_DIR", "audio_spool")
+SPOOL_GROW_SECONDS = 600  # 映射文件每次扩容的时长
+
+
+class SessionSpool:
+    """一次会话的音频落盘文件 (float32 内存映射) 和语段索引。位置为累计采样数，与 AudioRingBuffer 一致。"""
+
+    def __init__(self, base_path, sample_rate=TARGET_RATE, start_time=None):
+        self.base_path, self.sample_rate = base_path, sample_rate
+        self.data_path, self.index_path = base_path + ".f32", base_path + ".jsonl"
+        self.grow_samples = SPOOL_GROW_SECONDS * sample_rate
+        self.capacity, self.written = self.grow_samples, 0
+        self.data = np.memmap(self.data_path, dtype=np.float32, mode="w+", shape=(self.capacity,))
+        self.lock = threading.Lock()
+        self.index = open(self.index_path, "w", encoding="utf-8")
+        self._index_write({"type": "session", "start": (start_time or datetime.now()).isoformat(), "sample_rate": sample_rate, "dtype": "float32"})
+
+    @classmethod
+    def create(cls, directory=SPOOL_DIR, start_time=None, suffix=""):
+        """新建一份会话音频；同时采集多路时用 suffix 区分 (如设备索引)。"""
+        os.makedirs(directory, exist_ok=True)
+        start_time = start_time or datetime.now()
+        name = f"session_{start_time.strftime('%Y-%m-%d_%H-%M-%S')}{f'_{suffix}' if suffix else ''}"
+        spool = cls(os.path.join(directory, name), start_time=start_time)
+        print(f"[日志] 本次会话的音频将保存到: {spool.data_path}")
+        return spool
+
+    def _index_write(self, record):
+        self.index.write(json.dumps(record, ensure_ascii=False) + "\n"); self.index.flush()
+
+    def write(self, samples):
+        n = len(samples)
+        with self.lock:
+            if self.written + n > self.capacity:
+                # 扩容：重新映射更大的文件；之前发出的视图仍指向同一文件，继续有效
+                self.data.flush()
+                self.capacity = max(self.written + n, self.capacity + self.grow_samples)
+                self.data = np.memmap(self.data_path, dtype=np.float32, mode="r+", shape=(self.capacity,))
+            self.data[self.written:self.written + n] = samples
+            self.written += n
+            return self.written
+
+    def is_valid(self, start):
+        return start >= 0  # 落盘的音频不会被覆盖
+
+    def view(self, start, end):
+        """返回 [start, end) 区间的只读视图 (直接映射文件，不复制)；尚未写入时返回 None。"""
+        if start < 0 or end > self.written: return None
+        view = self.data[start:end]
+        view.flags.writeable = False
+        return view
+
+    def index_segment(self, segment_id, start, end, continued):
+        self._index_write({"type": "segment", "id": segment_id, "start": start, "end": end, "continued": continued})
+
+    def close(self):
+        """截掉预分配但未写入的部分。"""
+        with self.lock:
+            self.data.flush(); self.data = None
+            self.index.close()
+            try: os.truncate(self.data_path, self.written * np.dtype(np.float32).itemsize)
+            except OSError as e: print(f"[警告] 会话音频文件未能截短 (仍有语段在使用): {e}")
+        print(f"[日志] 会话音频已保存: {self.data_path} ({self.written / self.sample_rate / 60:.1f} 分钟)")
+
+
+def open_spool(base_path):
+    """只读打开一份已保存的会话，返回 (会话信息, 音频内存映射, 语段列表)。"""
+    header, segments = None, []
+    with open(base_path + ".jsonl", encoding="utf-8") as f:
+        for line in f:
+            try: record = json.loads(line)
+            except json.JSONDecodeError: continue
+            if record.get("type") == "session": header = record
+            elif record.get("type") == "segment": segments.append(record)
+    has_audio = os.path.getsize(base_path + ".f32") > 0
+    audio = np.memmap(base_path + ".f32", dtype=np.float32, mode="r") if has_audio else np.zeros(0, dtype=np.float32)
+    return header, audio, [s for s in segments if s["end"] <= len(audio)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用保存的会话音频重新转写")
+    parser.add_argument("session", help="会话路径 (不带扩展名)，如 audio_spool/session_2025-07-17_12-02-46")
+    parser.add_argument("--model", default="medium", help="Whisper模型名")
+    parser.add_argument("--language", default=None, help="指定语言 (如 zh/en)，默认每段自动检测")
+    args = parser.parse_args()
+    import whisper
+    from pipeline import stitch_overlap
+    session = args.session[:-len(".f32")] if args.session.endswith(".f32") else args.session
+    header, audio, segments = open_spool(session)
+    print(f"[日志] 共 {len(segments)} 段，正在加载模型 '{args.model}' ...")
+    model = whisper.load_model(args.model)
+    output = f"{session}.{args.model}.txt"
+    last_text = ""
+    with open(output, "w", encoding="utf-8") as f:
+        for i, segment in enumerate(segments, 1):
+            result = model.transcribe(audio[segment["start"]:segment["end"]], fp16=False, language=args.language)
+            raw_text = result["text"].strip()
+            text = stitch_overlap(last_text, raw_text) if segment["continued"] else raw_text
+            last_text = raw_text
+            offset = int(segment["start"] / header["sample_rate"])
+            if text: f.write(f"[+{offset // 3600:02d}:{offset % 3600 // 60:02d}:{offset % 60:02d}] {text}\n")
+            print(f"  > 重新识别中... ({i}/{len(segments)})")
+    print(f"[日志] 重新转写完成: {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+# ==============================================================================
+#           识别追赶与背压 (ASR Backpressure Controller) v1.1
+# ==============================================================================
+# 版本说明:
+# - 【核心新增】持续测量识别实时率 (识别耗时 / 音频时长，滑动平均)。CPU较慢、识别跟不上实时时，
+#              按 ASR_BACKPRESSURE 配置的策略自动追赶，字幕落后的时间始终有上限，不会越积越多：
+#   · chunk : (默认不启用) 实时率偏高、且主要是每次调用的固定开销造成的时，逐步加长单段最长时长
+#             (摊薄固定开销)，有富余后逐步缩回原来的长度。代价是每句字幕都更晚出现，见下方 v1.1 的压测数据。
+#   · merge : 跟不上时 (实时率偏高或积压过久)，识别队列里积压的多个语段合并成一次识别 (合并后不超过 ASR_MERGE_MAX_SECONDS)。
+#   · drop  : 已落后超过 ASR_MAX_LAG_SECONDS 的积压语段直接丢弃 (始终保留最新一段)，字幕跳回当前。
+#   · model : 分段已加长到上限 (或加长分段无济于事) 仍跟不上时，在后台加载 ASR_FALLBACK_MODEL 指定的
+#             更小模型并换用它 (多路采集时各流水线共用同一个 SharedFallback，只加载一次)。
+# - 【可配置】ASR_BACKPRESSURE=merge,drop (逗号分隔，可加 chunk/model，off=关闭)，阈值见下方配置。
+# - 【v1.1 修正】加长分段会推迟每一句字幕，默认策略去掉了 chunk；启用时也只在能帮上忙时才加长：按最近各段的
+#              (音频时长, 识别耗时) 拟合“识别耗时 = 固定开销 + 每秒音频的耗时 × 时长”，每秒音频的耗时本身
+#              低于 ASR_RTF_HIGH (即慢在固定开销上) 才加长；否则分段再长也追不上，加长过的还会缩回。
+#              回放压测 (bench_replay.py 按实时速度回放 300 秒连续长句录音，单段上限 8 秒，用按时长计耗时的假模型)：
+#                固定开销 3 秒 + 每秒 0.6 秒：merge,drop      端到端 p50 13.6s / p95 16.4s
+#                                            chunk,merge,drop 端到端 p50 19.6s / p95 31.7s (分段加长到 20 秒)
+#                                            drop             端到端 p50 17.8s / p95 23.7s (丢弃 3 段)
+#                                            chunk,drop       端到端 p50 20.3s / p95 28.4s (不丢段)
+#                固定开销 0.1 秒 + 每秒 1.1 秒：加长分段实时率仍在 1.1 左右，只是多了延迟，现在不再加长。
+#              也就是说固定开销由 merge 在真正积压时合并识别来摊薄更好；chunk 只适合宁可晚也不愿丢段的场合。
+#              启用了 model 策略却没有设置 ASR_FALLBACK_MODEL 时，启动时提示一次 (之前是悄悄忽略)。
+# ==============================================================================
+import os
+import threading
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+
+load_dotenv()
+ASR_BACKPRESSURE = os.getenv("ASR_BACKPRESSURE", "merge,drop").lower()
+ASR_MAX_LAG_SECONDS = float(os.getenv("ASR_MAX_LAG_SECONDS", "15"))  # 积压语段最多落后多久，超过就丢弃
+ASR_RTF_HIGH = float(os.getenv("ASR_RTF_HIGH", "0.9"))  # 实时率高于此值：快跟不上了
+ASR_RTF_LOW = float(os.getenv("ASR_RTF_LOW", "0.5"))  # 实时率低于此值：有富余
+ASR_CHUNK_MAX_SECONDS = float(os.getenv("ASR_CHUNK_MAX_SECONDS", "20"))  # 加长分段的上限
+ASR_CHUNK_STEP_SECONDS = 2.0
+ASR_MERGE_MAX_SECONDS = 30.0  # Whisper 一次最多处理30秒音频
+ASR_FALLBACK_MODEL = os.getenv("ASR_FALLBACK_MODEL", "")  # 如 tiny；留空则不换模型
+RTF_SMOOTHING = 0.3  # 实时率滑动平均中最新一段的权重
+COST_SAMPLES = 20  # 拟合识别开销时使用最近多少段
+COST_MIN_SPREAD_SECONDS = 1.0  # 各段时长相差太小时无法区分固定开销和按时长的开销
+BACKPRESSURE_ACTIONS = ("chunk", "merge", "drop", "model")
+
+
+class SharedFallback:
+    """备用的更小模型：第一次需要时在后台加载，之后所有共用它的流水线都换用它。"""
+
+    def __init__(self, load_model=None, name=ASR_FALLBACK_MODEL):
+        self.load_model, self.name = load_model, name
+        self.model, self.loading, self.warned = None, False, False
+        self.lock = threading.Lock()
+
+    @property
+    def available(self):
+        return bool(self.load_model and self.name)
+
+    def warn_unavailable(self):
+        """启用了 model 策略但无法换模型：只提示一次 (多条流水线共用同一个 SharedFallback)。"""
+        with self.lock:
+            if self.warned: return
+            self.warned = True
+        print("[警告] 背压策略包含 model，但未设置 ASR_FALLBACK_MODEL (如 tiny)，识别跟不上时不会换用更小的模型。")
+
+    def request(self, rtf):
+        """开始在后台加载 (已加载或正在加载时什么也不做)。"""
+        with self.lock:
+            if self.model is not None or self.loading: return
+            self.loading = True
+        print(f"[背压] 识别实时率 {rtf:.2f} 仍跟不上，后台加载更小的模型 '{self.name}'...")
+        threading.Thread(target=self._load, name="加载备用模型", daemon=True).start()
+
+    def _load(self):
+        try:
+            self.model = self.load_model(self.name)
+            print(f"[背压] 已换用模型 '{self.name}'。")
+        except Exception as e: print(f"[错误] 加载备用模型失败，继续使用原模型: {e}")
+
+
+class BackpressureController:
+    """一条流水线的识别背压控制：识别级每识别完一段调用 observe()，取到积压语段时调用 plan()。
+
+    segmenter 为该流水线的 VadSegmenter；load_model(name) 用于加载更小的模型 (如 asr_server.get_asr_model)，
+    多条流水线应传入同一个 fallback (SharedFallback)，备用模型只加载一份。转写函数通过 model(原模型) 取得当前应使用的模型。
+    """
+
+    def __init__(self, segmenter, policy=ASR_BACKPRESSURE, max_lag=ASR_MAX_LAG_SECONDS, load_model=None, fallback_model=ASR_FALLBACK_MODEL, fallback=None):
+        actions = {a.strip() for a in policy.split(",")} if policy != "off" else set()
+        for action in actions - set(BACKPRESSURE_ACTIONS): print(f"[警告] 未知的背压策略 '{action}'，已忽略。")
+        self.actions = actions & set(BACKPRESSURE_ACTIONS)
+        self.fallback = fallback if fallback is not None else SharedFallback(load_model, fallback_model)
+        if "model" in self.actions and not self.fallback.available: self.actions.discard("model"); self.fallback.warn_unavailable()
+        self.segmenter, self.max_lag = segmenter, max_lag
+        self.base_seconds = segmenter.max_seconds
+        self.rtf, self.lag = None, 0.0
+        self.measured_model = None  # 实时率是用哪个模型测出来的，换模型后重新测量
+        self.samples = deque(maxlen=COST_SAMPLES)  # 最近各段的 (音频时长, 识别耗时)
+        self.stale_segments = self.merged_segments = 0
+        self.lock = threading.Lock()
+
+    def observe(self, segment, asr_seconds):
+        """记录一段的识别耗时，更新实时率并按需调整。"""
+        audio_seconds = (segment["end"] - segment["start"]) / self.segmenter.sample_rate
+        if audio_seconds <= 0: return
+        with self.lock:
+            if self.measured_model is not self.fallback.model:  # 换模型后重新测量
+                self.rtf, self.measured_model = None, self.fallback.model; self.samples.clear()
+            self.samples.append((audio_seconds, asr_seconds))
+            per_second = self._per_second_cost()
+            rtf = asr_seconds / audio_seconds
+            self.rtf = rtf = rtf if self.rtf is None else (1 - RTF_SMOOTHING) * self.rtf + RTF_SMOOTHING * rtf
+            self.lag = time.time() - segment["captured_at"]
+        if "chunk" in self.actions: self._adapt_chunk(rtf, per_second)
+        if "model" in self.actions: self._maybe_downgrade(rtf, per_second)
+
+    def _per_second_cost(self):
+        """最小二乘拟合 识别耗时 = 固定开销 + k × 音频时长，返回 k (每秒音频的识别耗时)；样本不足时返回 None。"""
+        if len(self.samples) < 4: return None
+        n = len(self.samples)
+        mean_x = sum(x for x, _ in self.samples) / n
+        mean_y = sum(y for _, y in self.samples) / n
+        spread = sum((x - mean_x) ** 2 for x, _ in self.samples)
+        if spread < COST_MIN_SPREAD_SECONDS ** 2 * n / 4: return None  # 各段一样长，分不出固定开销
+        return max(0.0, sum((x - mean_x) * (y - mean_y) for x, y in self.samples) / spread)
+
+    @staticmethod
+    def _chunk_helps(per_second):
+        """加长分段能否把实时率降到 ASR_RTF_HIGH 以下：只有慢在每次调用的固定开销上时才能。"""
+        return per_second is not None and per_second < ASR_RTF_HIGH
+
+    def _adapt_chunk(self, rtf, per_second=None):
+        current = self.segmenter.max_seconds
+        if rtf > ASR_RTF_HIGH and current < ASR_CHUNK_MAX_SECONDS and self._chunk_helps(per_second):
+            seconds = min(ASR_CHUNK_MAX_SECONDS, current + ASR_CHUNK_STEP_SECONDS)
+        elif current > self.base_seconds and (rtf < ASR_RTF_LOW or (rtf > ASR_RTF_HIGH and not self._chunk_helps(per_second))):
+            seconds = max(self.base_seconds, current - ASR_CHUNK_STEP_SECONDS)  # 有富余，或加长已无济于事：缩回以降低延迟
+        else: return
+        self.segmenter.set_max_seconds(seconds)
+        print(f"[背压] 识别实时率 {rtf:.2f}，单段最长时长调整为 {seconds:.0f} 秒。")
+
+    def _maybe_downgrade(self, rtf, per_second=None):
+        at_limit = "chunk" not in self.actions or self.segmenter.max_seconds >= ASR_CHUNK_MAX_SECONDS or \
+            (per_second is not None and not self._chunk_helps(per_second))
+        if rtf > ASR_RTF_HIGH and at_limit: self.fallback.request(rtf)
+
+    def model(self, current):
+        return self.fallback.model if self.fallback.model is not None else current
+
+    def plan(self, segments):
+        """积压的语段 (按采集顺序) -> 要识别的分组列表：丢弃过期的；确实跟不上时把相邻的合并成一组。"""
+        now = time.time()
+        with self.lock: rtf = self.rtf
+        # 识别跟得上时积压只是暂时的，合并反而增加延迟，也会让被合并语段的延迟追踪丢失
+        behind = (rtf is not None and rtf > ASR_RTF_HIGH) or now - segments[0]["captured_at"] > self.max_lag
+        if "drop" in self.actions:
+            kept = [s for s in segments[:-1] if now - s["captured_at"] <= self.max_lag] + segments[-1:]
+            if len(kept) < len(segments):
+                self.stale_segments += len(segments) - len(kept)
+                print(f"[背压] 丢弃落后超过 {self.max_lag:.0f} 秒的语段 {len(segments) - len(kept)} 段 (累计 {self.stale_segments} 段)。")
+            segments = kept
+        if "merge" not in self.actions or not behind: return [[s] for s in segments]
+        groups, limit = [], ASR_MERGE_MAX_SECONDS * self.segmenter.sample_rate
+        for segment in segments:
+            if groups and segment["end"] - groups[-1][0]["start"] <= limit: groups[-1].append(segment); self.merged_segments += 1
+            else: groups.append([segment])
+        return groups
+
+    def stats_line(self):
+        rtf = f"{self.rtf:.2f}" if self.rtf is not None else "-"
+        model = f", 已换用模型 '{self.fallback.name}'" if self.fallback.model is not None else ""
+        return (f"[背压] 识别实时率 {rtf}, 最近落后 {self.lag:.1f} 秒, 单段最长 {self.segmenter.max_seconds:.0f} 秒, "
+                f"丢弃过期 {self.stale_segments} 段, 合并 {self.merged_segments} 段{model}")
@@ -0,0 +1,199 @@
+# ==============================================================================
+#           离线批量转写 (Offline Batch Transcription) v1.0
+# ==============================================================================
+# 说明:
+# - 处理已经录好的音频：接受 WAV/FLAC 文件或目录 (递归查找)，按实时字幕相同的VAD规则切成语段，
+#   分发给进程池并行识别 (每个进程各加载一份Whisper模型，每进程线程数可调)，充分利用所有CPU核心。
+# - 输出与会议模式相同：逐段写入会议日志 (JSONL)，中英互译，AI会议纪要 + 完整逐字稿的 meeting_log_*.txt。
+# - 每个文件和整批结束时打印处理速度 (几倍实时)。
+# - 单个文件出错 (包括识别进程崩溃) 只记为该文件失败，其余文件照常处理；进程池坏掉时自动重建，
+#   最后列出失败的文件。
+# - 用法: python batch_transcribe.py 录音目录或文件... [--model base] [--workers N] [--threads 2]
+#                                  [--language zh] [--no-translate] [--output-dir batch_output]
+# ==============================================================================
+import argparse
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+from audio_capture import TARGET_RATE, load_audio_file, split_recording
+from meeting_journal import MeetingJournal
+from pipeline import GATE_MIN_RMS, segment_rms, speech_segments, stitch_overlap
+from translation import TRANSLATE_FAILED
+
+load_dotenv()
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+AUDIO_EXTENSIONS = (".wav", ".flac")
+FILES_IN_FLIGHT = 2  # 同时在进程池里排队的文件数，控制父进程内存
+
+_worker_model = None
+
+
+def _init_worker(model_name, threads):
+    """进程池初始化：每个工作进程只加载一次模型，并限制它使用的线程数。"""
+    global _worker_model
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError: pass
+    import whisper
+    _worker_model = whisper.load_model(model_name)
+
+
+def _transcribe(audio, language):
+    result = _worker_model.transcribe(audio, fp16=False, language=language)
+    return {"text": result["text"].strip(), "language": result.get("language", language or "en"), "asr_segments": result.get("segments", [])}
+
+
+def find_audio_files(inputs):
+    files = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for folder, _, names in os.walk(path):
+                files += [os.path.join(folder, n) for n in sorted(names) if n.lower().endswith(AUDIO_EXTENSIONS)]
+        elif path.lower().endswith(AUDIO_EXTENSIONS): files.append(path)
+        else: print(f"[警告] 跳过不支持的文件: {path}")
+    return files
+
+
+def output_names(files):
+    """每个文件的输出名：默认取文件名；不同目录下有同名文件时加上所在目录名和序号，输出不会互相覆盖。"""
+    bases = [os.path.splitext(os.path.basename(path))[0] for path in files]
+    counts = Counter(bases)
+    return [base if counts[base] == 1 else f"{os.path.basename(os.path.dirname(os.path.abspath(path)))}_{base}_{i + 1}"
+            for i, (path, base) in enumerate(zip(files, bases))]
+
+
+def submit_file(executor, path, name, language):
+    """读入并切分一个文件，把全部语段提交给进程池，返回 (文件信息, [(语段, Future或None), ...])。"""
+    audio, spans = split_recording(*load_audio_file(path))
+    duration = len(audio) / TARGET_RATE
+    start_time = datetime.fromtimestamp(os.path.getmtime(path)) - timedelta(seconds=duration)  # 文件修改时间约等于录音结束时间
+    jobs = []
+    for start, end, continued in spans:
+        segment = {"start": start, "end": end, "continued": continued}
+        chunk = audio[start:end]
+        # 静音闸门与实时模式一致：音量过低的语段不送识别
+        jobs.append((segment, executor.submit(_transcribe, chunk, language) if segment_rms(chunk) >= GATE_MIN_RMS else None))
+    return {"path": path, "name": name, "duration": duration, "start_time": start_time, "submitted_at": time.time()}, jobs
+
+
+def collect_segments(jobs):
+    """按时间顺序取回识别结果：过滤噪声片段，并去掉被强制切断的长句与上一段重叠的部分。"""
+    segments, last_raw = [], ""
+    for segment, future in jobs:
+        if future is None: continue
+        segment.update(future.result())
+        asr_segments = segment.pop("asr_segments")
+        kept = speech_segments(asr_segments)
+        raw_text = segment["text"] if len(kept) == len(asr_segments) else "".join(s["text"] for s in kept).strip()
+        segment["text"] = stitch_overlap(last_raw, raw_text) if segment["continued"] else raw_text
+        last_raw = raw_text
+        if segment["text"]: segments.append(segment)
+    return segments
+
+
+def translate(translator, segments):
+    """把语段按批量提交给异步翻译服务，并发翻译后按顺序等待。"""
+    batches = [segments[i:i + translator.max_batch] for i in range(0, len(segments), translator.max_batch)]
+    for future in [translator.submit(batch) for batch in batches]: future.result()
+
+
+def write_outputs(info, segments, journal_dir, summarizer):
+    name = info["name"]
+    journal = MeetingJournal.create(os.path.join(journal_dir, f"{name}.jsonl"), info["start_time"])
+    for segment in segments:
+        if segment.get("translation") == TRANSLATE_FAILED: continue  # 与会议模式一致：翻译失败的语段不记入纪要
+        journal.append(segment, at=info["start_time"] + timedelta(seconds=segment["start"] / TARGET_RATE))
+    ai_summary = "未生成AI摘要 (未配置Gemini或已关闭翻译)。"
+    if summarizer and journal.segment_count:
+        try: ai_summary = summarizer.summarize(journal.iter_transcript())
+        except Exception as e: print(f"[错误] 生成AI摘要失败: {e}"); ai_summary = "AI摘要生成失败。"
+    filename = os.path.join(journal_dir, f"meeting_log_{info['start_time'].strftime('%Y-%m-%d_%H-%M-%S')}_{name}.txt")
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(f"===== AI 会议纪要 =====\n\n--- AI 分析摘要 ---\n{ai_summary}\n\n--- 完整逐字稿 ---\n"); journal.write_transcript(f)
+    journal.mark_archived(); journal.close()
+    return filename
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线批量转写录音，输出与会议模式相同的纪要和日志")
+    parser.add_argument("inputs", nargs="+", help="WAV/FLAC 文件或目录")
+    parser.add_argument("--model", default="base", help="Whisper模型名")
+    parser.add_argument("--threads", type=int, default=2, help="每个工作进程使用的线程数")
+    parser.add_argument("--workers", type=int, default=0, help="工作进程数 (0=CPU核数/线程数)")
+    parser.add_argument("--language", default=None, help="指定语言 (如 zh/en)，默认每段自动检测")
+    parser.add_argument("--no-translate", action="store_true", help="只转写，不翻译也不生成AI摘要")
+    parser.add_argument("--output-dir", default="batch_output", help="输出目录")
+    args = parser.parse_args()
+    files = find_audio_files(args.inputs)
+    if not files: print("[错误] 没有找到可处理的音频文件。"); return
+    names = output_names(files)
+    workers = args.workers or max(1, (os.cpu_count() or 1) // args.threads)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    translator = summarizer = None
+    if not args.no_translate and GEMINI_API_KEY:
+        import google.generativeai as genai
+        from meeting_summary import MeetingSummarizer
+        from translation import AsyncTranslationService, SegmentTranslator
+        genai.configure(api_key=GEMINI_API_KEY); gemini_model = genai.GenerativeModel('models/gemini-2.5-flash-lite-preview-06-17')
+        target_fn = lambda segment: "English" if 'zh' in segment['language'] else "Simplified Chinese"
+        translator = AsyncTranslationService(SegmentTranslator(gemini_model, target_fn=target_fn), deadline=120)  # 离线处理不需要抢时间
+        summarizer = MeetingSummarizer(gemini_model)
+    elif not args.no_translate: print("[警告] 未配置 GEMINI_API_KEY，只转写不翻译。")
+
+    print(f"[日志] 共 {len(files)} 个文件，启动 {workers} 个识别进程 (每进程 {args.threads} 线程，模型 '{args.model}')...")
+    started, total_audio, failed = time.time(), 0.0, []
+    new_executor = lambda: ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(args.model, args.threads))
+    executor, pending = new_executor(), deque()
+
+    def submit(path, name):
+        nonlocal executor
+        try: return submit_file(executor, path, name, args.language)
+        except BrokenProcessPool:
+            executor.shutdown(wait=False, cancel_futures=True); executor = new_executor()
+            return submit_file(executor, path, name, args.language)
+
+    try:
+        for index in range(len(files) + FILES_IN_FLIGHT):
+            if index < len(files):
+                try: pending.append(submit(files[index], names[index]))
+                except Exception as e: print(f"[错误] 读取 {files[index]} 失败: {e}"); failed.append(files[index])
+            if not pending or (index < len(files) and len(pending) < FILES_IN_FLIGHT): continue
+            info, jobs = pending.popleft()
+            try:
+                segments = collect_segments(jobs)
+                if translator and segments: translate(translator, segments)
+                filename = write_outputs(info, segments, args.output_dir, summarizer)
+            except BrokenProcessPool as e:
+                # 识别进程崩溃：这个文件记为失败，重建进程池后重新提交其余排队中的文件
+                print(f"[错误] 识别进程异常退出，{info['path']} 处理失败: {e}"); failed.append(info["path"])
+                queued = [(queued_info["path"], queued_info["name"]) for queued_info, _ in pending]
+                executor.shutdown(wait=False, cancel_futures=True); executor, pending = new_executor(), deque()
+                for path, name in queued:
+                    try: pending.append(submit(path, name))
+                    except Exception as e: print(f"[错误] 读取 {path} 失败: {e}"); failed.append(path)
+                continue
+            except Exception as e:
+                print(f"[错误] 处理 {info['path']} 失败，跳过: {e}"); failed.append(info["path"]); continue
+            total_audio += info["duration"]
+            elapsed = time.time() - info["submitted_at"]
+            print(f"[完成] {info['path']}: {len(segments)} 段, 音频 {info['duration'] / 60:.1f} 分钟, "
+                  f"用时 {elapsed:.0f} 秒 -> {filename}")
+    finally:
+        executor.shutdown()
+    if translator: translator.close()
+    elapsed = time.time() - started
+    print(f"[日志] 全部完成：音频共 {total_audio / 60:.1f} 分钟，用时 {elapsed / 60:.1f} 分钟 "
+          f"({total_audio / elapsed if elapsed else 0:.1f} 倍实时)。")
+    if failed: print(f"[警告] {len(failed)} 个文件处理失败: " + ", ".join(failed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# ==============================================================================
+#           语言跟踪效果对比 (Sticky Language Benchmark)
+# ==============================================================================
+# 说明:
+# - 用一段中英文混合的录音，按实时字幕同样的VAD规则切成语段，
+#   分别用“每段自动检测语言”(旧) 和 LanguageTracker “检测一次后指定语言”(新) 识别。
+# - 输出每段平均识别耗时、节省比例，以及两种方式判定的语言是否一致。
+# - 用法: python bench_language.py 录音.wav [--model base] [--limit 0]
+#   录音为16位PCM的WAV文件 (单声道或立体声，任意采样率)；装了 soundfile 时也可用FLAC。
+# ==============================================================================
+import argparse
+import statistics
+import time
+
+from audio_capture import load_audio_file, split_recording
+from language_tracker import LanguageTracker
+
+
+def load_segments(path):
+    """读入录音，重采样为16kHz float32，并按VAD切分成语段 (与实时字幕一致)。"""
+    audio, spans = split_recording(*load_audio_file(path))
+    return [audio[start:end] for start, end, _ in spans]
+
+
+def run(model, segments, transcribe):
+    timings, languages = [], []
+    for audio in segments:
+        started = time.perf_counter()
+        result = transcribe(model, audio)
+        timings.append(time.perf_counter() - started)
+        languages.append(result.get("language"))
+    return timings, languages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="每段自动检测语言 vs 语言跟踪 的识别耗时对比")
+    parser.add_argument("audio", help="中英文混合录音 (WAV/FLAC)")
+    parser.add_argument("--model", default="base", help="Whisper模型名")
+    parser.add_argument("--limit", type=int, default=0, help="最多测试多少段 (0=全部)")
+    args = parser.parse_args()
+    import whisper
+    segments = load_segments(args.audio)
+    if args.limit: segments = segments[:args.limit]
+    if not segments: print("[错误] 录音中没有检测到语音。"); return
+    print(f"[日志] 共切出 {len(segments)} 段，正在加载模型 '{args.model}' ...")
+    model = whisper.load_model(args.model)
+    model.transcribe(segments[0], fp16=False)  # 预热，排除首次调用的初始化耗时
+    auto_times, auto_langs = run(model, segments, lambda m, a: m.transcribe(a, fp16=False))
+    tracker = LanguageTracker(enabled=True)
+    sticky_times, sticky_langs = run(model, segments, lambda m, a: tracker.transcribe(m, a, fp16=False))
+    auto_mean, sticky_mean = statistics.mean(auto_times), statistics.mean(sticky_times)
+    agree = sum(a == b for a, b in zip(auto_langs, sticky_langs))
+    print(f"{'方式':>12} | {'平均 (ms/段)':>12} | {'中位数 (ms/段)':>14}")
+    print("-" * 46)
+    print(f"{'每段自动检测':>12} | {auto_mean * 1000:>12.1f} | {statistics.median(auto_times) * 1000:>14.1f}")
+    print(f"{'语言跟踪':>12} | {sticky_mean * 1000:>12.1f} | {statistics.median(sticky_times) * 1000:>14.1f}")
+    print(f"每段节省 {(auto_mean - sticky_mean) * 1000:.1f} ms ({(1 - sticky_mean / auto_mean) * 100:.1f}%)，"
+          f"语言判定一致 {agree}/{len(segments)} 段。")
+    print(tracker.stats_line())
+
+
+if __name__ == '__main__':
+    main()
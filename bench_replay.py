@@ -0,0 +1,287 @@
+# ==============================================================================
+#           录音回放压测 (Replay Benchmark Harness)
+# ==============================================================================
+# 说明:
+# - 不用对着麦克风说话也能压测字幕流水线：用录音文件代替 PyAudio 输入设备 (按实时速度或尽快回放)，
+#   Gemini 和 Notion 换成本地假对象 (可设固定延迟)，直接运行 v1.0.py / ma.py 里原样的 background_worker。
+# - 结束后报告：识别实时率 (识别总耗时 / 音频时长)、整体处理速度、端到端延迟 p50/p95/p99 (来自 latency_trace)、
+#   平均CPU占用 (核数)、平均/峰值常驻内存。分块、重采样、模型等改动前后各跑一次，用同一段录音对比。
+# - 识别默认在本进程内加载 (ASR_SERVER_MODE=off)，这样CPU和内存才算得进来；会议日志、音频落盘、
+#   延迟明细等文件都写到临时工作目录，不会混进真实会议记录。
+# - 用法: python bench_replay.py 录音.wav [--script v1.0.py] [--mode subtitles|meeting] [--fast]
+#                                [--model base] [--gemini-delay 0.4] [--notion-delay 0.3] [--json 结果.json]
+#   尽快回放时采集级不等待识别，识别跟不上会丢弃语段 (流水线统计里的“丢弃”)，这本身也是要观察的指标。
+# ==============================================================================
+import argparse
+import importlib.machinery
+import importlib.util
+import json
+import os
+import re
+import resource
+import sys
+import tempfile
+import threading
+import time
+import types
+
+import numpy as np
+
+from audio_capture import PolyphaseResampler, int16_to_float32, load_audio_file
+
+CAPTURE_RATES = (16000, 48000, 44100)  # 与 open_resilient_stream 尝试的采样率一致
+TAIL_SECONDS = 2.0  # 录音放完后再送一段静音，让VAD把最后一句话切出来
+RSS_SAMPLE_SECONDS = 0.5
+
+_NUMBERED_LINE = re.compile(r"^\[(\d+)\]\s*(.*)$")
+
+
+class ReplayStream:
+    """假的 PyAudio 输入流：后台线程每次把 frames_per_buffer 个采样交给回调；录音放完后按实时速度继续送静音，直到被关闭。"""
+
+    def __init__(self, pcm, rate, callback, frames_per_buffer, realtime):
+        self.pcm, self.rate, self.callback = pcm, rate, callback
+        self.frames_per_buffer, self.realtime = frames_per_buffer, realtime
+        self.capture = getattr(callback, "__self__", None)  # audio_capture.CallbackCapture：尽快回放时据此限速，不把原始缓冲区写爆
+        self.started = self.finished = None
+        self.active = True
+        self.thread = threading.Thread(target=self._feed, name="回放", daemon=True)
+        self.thread.start()
+
+    def _feed(self):
+        n, position = self.frames_per_buffer, 0
+        silence = np.zeros(n, dtype=np.int16)
+        self.started = time.time()
+        while self.active:
+            if position < len(self.pcm):
+                chunk = self.pcm[position:position + n]
+                if len(chunk) < n: chunk = np.concatenate((chunk, silence[:n - len(chunk)]))
+                position += n
+                if self.realtime:
+                    delay = self.started + position / self.rate - time.time()
+                    if delay > 0: time.sleep(delay)
+                elif self.capture is not None:
+                    while self.active and self.capture.ring.written - self.capture.read_pos > self.rate: time.sleep(0.005)
+            else:
+                if self.finished is None: self.finished = time.time()
+                chunk = silence; time.sleep(n / self.rate)
+            self.callback(chunk.tobytes(), n, None, 0)
+
+    def stop_stream(self):
+        self.active = False
+        self.thread.join()
+
+    def close(self):
+        self.active = False
+
+
+class ReplayBench:
+    """一次回放压测：提供假的 pyaudio / google.generativeai / notion_client 模块，并统计调用次数。"""
+
+    def __init__(self, pcm, rate, realtime, gemini_delay, notion_delay):
+        self.pcm, self.rate, self.realtime = pcm, rate, realtime
+        self.gemini_delay, self.notion_delay = gemini_delay, notion_delay
+        self.streams, self.tracers = [], []
+        self.lock = threading.Lock()
+        self.gemini_calls = self.notion_calls = self.ui_updates = 0
+
+    def _count(self, name):
+        with self.lock: setattr(self, name, getattr(self, name) + 1)
+
+    # --- pyaudio ---
+    def pyaudio_module(self):
+        bench = self
+
+        class PyAudio:
+            def open(self, format=None, channels=1, rate=None, input=True, input_device_index=None, frames_per_buffer=1024, stream_callback=None):
+                if rate != bench.rate: raise OSError(-9997, "Invalid sample rate")  # 假设备只支持录音本身的采样率
+                stream = ReplayStream(bench.pcm, rate, stream_callback, frames_per_buffer, bench.realtime)
+                bench.streams.append(stream)
+                return stream
+
+            def terminate(self): pass
+
+        return types.SimpleNamespace(PyAudio=PyAudio, paInt16=8, paContinue=0, paInputOverflow=2)
+
+    # --- google.generativeai ---
+    def generate_content(self, prompt):
+        """批量翻译的提示词按编号逐行回复，其他提示词 (单段翻译、会议摘要) 回复一段固定文字。"""
+        time.sleep(self.gemini_delay); self._count("gemini_calls")
+        numbered = [m for m in (_NUMBERED_LINE.match(line) for line in prompt.splitlines()) if m]
+        text = "\n".join(f"[{m.group(1)}] 〔译〕{m.group(2)}" for m in numbered) if numbered else f"〔回放〕{prompt.splitlines()[-1][:200]}"
+        return types.SimpleNamespace(text=text)
+
+    def genai_module(self):
+        model = types.SimpleNamespace(generate_content=self.generate_content)
+        return types.SimpleNamespace(configure=lambda **kwargs: None, GenerativeModel=lambda name, **kwargs: model)
+
+    # --- notion_client ---
+    def notion_module(self):
+        bench = self
+
+        class Endpoint:
+            """client.pages.create(...) / client.blocks.children.append(...) 等任意调用都返回同一个假页面。"""
+
+            def __getattr__(self, name): return self
+
+            def __call__(self, *args, **kwargs):
+                time.sleep(bench.notion_delay); bench._count("notion_calls")
+                return {"id": "replay-page", "url": "https://www.notion.so/replay", "results": []}
+
+        return types.SimpleNamespace(Client=lambda auth=None, **kwargs: Endpoint(), APIResponseError=type("APIResponseError", (Exception,), {}))
+
+    def install(self):
+        sys.modules["pyaudio"] = self.pyaudio_module()
+        sys.modules["notion_client"] = self.notion_module()
+        genai = self.genai_module()
+        try: import google
+        except ImportError: google = types.ModuleType("google"); google.__path__ = []; sys.modules["google"] = google
+        google.generativeai = genai; sys.modules["google.generativeai"] = genai
+        # 记下本次会话的延迟追踪器 (background_worker 运行时才导入它)
+        import latency_trace
+        bench = self
+
+        class ReplayTracer(latency_trace.LatencyTracer):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                self.totals = {}
+                bench.tracers.append(self)
+
+            def _record(self, segment, values):
+                super()._record(segment, values)
+                with self.lock:
+                    for name, value in values.items(): self.totals[name] = self.totals.get(name, 0.0) + value
+
+        latency_trace.LatencyTracer = ReplayTracer
+
+
+class ReplayVar:
+    """代替 tk.StringVar：只记下最后的文字和更新次数。"""
+
+    def __init__(self, bench):
+        self.bench, self.value = bench, ""
+
+    def set(self, value):
+        self.value = value; self.bench._count("ui_updates")
+
+    def get(self):
+        return self.value
+
+
+def load_replay_audio(path):
+    """读入录音；采样率不在设备常用采样率之内时先转成16kHz，让假设备像真麦克风一样以常用采样率开启。"""
+    pcm, rate = load_audio_file(path)
+    if rate in CAPTURE_RATES: return pcm, rate
+    audio = PolyphaseResampler(rate, 16000).process(int16_to_float32(pcm))
+    return np.clip(audio * 32768.0, -32768, 32767).astype(np.int16), 16000
+
+
+def load_script(path):
+    # aa.PY 的扩展名不是 .py，需要明确指定按源码加载
+    spec = importlib.util.spec_from_file_location("replay_target", path, loader=importlib.machinery.SourceFileLoader("replay_target", path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def rss_bytes():
+    with open("/proc/self/statm") as f: return int(f.read().split()[1]) * resource.getpagesize()
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run(bench, module, meeting_mode):
+    """运行 background_worker，录音放完 (再加一段静音) 后像按下结束键一样停止，返回运行期间的资源统计。"""
+    worker = threading.Thread(target=module.background_worker, args=(0, meeting_mode), name="background_worker", daemon=True)
+    cpu_started, rss_samples = cpu_seconds(), []
+    worker.start()
+    while worker.is_alive():
+        worker.join(timeout=RSS_SAMPLE_SECONDS)
+        rss_samples.append(rss_bytes())
+        finished = bench.streams[0].finished if bench.streams else None
+        if finished and time.time() - finished >= TAIL_SECONDS: module.worker_thread_stop_event.set()
+    ended = time.time()
+    return {"ended": ended, "cpu_seconds": cpu_seconds() - cpu_started, "rss_samples": rss_samples}
+
+
+def report(bench, audio_seconds, usage):
+    if not bench.streams: print("[错误] background_worker 没有打开音频流，请查看上面的日志。"); return None
+    stream = bench.streams[0]
+    elapsed = usage["ended"] - stream.started
+    tracer = bench.tracers[0] if bench.tracers else None
+    latency = tracer.summary().get("端到端", {}) if tracer else {}
+    asr_seconds = tracer.totals.get("识别", 0.0) if tracer else 0.0
+    rss = usage["rss_samples"] or [rss_bytes()]
+    result = {
+        "audio_seconds": round(audio_seconds, 2), "elapsed_seconds": round(elapsed, 2),
+        "drain_seconds": round(usage["ended"] - stream.finished, 2) if stream.finished else None,
+        "segments": tracer.count if tracer else 0, "asr_rtf": round(asr_seconds / audio_seconds, 3) if audio_seconds else 0.0,
+        "speed": round(audio_seconds / elapsed, 2) if elapsed else 0.0,
+        "end_to_end": {k: round(latency[k], 3) for k in ("p50", "p95", "p99") if k in latency},
+        "cpu_cores": round(usage["cpu_seconds"] / elapsed, 2) if elapsed else 0.0,
+        "rss_mean_mb": round(sum(rss) / len(rss) / 2 ** 20, 1),
+        "rss_peak_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),  # Linux 下单位为KB，含模型加载
+        "gemini_calls": bench.gemini_calls, "notion_calls": bench.notion_calls, "ui_updates": bench.ui_updates,
+    }
+    print("\n================ 回放压测结果 ================")
+    print(f"音频时长       {result['audio_seconds']:.1f} 秒 ({'实时回放' if bench.realtime else '尽快回放'})")
+    print(f"总用时         {result['elapsed_seconds']:.1f} 秒 (录音放完后收尾 {result['drain_seconds']} 秒)，处理速度 {result['speed']:.2f} 倍实时")
+    print(f"识别实时率     {result['asr_rtf']:.3f} (识别总耗时 / 音频时长，越小越好)，定稿 {result['segments']} 段")
+    e2e = result["end_to_end"]
+    print(f"端到端延迟     " + (f"p50 {e2e['p50']:.2f}s / p95 {e2e['p95']:.2f}s / p99 {e2e['p99']:.2f}s" if e2e else "无数据"))
+    print(f"CPU            平均 {result['cpu_cores']:.2f} 核")
+    print(f"内存           平均 {result['rss_mean_mb']:.0f} MB / 峰值 {result['rss_peak_mb']:.0f} MB")
+    print(f"假服务调用     Gemini {result['gemini_calls']} 次, Notion {result['notion_calls']} 次, 界面更新 {result['ui_updates']} 次")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用录音文件回放压测实时字幕流水线 (无需麦克风、Gemini 和 Notion)")
+    parser.add_argument("audio", help="录音 (WAV/FLAC)")
+    parser.add_argument("--script", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "v1.0.py"), help="要运行其 background_worker 的脚本 (v1.0.py / aa.PY / ma.py)")
+    parser.add_argument("--mode", choices=["subtitles", "meeting"], default="subtitles", help="实时字幕模式或会议模式")
+    parser.add_argument("--fast", action="store_true", help="尽快回放，而不是按实时速度")
+    parser.add_argument("--model", default=None, help="覆盖脚本里写死的Whisper模型名")
+    parser.add_argument("--gemini-delay", type=float, default=0.4, help="假Gemini每次请求的延迟 (秒)")
+    parser.add_argument("--notion-delay", type=float, default=0.3, help="假Notion每次请求的延迟 (秒)")
+    parser.add_argument("--asr-server", action="store_true", help="使用共享识别服务 (其CPU和内存不计入结果)")
+    parser.add_argument("--workdir", default=None, help="会议日志、延迟明细等文件的输出目录，默认新建临时目录")
+    parser.add_argument("--json", default=None, help="把结果另存为JSON，便于前后对比")
+    args = parser.parse_args()
+    script, json_path = os.path.abspath(args.script), args.json and os.path.abspath(args.json)
+    pcm, rate = load_replay_audio(args.audio)
+    audio_seconds = len(pcm) / rate
+
+    # 这些配置在各模块导入时读取，必须先于 background_worker 的延迟导入设置好
+    os.environ["ASR_SERVER_MODE"] = "on" if args.asr_server else "off"
+    os.environ["MEETING_CAPTURE_DEVICES"] = ""  # 回放只有一路
+    os.environ["LATENCY_TRACE"] = "on"
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_replay_")
+    os.makedirs(workdir, exist_ok=True); os.chdir(workdir)
+    print(f"[日志] 录音 {audio_seconds:.1f} 秒 ({rate}Hz)，输出目录: {workdir}")
+
+    bench = ReplayBench(pcm, rate, realtime=not args.fast, gemini_delay=args.gemini_delay, notion_delay=args.notion_delay)
+    bench.install()
+    if args.model:
+        import asr_server
+        load_model = asr_server.get_asr_model
+        asr_server.get_asr_model = lambda model_name=None: load_model(args.model)
+    module = load_script(script)
+    if not hasattr(module, "background_worker"): print(f"[错误] {args.script} 里没有 background_worker。"); return
+    module.english_text_var, module.chinese_text_var = ReplayVar(bench), ReplayVar(bench)
+    module.GEMINI_API_KEY = module.NOTION_API_KEY = "replay"
+    for name in ("TOOLBOX_LOG_DATABASE_ID", "TRAINING_HUB_DATABASE_ID", "MEETING_LOG_DATABASE_ID", "DAILY_REVIEW_DATABASE_ID"):
+        if hasattr(module, name): setattr(module, name, "replay-db")  # 让实时上传和会议归档的Notion调用都真正走一遍
+
+    result = report(bench, audio_seconds, run(bench, module, args.mode == "meeting"))
+    if result and json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"audio": args.audio, "script": args.script, "mode": args.mode, "fast": args.fast, "model": args.model, **result}, f, ensure_ascii=False, indent=2)
+        print(f"[日志] 结果已保存: {json_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# ==============================================================================
+#           语言跟踪 (Sticky Language Detection) v1.0
+# ==============================================================================
+# 版本说明:
+# - 【核心新增】双向字幕模式不再让 Whisper 每段都自动检测语言：检测一次后记住结果，
+#              之后识别时显式传入 language=，省掉每段的语言检测开销。
+# - 【定期复查】每隔 LANGUAGE_REDETECT_SEGMENTS 段或 LANGUAGE_REDETECT_SECONDS 秒重新检测一次。
+# - 【换语种兜底】锁定语言后若识别置信度 (avg_logprob) 明显下降，说明说话人可能换了语言，
+#              立即对这一段重新自动检测，保证切换语言的那一句也能正确识别和翻译。
+# - 【效果对比】python bench_language.py <混合中英文录音.wav>
+# ==============================================================================
+import os
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+LANGUAGE_TRACKING = os.getenv("LANGUAGE_TRACKING", "on").lower() != "off"
+LANGUAGE_REDETECT_SEGMENTS = int(os.getenv("LANGUAGE_REDETECT_SEGMENTS", "20"))
+LANGUAGE_REDETECT_SECONDS = float(os.getenv("LANGUAGE_REDETECT_SECONDS", "120"))
+LANGUAGE_MIN_LOGPROB = float(os.getenv("LANGUAGE_MIN_LOGPROB", "-0.8"))  # 锁定语言后低于此置信度就重新检测
+
+
+def mean_logprob(result):
+    """识别结果各片段 avg_logprob 的平均值，没有片段时返回 None。"""
+    segments = result.get("segments") or []
+    if not segments: return None
+    return sum(s.get("avg_logprob", 0.0) for s in segments) / len(segments)
+
+
+class LanguageTracker:
+    """记住最近一次检测到的语言，接口与模型一致：tracker.transcribe(model, audio, **options) -> result。"""
+
+    def __init__(self, enabled=LANGUAGE_TRACKING, redetect_segments=LANGUAGE_REDETECT_SEGMENTS,
+                 redetect_seconds=LANGUAGE_REDETECT_SECONDS, min_logprob=LANGUAGE_MIN_LOGPROB):
+        self.enabled = enabled
+        self.redetect_segments, self.redetect_seconds, self.min_logprob = redetect_segments, redetect_seconds, min_logprob
+        self.language = None
+        self.segments_since_detect, self.detected_at = 0, 0.0
+        self.detections = self.fixed_runs = self.retries = 0
+
+    def needs_detection(self):
+        return (not self.enabled or self.language is None or self.segments_since_detect >= self.redetect_segments
+                or time.time() - self.detected_at >= self.redetect_seconds)
+
+    def transcribe(self, model, audio, **options):
+        if self.needs_detection(): return self._detect(model, audio, options)
+        result = model.transcribe(audio, language=self.language, **options)
+        self.fixed_runs += 1; self.segments_since_detect += 1
+        confidence = mean_logprob(result)
+        if confidence is not None and confidence < self.min_logprob:
+            self.retries += 1
+            return self._detect(model, audio, options)  # 可能换了语言：这一段自动检测重来
+        return result
+
+    def _detect(self, model, audio, options):
+        result = model.transcribe(audio, **options)
+        self.detections += 1
+        if self.enabled and result.get("language") and mean_logprob(result) is not None:
+            if result["language"] != self.language: print(f"[日志] 检测到语言: {result['language']}")
+            self.language = result["language"]
+            self.segments_since_detect, self.detected_at = 0, time.time()
+        return result
+
+    def stats_line(self):
+        return (f"[语言跟踪] 当前语言 {self.language or '-'} | 自动检测 {self.detections} 次, "
+                f"指定语言识别 {self.fixed_runs} 次 (其中置信度下降重新检测 {self.retries} 次)")
@@ -0,0 +1,101 @@
+# ==============================================================================
+#           字幕延迟追踪 (Per-Segment Latency Tracing) v1.0
+# ==============================================================================
+# 版本说明:
+# - 【核心新增】每个定稿语段在流水线各环节打时间戳：采集结束、识别开始/结束、翻译开始/结束、
+#              界面显示、Notion上传完成，据此算出各段耗时：
+#              识别排队 / 识别 / 翻译排队 / 翻译 / 输出 / 端到端 (采集结束→界面显示) / 上传。
+# - 【滚动分位数】保留最近 LATENCY_WINDOW 段，随流水线统计定期打印 p50/p95/p99，
+#              一眼看出瓶颈在 Whisper、Gemini 还是 Notion。
+# - 【逐段落盘】每段一行写入 latency_traces/ 下的CSV，会话结束时再写一份JSON汇总。
+# ==============================================================================
+import csv
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from translation import percentile
+
+load_dotenv()
+LATENCY_TRACE = os.getenv("LATENCY_TRACE", "on").lower() != "off"
+LATENCY_TRACE_DIR = os.getenv("LATENCY_TRACE_DIR", "latency_traces")
+LATENCY_WINDOW = int(os.getenv("LATENCY_WINDOW", "500"))  # 滚动分位数统计的语段数
+
+# 指标名 -> (起点时间戳, 终点时间戳)
+METRICS = {
+    "识别排队": ("captured", "asr_start"),
+    "识别": ("asr_start", "asr_end"),
+    "翻译排队": ("asr_end", "translate_start"),
+    "翻译": ("translate_start", "translate_end"),
+    "输出": ("translate_end", "displayed"),
+    "端到端": ("captured", "displayed"),
+}
+UPLOAD_METRIC = "上传"
+
+
+def stamp(segment, name):
+    """在语段上记录一个时间戳 (追踪关闭时 segment 没有 trace 字段，直接跳过)。"""
+    trace = segment.get("trace")
+    if trace is not None: trace[name] = time.time()
+
+
+class LatencyTracer:
+    """收集各语段的时间戳，维护滚动分位数，并把每段的耗时写入CSV。多条流水线可共用一个。"""
+
+    def __init__(self, directory=LATENCY_TRACE_DIR, window=LATENCY_WINDOW):
+        os.makedirs(directory, exist_ok=True)
+        self.base_path = os.path.join(directory, f"latency_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}")
+        self.samples = {name: deque(maxlen=window) for name in [*METRICS, UPLOAD_METRIC]}
+        self.lock = threading.Lock()
+        self.count = 0
+        self.csv_file = open(self.base_path + ".csv", "w", newline="", encoding="utf-8-sig")  # 带BOM，Excel直接打开不乱码
+        self.writer = csv.writer(self.csv_file)
+        self.writer.writerow(["id", "source", "captured_at", *METRICS, UPLOAD_METRIC])
+
+    def start(self, segment):
+        """语段刚切出来时调用：以采集结束时间作为起点。"""
+        segment["trace"] = {"captured": segment.get("captured_at", time.time())}
+
+    def _record(self, segment, values):
+        with self.lock:
+            if self.csv_file.closed: return  # 会话结束后才完成的上传
+            for name, value in values.items(): self.samples[name].append(value)
+            self.writer.writerow([segment.get("id"), segment.get("source") or "", f"{segment['trace']['captured']:.3f}",
+                                  *(f"{values[name]:.3f}" if name in values else "" for name in [*METRICS, UPLOAD_METRIC])])
+            self.csv_file.flush()
+
+    def finish(self, segment):
+        """语段显示到界面后调用：计算各段耗时并记录。"""
+        trace = segment.get("trace")
+        if not trace: return
+        stamp(segment, "displayed")
+        values = {name: trace[end] - trace[start] for name, (start, end) in METRICS.items() if start in trace and end in trace}
+        self.count += 1
+        self._record(segment, values)
+
+    def record_upload(self, segment):
+        """Notion上传完成后调用 (另起一行，只填上传耗时)。"""
+        trace = segment.get("trace")
+        if not trace or "displayed" not in trace: return
+        self._record(segment, {UPLOAD_METRIC: time.time() - trace["displayed"]})
+
+    def summary(self):
+        with self.lock:
+            return {name: {"count": len(values), "p50": percentile(values, 50), "p95": percentile(values, 95), "p99": percentile(values, 99)}
+                    for name, values in self.samples.items() if values}
+
+    def stats_line(self):
+        parts = [f"{name} {s['p50']:.2f}/{s['p95']:.2f}/{s['p99']:.2f}" for name, s in self.summary().items()]
+        return f"[延迟] p50/p95/p99 (秒, 最近{self.count}段): " + (" | ".join(parts) if parts else "暂无数据")
+
+    def close(self):
+        with self.lock: self.csv_file.close()
+        with open(self.base_path + ".json", "w", encoding="utf-8") as f:
+            json.dump({"segments": self.count, "metrics": self.summary()}, f, ensure_ascii=False, indent=2)
+        print(self.stats_line())
+        print(f"[日志] 延迟明细已保存: {self.base_path}.csv / .json")
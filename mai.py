@@ -7,26 +7,20 @@
 #              作为一条“翻译”任务，存入您的[AI训练中心]数据库，并与日志关联。
 # - 【严格遵守】确保v5.0所有原有功能（包括诊断信息）100%保留。
 # ==============================================================================
+from warm_import import WarmImporter, heavy_modules  # 最先导入：冷启动计时从这里开始
 import os
 import sys
 import threading
 import time
-import numpy as np
-import pyaudio
 from dotenv import load_dotenv
-import tkinter as tk
 from datetime import datetime, timezone, timedelta
 import re # 【新增】用于文本净化
 
-# --- 库导入与检查 ---
-try:
-    import whisper
-    import google.generativeai as genai
-    from notion_client import Client, APIResponseError
-    import resampy
-except ImportError:
-    print("错误：核心库未安装！\n请在激活的虚拟环境中运行以下命令:\npip install openai-whisper google-generativeai notion-client resampy tk")
-    sys.exit()
+from overlay_process import OverlayWindow
+
+# --- 库导入与检查 (窗口先显示：重量级库在后台线程预先导入，工作线程启动时检查并取用) ---
+APIResponseError = None
+warm_importer = WarmImporter(os.path.basename(__file__), heavy_modules())
 
 # --- 配置加载 (已增加训练中心相关配置) ---
 load_dotenv()
@@ -48,7 +42,6 @@ print("---------------------------\n")
 # --- 全局常量 ---
 DEVICE_INDEX = 2
 RECORD_SECONDS = 8
-TARGET_RATE = 16000
 
 # --- 全局状态变量 ---
 root = None 
@@ -94,12 +87,27 @@ def write_to_training_hub(client, task_type, input_text, output_text, source_db_
 #  核心工作逻辑 (已升级)
 # ==============================================================================
 def audio_processing_loop():
-    global subtitle_text
+    global subtitle_text, APIResponseError
+    try:
+        import pyaudio
+        import google.generativeai as genai
+        from notion_client import Client, APIResponseError
+        from audio_capture import TARGET_RATE, CaptureHost, VadSegmenter, open_callback_stream
+        from pipeline import SubtitlePipeline
+        from asr_server import get_asr_model
+        from asr_calibration import choose_asr_model
+        from translation import TRANSLATE_FAILED, AsyncTranslationService, SegmentTranslator
+    except ImportError:
+        error_msg = "错误：核心库未安装！\n请在激活的虚拟环境中运行以下命令:\npip install openai-whisper google-generativeai notion-client tk"
+        print(error_msg)
+        if root: subtitle_text.set(error_msg)
+        worker_thread_stop_event.set()
+        return
     
     print("工作线程启动，正在初始化模型...")
     notion_client = None
     try:
-        whisper_model = whisper.load_model('base') # 使用通用模型以支持多语言
+        whisper_model = get_asr_model(choose_asr_model('base')) # 使用通用模型以支持多语言；ASR_MODEL_AUTO=on 时按本机实测的实时率选用
         genai.configure(api_key=GEMINI_API_KEY)
         gemini_model = genai.GenerativeModel('models/gemini-2.5-flash')
         if NOTION_API_KEY and len(NOTION_API_KEY) > 10:
@@ -114,58 +122,69 @@ def audio_processing_loop():
         worker_thread_stop_event.set()
         return
 
-    p = pyaudio.PyAudio()
+    audio_host = CaptureHost(pyaudio, None)  # 打开方式取决于设备的默认采样率，查询设备信息后再设置
     try:
-        device_info = p.get_device_info_by_index(DEVICE_INDEX)
+        device_info = audio_host.p.get_device_info_by_index(DEVICE_INDEX)
     except OSError:
         error_msg = f"错误：找不到设备索引 {DEVICE_INDEX}。\n请检查您的音频设备连接。"
         if root: subtitle_text.set(error_msg)
         print(error_msg)
         worker_thread_stop_event.set()
-        p.terminate()
+        audio_host.terminate()
         return
         
     NATIVE_RATE = int(device_info['defaultSampleRate'])
     NATIVE_CHANNELS = 1 if device_info['maxInputChannels'] >= 1 else device_info['maxInputChannels']
     
-    stream = p.open(format=pyaudio.paInt16, channels=NATIVE_CHANNELS, rate=NATIVE_RATE,
-                    input=True, input_device_index=DEVICE_INDEX, frames_per_buffer=1024)
-    print(f"音频流已开启 (设备 {DEVICE_INDEX})。字幕功能正常运行。")
-
-    while not worker_thread_stop_event.is_set():
-        try:
-            frames = stream.read(NATIVE_RATE * RECORD_SECONDS, exception_on_overflow=False)
-            audio_data = np.frombuffer(frames, dtype=np.int16)
-
-            if NATIVE_CHANNELS > 1: audio_data = audio_data.reshape(-1, NATIVE_CHANNELS)[:, 0]
-            if NATIVE_RATE != TARGET_RATE: audio_data = resampy.resample(audio_data.astype(float), NATIVE_RATE, TARGET_RATE)
-
-            audio_normalized = audio_data.astype(np.float32) / 32768.0
-            result = whisper_model.transcribe(audio_normalized, fp16=False)
-            english_text = result['text'].strip()
-
-            if english_text:
-                response = gemini_model.generate_content(f"Translate to Simplified Chinese, returning only the translation:\n{english_text}")
-                chinese_text = response.text.strip()
-                
-                new_text = f"{english_text}\n{chinese_text}"
-                if subtitle_text: subtitle_text.set(new_text)
-                print(f"新字幕: {new_text.replace(chr(10), ' / ')}")
-                
-                if notion_client and TOOLBOX_LOG_DATABASE_ID:
-                    print("DEBUG: 条件满足，准备启动Notion日志上传线程...")
-                    # 【升级】将notion_client作为参数传入，并在成功后触发训练中心归档
-                    threading.Thread(target=save_log_to_notion_and_trigger_training, args=(notion_client, "实时字幕", english_text, chinese_text)).start()
-                else:
-                    print("DEBUG: 未启动Notion上传，因为 notion_client 或 TOOLBOX_LOG_DATABASE_ID 无效。")
-
-        except Exception as e:
-            error_msg_loop = f"音频处理循环出错: {e}"
-            if subtitle_text: subtitle_text.set(error_msg_loop)
-            print(error_msg_loop)
-            time.sleep(1)
-
-    stream.stop_stream(); stream.close(); p.terminate()
+    # 回调模式采集 + 采样率协商：优先以16kHz原生开启，省去重采样；设备不支持时退回其默认采样率
+    # 音频流中断 (如USB麦克风接触不良) 时由流水线通过 audio_host 重新枚举设备并重开，模型和队列都保留
+    rates = [TARGET_RATE, NATIVE_RATE]
+    audio_host.open_fn = lambda p_instance, index: open_callback_stream(p_instance, index, rates, channels=NATIVE_CHANNELS)
+    stream, NATIVE_RATE = audio_host.open(DEVICE_INDEX)
+    if not stream:
+        error_msg = f"错误：无法为设备索引 {DEVICE_INDEX} 打开音频流。"
+        if root: subtitle_text.set(error_msg)
+        print(error_msg)
+        worker_thread_stop_event.set()
+        audio_host.terminate()
+        return
+    print(f"音频流已开启 (设备 {DEVICE_INDEX}, {NATIVE_RATE}Hz)。字幕功能正常运行。")
+
+    # 流水线：采集 → 识别 → 翻译 → 输出 分别在独立线程中运行 (RECORD_SECONDS 作为单句最长上限)
+    def transcribe_segment(segment):
+        result = whisper_model.transcribe(segment['audio'], fp16=False)  # 音频已在采集级重采样为16kHz float32
+        segment['text'] = result['text'].strip()
+        segment['asr_segments'] = result.get('segments', [])  # 供流水线按 no_speech_prob/avg_logprob 过滤噪声
+        return segment if segment['text'] else None
+
+    def show_partial(segment):
+        # 草稿字幕：边说边显示英文原文，整句定稿并翻译后再显示中英对照
+        if subtitle_text: subtitle_text.set(f"{segment['text']} …")
+
+    # 合并翻译 + 异步并发：同一时间窗内的语段合成一次请求，慢请求超时先显示原文
+    translator = AsyncTranslationService(SegmentTranslator(gemini_model))
+
+    def deliver_segment(segment):
+        english_text, chinese_text = segment['text'], segment['translation']
+        new_text = f"{english_text}\n{chinese_text}"
+        if subtitle_text: subtitle_text.set(new_text)
+        print(f"新字幕: {new_text.replace(chr(10), ' / ')}")
+        if chinese_text == TRANSLATE_FAILED or segment.get('translation_fallback'): return  # 超时显示的原文不上传
+        
+        if notion_client and TOOLBOX_LOG_DATABASE_ID:
+            print("DEBUG: 条件满足，准备启动Notion日志上传线程...")
+            # 【升级】将notion_client作为参数传入，并在成功后触发训练中心归档
+            threading.Thread(target=save_log_to_notion_and_trigger_training, args=(notion_client, "实时字幕", english_text, chinese_text)).start()
+        else:
+            print("DEBUG: 未启动Notion上传，因为 notion_client 或 TOOLBOX_LOG_DATABASE_ID 无效。")
+
+    pipeline = SubtitlePipeline(stream, VadSegmenter(max_segment_s=RECORD_SECONDS), transcribe_segment, translator, deliver_segment,
+                                worker_thread_stop_event, sample_rate=NATIVE_RATE, partial_fn=show_partial, reopen_fn=audio_host.reopen)
+    pipeline.run()
+    translator.close()
+    if pipeline.fatal_error and subtitle_text: subtitle_text.set(f"音频处理循环出错: {pipeline.fatal_error}")
+
+    pipeline.stream.stop_stream(); pipeline.stream.close(); audio_host.terminate()
     print("工作线程已停止。")
 
 def save_log_to_notion_and_trigger_training(client, log_type: str, input_text: str, output_text: str):
@@ -221,26 +240,15 @@ def on_closing():
 #  主程序入口 (v5.0原样保留)
 # ==============================================================================
 if __name__ == '__main__':
-    root = tk.Tk()
-    subtitle_text = tk.StringVar()
-    subtitle_text.set("正在初始化模型，请稍候...")
-
-    screen_width = root.winfo_screenwidth()
-    screen_height = root.winfo_screenheight()
-    
+    warm_importer.start()  # 立即在后台开始导入重量级库，同时创建窗口
     window_width = 900
     window_height = 120 
-    x_pos = (screen_width - window_width) // 2
-    y_pos = screen_height - window_height - 50 
     
-    root.geometry(f'{window_width}x{window_height}+{x_pos}+{y_pos}')
-    
-    root.overrideredirect(True) 
-    root.wm_attributes("-topmost", True)
-    root.config(bg='#121212') 
-    
-    label = tk.Label(root, textvariable=subtitle_text, font=("Arial", 18, "bold"), fg="white", bg=root.cget('bg'), wraplength=window_width-20, justify="left")
-    label.pack(expand=True, fill='both', pady=10, padx=10)
+    # 字幕窗口在单独的轻量进程里绘制，这里只经管道发送最新文字，识别再忙界面也不卡
+    root = OverlayWindow(width=window_width, height=window_height, bottom_margin=50, bg='#121212', padx=10, pady=10,
+                         labels=[{"name": "subtitle", "font": ("Arial", 18, "bold"), "fg": "white", "anchor": "center", "fill": "both"}])
+    subtitle_text = root.var("subtitle")
+    subtitle_text.set("正在初始化模型，请稍候...")
     
     worker_thread = threading.Thread(target=audio_processing_loop)
     worker_thread.daemon = True
@@ -249,4 +257,5 @@ if __name__ == '__main__':
     print("GUI已就绪，后台线程已启动。字幕窗口将直接显示。")
     print("要退出程序，请直接关闭这个黑色的命令行窗口。")
     
+    root.after(0, warm_importer.window_shown)  # 进入主循环、窗口真正画出来的时刻
     root.mainloop()
\ No newline at end of file
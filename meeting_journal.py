@@ -0,0 +1,167 @@
+# ==============================================================================
+#           会议日志 (Crash-Safe Meeting Journal) v1.0
+# ==============================================================================
+# 版本说明:
+# - 【核心新增】会议模式不再把逐字稿和训练数据攒在内存列表里：每出一段字幕就以一行JSON
+#              追加写入 meeting_journals/ 下的日志文件并立即落盘，长会议内存不再增长。
+# - 【崩溃可恢复】程序崩溃或被强制关闭后再次开始会议，若最近一份日志尚未归档，
+#              自动接着写入同一份日志，会议开始时间沿用原来的。
+# - 【流式归档】会议结束时逐字稿文件、Notion正文块和训练数据都从磁盘逐条读取生成，
+#              不再拼接一个巨大的字符串。
+# ==============================================================================
+import glob
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+load_dotenv()
+JOURNAL_DIR = os.getenv("JOURNAL_DIR", "meeting_journals")
+JOURNAL_RESUME_MINUTES = float(os.getenv("JOURNAL_RESUME_MINUTES", "30"))  # 崩溃后多久之内重新开始会议算作续写
+
+
+class MeetingJournal:
+    """一次会议的追加式日志：第一行是会议信息，之后每行一个语段，归档完成后追加一行归档标记。"""
+
+    def __init__(self, path, start_time):
+        self.path, self.start_time = path, start_time
+        self.lock = threading.Lock()  # 多路采集时多个输出线程同时写入
+        self.file = open(path, "a", encoding="utf-8")
+        if not _ends_with_newline(path):
+            self.file.write("\n")  # 崩溃时最后一行只写了一半：另起一行，不让新记录接在残行后面
+        self.segment_count = sum(1 for _ in self.entries())
+
+    @classmethod
+    def open_meeting(cls, start_time=None, directory=JOURNAL_DIR):
+        """开始一次会议：有最近未归档的日志就续写它，否则新建一份。"""
+        os.makedirs(directory, exist_ok=True)
+        unfinished = find_unfinished(directory)
+        if unfinished and time.time() - os.path.getmtime(unfinished[-1][0]) < JOURNAL_RESUME_MINUTES * 60:
+            path, header = unfinished.pop()
+            journal = cls(path, datetime.fromisoformat(header["start"]))
+            print(f"[日志] 发现未归档的会议日志，继续写入: {path} (已有 {journal.segment_count} 段)")
+        else:
+            start_time = start_time or datetime.now()
+            path = os.path.join(directory, f"meeting_{start_time.strftime('%Y-%m-%d_%H-%M-%S')}.jsonl")
+            if os.path.exists(path): path = path.replace(".jsonl", f"_{int(time.time() * 1000) % 1000:03d}.jsonl")
+            journal = cls.create(path, start_time)
+        for path, _ in unfinished: print(f"[警告] 较早的会议日志尚未归档: {path}")
+        return journal
+
+    @classmethod
+    def create(cls, path, start_time):
+        """在指定路径新建一份日志 (已存在则覆盖)。"""
+        if os.path.exists(path): os.remove(path)
+        journal = cls(path, start_time)
+        journal._write({"type": "meeting", "start": start_time.isoformat()})
+        return journal
+
+    def _write(self, record):
+        with self.lock:
+            self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.file.flush(); os.fsync(self.file.fileno())  # 每段立即落盘，崩溃也不丢
+
+    def append(self, segment, at=None):
+        """记录一段定稿字幕 (原文、译文、语言、来源设备、时间)；at 为这段话的时间，默认取当前时间。"""
+        with self.lock: self.segment_count += 1
+        self._write({"type": "segment", "time": (at or datetime.now()).strftime("%H:%M:%S"), "captured_at": segment.get("captured_at"), "device": segment.get("source"),
+                     "source": segment["text"], "translation": segment.get("translation"), "language": segment.get("language"),
+                     "fallback": bool(segment.get("translation_fallback"))})
+
+    def mark_archived(self):
+        self._write({"type": "archived", "at": datetime.now().isoformat()})
+
+    def close(self):
+        self.file.close()
+
+    def entries(self):
+        """从磁盘逐条读出语段记录。"""
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try: record = json.loads(line)
+                except json.JSONDecodeError: continue  # 崩溃时写了一半的最后一行
+                if record.get("type") == "segment": yield record
+
+    def read_new(self, offset=0):
+        """从文件偏移 offset 处读出之后新增的语段记录，返回 (记录列表, 新的偏移)。
+
+        只读上次之后追加的部分，长会议中反复调用也不用重读整份日志；正在写入、还没写完的最后一行留到下次再读。
+        """
+        records = []
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"): break
+                offset += len(line)
+                try: record = json.loads(line)
+                except json.JSONDecodeError: continue
+                if record.get("type") == "segment": records.append(record)
+        return records, offset
+
+    def iter_transcript(self):
+        """逐段生成逐字稿文本，格式与原来的 full_transcript_log 一致。"""
+        for entry in self.entries(): yield transcript_text(entry)
+
+    def iter_chunks(self, size=2000, limit=None):
+        """把逐字稿切成不超过 size 个字符的块 (Notion单个文本块的上限)，最多 limit 块。"""
+        buffer, count = "", 0
+        for text in self.iter_transcript():
+            buffer += text
+            while len(buffer) >= size:
+                yield buffer[:size]; buffer = buffer[size:]; count += 1
+                if count == limit: return
+        if buffer: yield buffer
+
+    def iter_training_pairs(self):
+        for entry in self.entries():
+            if not entry["fallback"] and entry["translation"] is not None:
+                en, cn = bilingual(entry)
+                yield {"en": en, "cn": cn}
+
+    def write_transcript(self, f):
+        for text in self.iter_transcript(): f.write(text)
+
+
+def bilingual(entry):
+    """无论源语言是什么，都整理成 (英文, 中文)。"""
+    if "zh" in (entry.get("language") or ""): return entry["translation"], entry["source"]
+    return entry["source"], entry["translation"]
+
+
+def transcript_text(entry):
+    """一条语段记录在逐字稿中的文本。"""
+    stamp = f"[{entry['time']}]" + (f" [{entry['device']}]" if entry.get("device") else "")  # 多路采集时标明来源
+    if entry["fallback"] or entry["translation"] is None: return f"{stamp} {entry['source']}\n\n"
+    en, cn = bilingual(entry)
+    return f"{stamp} EN: {en}\nCN: {cn}\n\n"
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        if not f.tell(): return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def _last_line(f):
+    f.seek(0, os.SEEK_END)
+    f.seek(max(0, f.tell() - 4096))
+    lines = f.read().splitlines()
+    return lines[-1] if lines else b""
+
+
+def find_unfinished(directory=JOURNAL_DIR):
+    """按时间顺序列出尚未归档的日志及其会议信息 (只看首行和末行，不通读文件)。"""
+    unfinished = []
+    for path in sorted(glob.glob(os.path.join(directory, "meeting_*.jsonl"))):
+        with open(path, "rb") as f:
+            try: header = json.loads(f.readline())
+            except json.JSONDecodeError: continue
+            try: last = json.loads(_last_line(f))
+            except json.JSONDecodeError: last = {}  # 最后一行写了一半，说明没归档
+        if header.get("type") == "meeting" and last.get("type") != "archived": unfinished.append((path, header))
+    return unfinished
@@ -0,0 +1,145 @@
+# ==============================================================================
+#           会议纪要摘要 (Map-Reduce Meeting Summarizer) v1.1
+# ==============================================================================
+# 版本说明:
+# - 【核心新增】长会议不再把整份逐字稿塞进一个提示词：逐字稿按时间顺序切成若干段
+#              (每段不超过 SUMMARY_CHUNK_CHARS 个字符，只在语段边界处切)，各段并行提炼要点，
+#              再把分段要点合并成最终的“核心摘要 / 主要议题与结论 / Action Items”报告。
+# - 【逐级合并】分段要点太多时先每 SUMMARY_REDUCE_FANIN 份合并一次，逐级归并，不会超出上下文。
+# - 【短会议不变】逐字稿只有一段时，仍按原来的提示词一次生成。
+# - 【可配置】SUMMARY_CHUNK_CHARS、SUMMARY_PARALLELISM、SUMMARY_REDUCE_FANIN。
+# - 【v1.1 新增】滚动摘要：会议进行中每隔 SUMMARY_ROLLING_MINUTES 分钟在后台提炼新增逐字稿的要点，
+#              会议结束时只需补上最后一小段，再由已有要点生成报告，几秒内即可得到纪要。
+#              每次只从会议日志上次读到的位置往后读，长会议中的滚动更新不再重读整份日志。
+# ==============================================================================
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from meeting_journal import transcript_text
+
+load_dotenv()
+SUMMARY_CHUNK_CHARS = int(os.getenv("SUMMARY_CHUNK_CHARS", "12000"))
+SUMMARY_PARALLELISM = int(os.getenv("SUMMARY_PARALLELISM", "4"))
+SUMMARY_REDUCE_FANIN = int(os.getenv("SUMMARY_REDUCE_FANIN", "8"))
+SUMMARY_ROLLING_MINUTES = float(os.getenv("SUMMARY_ROLLING_MINUTES", "5"))  # 0 = 不做滚动摘要，会议结束时一次生成
+
+REPORT_PROMPT = ("你是一位专业的会议纪要分析师。请根据以下会议记录，用中文生成一份精炼的报告，包含：\n1. **核心摘要**\n"
+                 "2. **主要议题与结论**\n3. **会后待办事项 (Action Items)**\n\n会议记录原文:\n")
+CHUNK_PROMPT = ("你是一位专业的会议纪要分析师。以下是一场会议中 {span} 这一时段的记录，请用中文提炼要点，分三部分列出：\n"
+                "1. 讨论的议题\n2. 达成的结论或决定\n3. 待办事项 (写明负责人和时间，如有)\n不要编造记录中没有的内容。\n\n会议记录原文:\n")
+MERGE_PROMPT = "以下是同一场会议中相邻几个时段的要点，请按时间顺序合并为一份要点清单，保留全部议题、结论和待办事项，去掉重复：\n\n"
+REPORT_FROM_NOTES_PROMPT = ("你是一位专业的会议纪要分析师。以下是一场会议按时间顺序整理的分段要点，请据此用中文生成一份精炼的报告，包含：\n"
+                            "1. **核心摘要**\n2. **主要议题与结论**\n3. **会后待办事项 (Action Items)**\n\n分段要点:\n")
+
+_TIMESTAMP = re.compile(r"^\[(\d{2}:\d{2}:\d{2})\]")
+
+
+def chunk_transcript(pieces, max_chars=SUMMARY_CHUNK_CHARS):
+    """把逐段的逐字稿按时间顺序装箱，每箱不超过 max_chars 个字符 (单段超长时独占一箱)。生成 (时间段, 文本)。"""
+    chunk, size = [], 0
+    for piece in pieces:
+        if chunk and size + len(piece) > max_chars:
+            yield time_span(chunk), "".join(chunk); chunk, size = [], 0
+        chunk.append(piece); size += len(piece)
+    if chunk: yield time_span(chunk), "".join(chunk)
+
+
+def time_span(pieces):
+    times = [m.group(1) for m in (_TIMESTAMP.match(p) for p in pieces) if m]
+    return f"{times[0]}–{times[-1]}" if times else "未知时段"
+
+
+class MeetingSummarizer:
+    """分段并行提炼、逐级合并的会议纪要生成器：summarizer.summarize(逐字稿片段的可迭代对象) -> 报告文本。"""
+
+    def __init__(self, gemini_model, chunk_chars=SUMMARY_CHUNK_CHARS, parallelism=SUMMARY_PARALLELISM, fan_in=SUMMARY_REDUCE_FANIN):
+        self.gemini_model = gemini_model
+        self.chunk_chars, self.parallelism, self.fan_in = chunk_chars, parallelism, max(2, fan_in)
+
+    def generate(self, prompt):
+        return self.gemini_model.generate_content(prompt).text.strip()
+
+    def summarize(self, pieces):
+        chunks = list(chunk_transcript(pieces, self.chunk_chars))
+        if not chunks: return ""
+        if len(chunks) == 1: return self.generate(REPORT_PROMPT + chunks[0][1])
+        print(f"[归档流程] 逐字稿较长，分 {len(chunks)} 段并行提炼要点 (并发 {self.parallelism})...")
+        return self.report_from_notes(self.chunk_notes(chunks))
+
+    def chunk_notes(self, chunks):
+        """并行提炼各段要点；个别段失败时留下占位说明，全部失败才报错。"""
+        with ThreadPoolExecutor(max_workers=self.parallelism) as executor:
+            notes = list(executor.map(self._summarize_chunk, chunks))
+        if all(note is None for note in notes): raise RuntimeError("所有分段的要点提炼都失败了")
+        return [note if note is not None else f"【{span}】(该时段要点提炼失败)" for note, (span, _) in zip(notes, chunks)]
+
+    def merge_notes(self, notes):
+        """分段要点超过 fan_in 份时逐级合并，直到能放进一个提示词。"""
+        with ThreadPoolExecutor(max_workers=self.parallelism) as executor:
+            while len(notes) > self.fan_in:
+                print(f"[归档流程] 合并 {len(notes)} 份分段要点...")
+                groups = [notes[i:i + self.fan_in] for i in range(0, len(notes), self.fan_in)]
+                notes = list(executor.map(self._merge_notes, groups))
+        return notes
+
+    def report_from_notes(self, notes):
+        return self.generate(REPORT_FROM_NOTES_PROMPT + "\n\n".join(self.merge_notes(notes)))
+
+    def _summarize_chunk(self, chunk):
+        span, text = chunk
+        for attempt in range(2):
+            try: return f"【{span}】\n{self.generate(CHUNK_PROMPT.format(span=span) + text)}"
+            except Exception as e: print(f"[错误] 时段 {span} 要点提炼失败 (第{attempt + 1}次): {e}")
+        return None
+
+    def _merge_notes(self, notes):
+        try: return self.generate(MERGE_PROMPT + "\n\n".join(notes))
+        except Exception as e:
+            print(f"[错误] 合并分段要点失败，保留原文: {e}"); return "\n\n".join(notes)
+
+
+class RollingSummary:
+    """会议进行中的滚动摘要：后台线程定期把会议日志里新增的逐字稿提炼成要点，finish() 时生成最终报告。"""
+
+    def __init__(self, summarizer, journal, interval_minutes=SUMMARY_ROLLING_MINUTES):
+        self.summarizer, self.journal = summarizer, journal
+        self.interval = interval_minutes * 60
+        self.notes, self.consumed = [], 0  # 已提炼的要点、已处理到第几段
+        self.offset = 0  # 会议日志已读到的文件位置，每次只读新增的部分
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._loop, name="滚动摘要", daemon=True)
+        if self.interval > 0: self.thread.start()
+
+    def _loop(self):
+        while not self.stop_event.wait(self.interval):
+            try: self.update()
+            except Exception as e: print(f"[错误] 滚动摘要更新失败，下次再试: {e}")
+
+    def update(self):
+        """提炼自上次以来新增的逐字稿；要点累积过多时先合并，结束时的工作量保持很小。"""
+        with self.lock:
+            entries, self.offset = self.journal.read_new(self.offset)
+            if not entries: return
+            pieces = [transcript_text(entry) for entry in entries]
+            chunks = list(chunk_transcript(pieces, self.summarizer.chunk_chars))
+            self.notes += self.summarizer.chunk_notes(chunks)
+            self.consumed += len(pieces)
+            self.notes = self.summarizer.merge_notes(self.notes)
+            print(f"[滚动摘要] 已提炼到第 {self.consumed} 段 ({chunks[-1][0]})，当前要点 {len(self.notes)} 份。")
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread.is_alive(): self.thread.join()
+
+    def finish(self):
+        """会议结束：补上最后一段增量，再由全部要点生成报告。会议很短、还没有要点时按原方式一次生成。"""
+        self.stop()
+        with self.lock: has_notes = bool(self.notes)
+        if not has_notes: return self.summarizer.summarize(self.journal.iter_transcript())
+        self.update()
+        return self.summarizer.report_from_notes(self.notes)
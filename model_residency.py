@@ -0,0 +1,143 @@
+# ==============================================================================
+#           模型常驻管理 (Model Residency Manager) v1.0
+# ==============================================================================
+# 版本说明:
+# - 【核心新增】Whisper 模型、Gemini 模型和 Notion 客户端统一由 ResidencyManager 管理：
+#              第一次使用时加载，会话结束后继续常驻，再按 1/2 开始新会话时直接复用，不再重新加载。
+# - 【空闲回收】没有会话在运行且超过 MODEL_IDLE_MINUTES 分钟没用过的资源会被释放，归还内存；
+#              下次需要时 (或界面被激活时由 preload() 在后台提前) 重新加载。
+# - 【可观测】记录每个资源的加载次数、加载耗时和加载前后进程常驻内存的变化，stats_line() 一行汇总。
+# ==============================================================================
+import contextlib
+import gc
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+MODEL_IDLE_MINUTES = float(os.getenv("MODEL_IDLE_MINUTES", "30"))  # 0 = 永不回收
+RESIDENCY_CHECK_SECONDS = 30
+
+_UNLOADED = object()
+
+
+def process_rss():
+    """当前进程的常驻内存 (字节)；装了 psutil 时用它，否则在Linux下读 /proc，都不可用时返回 None。"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError: pass
+    try:
+        with open("/proc/self/statm") as f: return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError): return None
+
+
+def format_mb(size):
+    return f"{size / 2 ** 20:.0f} MB" if size is not None else "未知"
+
+
+class ResidentResource:
+    """一个常驻资源：loader() 负责加载并返回它 (可以返回 None，如未配置的客户端)。"""
+
+    def __init__(self, name, loader, evictable=True):
+        self.name, self.loader, self.evictable = name, loader, evictable
+        self.value = _UNLOADED
+        self.lock = threading.Lock()
+        self.last_used = time.time()
+        self.loads, self.load_seconds, self.rss_delta = 0, 0.0, None
+
+    @property
+    def loaded(self):
+        return self.value is not _UNLOADED
+
+    def get(self):
+        """返回资源，尚未加载时在当前线程加载 (后台预加载进行中则等它完成)。"""
+        with self.lock:
+            if self.value is _UNLOADED: self._load()
+            self.last_used = time.time()
+            return self.value
+
+    def _load(self):
+        rss_before, started = process_rss(), time.time()
+        self.value = self.loader()
+        self.load_seconds = time.time() - started
+        rss_after = process_rss()
+        self.rss_delta = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+        self.loads += 1
+        print(f"[常驻] {self.name} 加载完毕，用时 {self.load_seconds:.1f} 秒，内存增加 {format_mb(self.rss_delta)}。")
+
+    def evict(self):
+        with self.lock:
+            if self.value is _UNLOADED: return False
+            self.value = _UNLOADED
+        gc.collect()
+        return True
+
+
+class ResidencyManager:
+    """按名字管理常驻资源。会话运行期间用 with manager.in_use(): 包住，期间不会回收任何资源。"""
+
+    def __init__(self, idle_minutes=MODEL_IDLE_MINUTES):
+        self.idle_seconds = idle_minutes * 60
+        self.resources = {}
+        self.active_sessions, self.last_preload = 0, 0.0
+        self.lock = threading.Lock()
+        if self.idle_seconds > 0: threading.Thread(target=self._evict_loop, name="常驻回收", daemon=True).start()
+
+    def register(self, name, loader, evictable=True):
+        self.resources[name] = ResidentResource(name, loader, evictable)
+
+    def get(self, *names):
+        """取一个或多个资源 (按需加载)：get("whisper") 返回单个，get("a", "b") 返回元组。"""
+        values = tuple(self.resources[name].get() for name in names)
+        return values[0] if len(values) == 1 else values
+
+    def preload(self, *names):
+        """在后台加载尚未加载的资源 (默认全部)，不阻塞界面；界面频繁触发时每 RESIDENCY_CHECK_SECONDS 秒最多一次。
+
+        已加载的资源自身带 preload() 时 (如 asr_server.AsrClient) 也调用它，让共享识别服务那边回收过的模型重新加载。
+        """
+        if time.time() - self.last_preload < RESIDENCY_CHECK_SECONDS: return
+        self.last_preload = time.time()
+        resources = [self.resources[n] for n in names or self.resources]
+        if any(not r.lock.locked() for r in resources):
+            threading.Thread(target=lambda: [self._warm(r) for r in resources], name="后台预加载", daemon=True).start()
+
+    @staticmethod
+    def _warm(resource):
+        try:
+            was_loaded = resource.loaded
+            value = resource.get()
+            if was_loaded and hasattr(value, "preload"): value.preload()
+        except Exception as e: print(f"[警告] 后台预加载 {resource.name} 失败，将在使用时重试: {e}")
+
+    @contextlib.contextmanager
+    def in_use(self):
+        with self.lock: self.active_sessions += 1
+        try: yield self
+        finally:
+            with self.lock: self.active_sessions -= 1
+            for resource in self.resources.values(): resource.last_used = time.time()  # 从会话结束时开始计空闲
+
+    def evict_idle(self):
+        """释放空闲超时的资源，返回被释放的名字。"""
+        with self.lock:
+            if self.active_sessions: return []
+        now, evicted = time.time(), []
+        for resource in self.resources.values():
+            if resource.evictable and now - resource.last_used >= self.idle_seconds and resource.evict(): evicted.append(resource.name)
+        if evicted: print(f"[常驻] 空闲超过 {self.idle_seconds / 60:.0f} 分钟，已释放: {', '.join(evicted)} (当前内存 {format_mb(process_rss())})")
+        return evicted
+
+    def _evict_loop(self):
+        while True:
+            time.sleep(RESIDENCY_CHECK_SECONDS)
+            try: self.evict_idle()
+            except Exception as e: print(f"[错误] 常驻资源回收出错: {e}")
+
+    def stats_line(self):
+        parts = [f"{r.name}{'(常驻)' if r.loaded else '(未加载)'} 加载{r.loads}次 上次{r.load_seconds:.1f}秒/{format_mb(r.rss_delta)}"
+                 for r in self.resources.values()]
+        return f"[常驻] 进程内存 {format_mb(process_rss())} | " + " | ".join(parts)
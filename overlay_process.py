@@ -0,0 +1,204 @@
+# ==============================================================================
+#           独立字幕窗口进程 (Out-of-Process Subtitle Overlay) v1.0
+# ==============================================================================
+# 版本说明:
+# - 【核心新增】字幕窗口改在单独的轻量Python进程里绘制 (只导入 tkinter)，与Whisper解码、重采样、
+#              上传等线程不再共用一个解释器和GIL，识别再忙窗口也不卡顿。
+# - 【管道通信】主程序通过子进程的标准输入发送一行一条的JSON消息 (设置文字、绑定/解绑按键、关闭)，
+#              界面进程把按键和关闭事件从标准输出发回来。
+# - 【合并更新】两端都只保留每个文本的最新值：主程序的发送线程只发最新的文字，界面进程每
+#              OVERLAY_REFRESH_MS 毫秒把收到的最新文字画一次，草稿字幕刷得再快也只渲染最后一条。
+# - 【接口兼容】OverlayWindow 提供 bind/unbind/protocol/after/winfo_exists/destroy/mainloop，
+#              var(name) 返回与 tk.StringVar 用法相同的对象，原来的按键处理和工作线程代码基本不用改。
+# ==============================================================================
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import types
+
+OVERLAY_REFRESH_MS = int(os.getenv("OVERLAY_REFRESH_MS", "30"))
+
+
+# ==============================================================================
+#  主程序端
+# ==============================================================================
+class RemoteVar:
+    """界面进程中一个标签文字的代理，用法同 tk.StringVar；可在任意线程调用 set()，不会阻塞。"""
+
+    def __init__(self, window, name):
+        self.window, self.name, self.value = window, name, ""
+
+    def set(self, value):
+        self.value = value
+        self.window._set_text(self.name, value)
+
+    def get(self):
+        return self.value
+
+
+class OverlayWindow:
+    """在子进程中显示的字幕窗口。
+
+    layout 描述窗口：title、width、height、y (None 表示贴近屏幕底部，距底边 bottom_margin)、bg、padx、pady，
+    labels 为标签列表 [{"name", "font", "fg", "side", "anchor", "fill"}, ...]，自上而下排列。
+    按键和关闭回调在调用 mainloop() 的线程里执行，after() 的回调也一样，与 Tk 主循环的行为一致。
+    """
+
+    def __init__(self, **layout):
+        self.process = subprocess.Popen([sys.executable, os.path.abspath(__file__)], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        text=True, encoding="utf-8", bufsize=1)
+        self.vars, self.handlers, self.close_handler = {}, {}, None
+        self.texts, self.commands = {}, []  # 待发送的最新文字 (按标签合并) 与按顺序发送的命令
+        self.send_lock = threading.Condition()
+        self.events = queue.Queue()  # 界面进程发回的事件和 after() 的回调，由 mainloop 依次执行
+        self.alive, self.shown = True, False
+        self.pending_after = []  # 窗口显示之前登记的 after() 回调
+        self._command({"op": "init", "layout": layout})
+        threading.Thread(target=self._send_loop, name="界面发送", daemon=True).start()
+        threading.Thread(target=self._receive_loop, name="界面接收", daemon=True).start()
+
+    def var(self, name):
+        return self.vars.setdefault(name, RemoteVar(self, name))
+
+    # --- 发送：文字只保留最新值，命令按顺序 ---
+    def _set_text(self, name, value):
+        with self.send_lock: self.texts[name] = value; self.send_lock.notify()
+
+    def _command(self, message):
+        with self.send_lock: self.commands.append(message); self.send_lock.notify()
+
+    def _send_loop(self):
+        while True:
+            with self.send_lock:
+                self.send_lock.wait_for(lambda: self.commands or self.texts or not self.alive)
+                messages = self.commands + [{"op": "set", "name": n, "value": v} for n, v in self.texts.items()]
+                self.commands, self.texts = [], {}
+            try:
+                for message in messages: self.process.stdin.write(json.dumps(message, ensure_ascii=True) + "\n")
+                self.process.stdin.flush()
+                if not self.alive: self.process.stdin.close(); return  # destroy() 之后：发完最后的命令就关闭管道
+            except (OSError, ValueError): self.alive = False; return  # 界面进程已退出
+
+    def _receive_loop(self):
+        for line in self.process.stdout:
+            try: self.events.put(json.loads(line))
+            except json.JSONDecodeError: continue
+        self.events.put({"event": "exit"})  # 界面进程退出 (被关闭或崩溃)
+
+    # --- 与 tk.Tk 兼容的部分接口 ---
+    def bind(self, sequence, handler):
+        self.handlers[sequence] = handler
+        self._command({"op": "bind", "sequence": sequence})
+
+    def unbind(self, sequence):
+        self.handlers.pop(sequence, None)
+        self._command({"op": "unbind", "sequence": sequence})
+
+    def protocol(self, name, handler):
+        if name == "WM_DELETE_WINDOW": self.close_handler = handler
+
+    def after(self, ms, callback):
+        if not ms: self.events.put(callback); return
+        timer = threading.Timer(ms / 1000, self.events.put, args=(callback,))
+        timer.daemon = True  # 与 Tk 一样，主循环结束后未到期的 after() 不再执行，也不拖住进程退出
+        timer.start()
+
+    def winfo_exists(self):
+        return self.alive
+
+    def destroy(self):
+        if not self.alive: return
+        self._command({"op": "destroy"})
+        with self.send_lock: self.alive = False; self.send_lock.notify()
+        self.events.put({"event": "exit"})
+
+    def mainloop(self):
+        while True:
+            item = self.events.get()
+            if callable(item):
+                if self.shown: self._call(item)
+                else: self.pending_after.append(item)  # 窗口还没画出来：等显示后再执行，与 Tk 主循环一致
+                continue
+            event = item.get("event")
+            if event == "shown":
+                self.shown = True
+                for callback in self.pending_after: self._call(callback)
+                self.pending_after = []
+            elif event == "key" and item.get("sequence") in self.handlers:
+                self._call(self.handlers[item["sequence"]], types.SimpleNamespace(sequence=item["sequence"]))
+            elif event == "close" and self.close_handler: self._call(self.close_handler)
+            elif event in ("close", "exit"):
+                if self.alive and event == "exit" and self.close_handler: self._call(self.close_handler); continue  # 窗口被意外关闭：走正常的退出流程
+                self.alive = False
+                try: self.process.wait(timeout=2)
+                except subprocess.TimeoutExpired: self.process.kill()
+                return
+
+    @staticmethod
+    def _call(callback, *args):
+        try: callback(*args)
+        except Exception as e: print(f"[错误] 界面回调出错: {e}")
+
+
+# ==============================================================================
+#  界面进程端
+# ==============================================================================
+def _emit(message):
+    sys.stdout.write(json.dumps(message, ensure_ascii=True) + "\n"); sys.stdout.flush()
+
+
+def _read_stdin(pending, lock):
+    """读线程：文字按标签只保留最新值，其他命令按顺序排队；不碰 Tk，由主线程定时取走。"""
+    for line in sys.stdin:
+        try: message = json.loads(line)
+        except json.JSONDecodeError: continue
+        with lock:
+            if message.get("op") == "set": pending["texts"][message["name"]] = message["value"]
+            else: pending["commands"].append(message)
+    with lock: pending["commands"].append({"op": "destroy"})  # 主程序退出，管道关闭
+
+
+def run_overlay():
+    import tkinter as tk
+    layout = json.loads(sys.stdin.readline())["layout"]
+    root = tk.Tk(); root.title(layout.get("title", ""))
+    width, height, bg = layout["width"], layout["height"], layout.get("bg", "#1E1E1E")
+    y = layout.get("y")
+    if y is None: y = root.winfo_screenheight() - height - layout.get("bottom_margin", 60)
+    root.geometry(f'{width}x{height}+{(root.winfo_screenwidth() - width) // 2}+{y}')
+    root.overrideredirect(True); root.wm_attributes("-topmost", True); root.config(bg=bg)
+    padx, pady = layout.get("padx", 20), layout.get("pady", 10)
+    frame = tk.Frame(root, bg=bg); frame.pack(expand=True, fill='both', padx=padx, pady=pady)
+    variables = {}
+    for spec in layout["labels"]:
+        variables[spec["name"]] = tk.StringVar()
+        tk.Label(frame, textvariable=variables[spec["name"]], font=tuple(spec["font"]), fg=spec.get("fg", "white"), bg=bg, justify='left',
+                 anchor=spec.get("anchor", "nw"), wraplength=width - 2 * padx).pack(side=spec.get("side", "top"), fill=spec.get("fill", "x"), expand=True)
+
+    pending, lock = {"texts": {}, "commands": []}, threading.Lock()
+    threading.Thread(target=_read_stdin, args=(pending, lock), daemon=True).start()
+
+    def refresh():
+        with lock:
+            commands, texts = pending["commands"], pending["texts"]
+            pending["commands"], pending["texts"] = [], {}
+        for command in commands:
+            op = command.get("op")
+            if op == "bind": root.bind(command["sequence"], lambda event, s=command["sequence"]: _emit({"event": "key", "sequence": s}))
+            elif op == "unbind": root.unbind(command["sequence"])
+            elif op == "destroy": root.destroy(); return
+        for name, value in texts.items():
+            if name in variables: variables[name].set(value)
+        root.after(OVERLAY_REFRESH_MS, refresh)
+
+    root.protocol("WM_DELETE_WINDOW", lambda: _emit({"event": "close"}))
+    root.after(0, lambda: _emit({"event": "shown"}))
+    refresh()
+    root.mainloop()
+
+
+if __name__ == '__main__':
+    run_overlay()
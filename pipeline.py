@@ -0,0 +1,385 @@
+# ==============================================================================
+#           实时字幕流水线 (Subtitle Pipeline) v2.1
+# ==============================================================================
+# 版本说明:
+# - 【核心新增】把原来“一个线程又录音又识别又翻译”的循环拆成四级流水线：
+#              采集 → 识别(Whisper) → 翻译(Gemini) → 输出(界面/Notion/会议记录)。
+# - 【不再丢音】各级之间用有界队列连接，采集线程永不等待识别和翻译，
+#              识别积压时丢弃最旧的语段并计数，而不是让声卡缓冲区悄悄溢出。
+# - 【瓶颈可见】定期打印各队列深度，一眼看出卡在识别、翻译还是上传。
+# - 【v1.1 新增】采集级逐帧转成16kHz float32 (流式多相重采样)，后续各级直接使用。
+# - 【v1.2 新增】重采样结果写入预分配的环形缓冲区，语段以零拷贝视图在各级之间传递。
+# - 【v1.3 新增】滑动窗口识别：说话过程中每隔约1秒对当前这句话做一次快速识别，
+#              把“草稿字幕”直接推到界面；整句结束后的“定稿”才进入翻译和会议记录。
+#              被强制切断的长句与上一段重叠约1秒，定稿时按前缀对齐去掉重复字词。
+# - 【v1.4 新增】翻译级支持批量翻译器 (translation.SegmentTranslator)，自动把排队的语段凑成一批；
+#              命中翻译记忆的语段不等待凑批，直接输出。
+# - 【v1.5 新增】翻译级支持异步翻译服务 (translation.AsyncTranslationService)：凑好的批次提交后
+#              立即去收下一批，多批并发翻译；由单独的排序线程按采集顺序等待结果再交给输出级。
+# - 【v1.6 新增】静音/噪声闸门：整段音量过低的语段直接跳过识别；识别结果中
+#              no_speech_prob 过高或 avg_logprob 过低的片段 (静音上的幻觉文字) 被丢弃，
+#              不再翻译、不再上传Notion。每次会话结束时报告跳过和丢弃的段数。
+# - 【v1.7 新增】可传入 spool (audio_spool.SessionSpool) 代替环形缓冲区：音频落盘保存，
+#              识别级直接读取映射文件上的视图，并为每个语段记录索引，便于事后重新转写。
+# - 【v1.8 新增】多路采集：每个输入设备一条流水线，run_pipelines 同时运行它们；
+#              识别级通过 asr_server.FairAsrScheduler 共用同一个模型，语段带 source 标签。
+# - 【v1.9 新增】可传入 tracer (latency_trace.LatencyTracer)：每个定稿语段记录采集结束、识别开始/结束、
+#              翻译开始/结束、显示的时间，随队列深度定期打印各环节延迟的 p50/p95/p99。
+# - 【v2.0 新增】可传入 backpressure (backpressure.BackpressureController)：识别级每段测量实时率，
+#              取语段时把积压的一并取出，按策略丢弃过期语段、合并相邻语段，字幕落后有上限。
+# - 【v2.1 新增】可传入 reopen_fn (如 audio_capture.CaptureHost.reopen)：音频流中断时采集级自行重新打开设备，
+#              识别/翻译/输出各级照常处理已采集的语段，模型、队列和会议记录都不受影响，不必重启会话。
+# - 【v2.2 修正】翻译出错 (包括整批失败) 时语段不再被丢弃：没有译文的先显示原文 (translation_fallback)，
+#              照常进入界面、会议记录和上传环节。
+# ==============================================================================
+import os
+import queue
+import re
+import threading
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+from audio_capture import RING_BUFFER_SECONDS, TARGET_RATE, AudioRingBuffer, PolyphaseResampler, frame_samples, int16_to_float32
+from latency_trace import stamp
+
+load_dotenv()
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "8"))
+PIPELINE_STATS_SECONDS = float(os.getenv("PIPELINE_STATS_SECONDS", "15"))  # 0 = 不打印队列深度
+STREAM_FATAL_ERRNOS = [-9999, -9988, -9997]
+STREAM_RECOVERY_SECONDS = float(os.getenv("STREAM_RECOVERY_SECONDS", "60"))  # 音频流中断后最多尝试恢复多久，0 = 不恢复
+STREAM_RETRY_SECONDS, STREAM_RETRY_MAX_SECONDS = 0.2, 2.0  # 设备暂时打不开时的重试间隔 (逐次加倍)
+PARTIAL_SUBTITLES = os.getenv("PARTIAL_SUBTITLES", "on").lower() != "off"
+PARTIAL_HOP_SECONDS = float(os.getenv("PARTIAL_HOP_SECONDS", "1.0"))  # 草稿字幕的刷新间隔
+PARTIAL_MIN_SECONDS = 0.5  # 太短的开头不值得识别
+STITCH_MAX_TOKENS = 30  # 前缀对齐时最多比较的字/词数
+GATE_MIN_RMS = float(os.getenv("GATE_MIN_RMS", "150"))  # 整段平均音量(int16刻度)低于此值不送识别
+GATE_NO_SPEECH_PROB = float(os.getenv("GATE_NO_SPEECH_PROB", "0.6"))  # 高于此值视为没有人声
+GATE_MIN_LOGPROB = float(os.getenv("GATE_MIN_LOGPROB", "-1.2"))  # 低于此值视为置信度过低
+
+_END = object()  # 队列结束标记：由采集级发出，逐级向下传递
+_TRACE_STAGES = {"识别": "asr", "翻译": "translate"}  # 延迟追踪中各级的时间戳前缀
+_CJK_PATTERN = re.compile(r"[\u3400-\u9fff]")
+_WORD_PATTERN = re.compile(r"[\w']+")
+_CHAR_PATTERN = re.compile(r"\w")
+
+
+def stitch_overlap(previous, current, max_tokens=STITCH_MAX_TOKENS):
+    """去掉 current 开头与 previous 结尾重复的部分 (两段重叠的音频被识别了两次)。中文按字比较，其他语言按词比较。"""
+    if not previous or not current: return current
+    cjk = bool(_CJK_PATTERN.search(current))
+    pattern = _CHAR_PATTERN if cjk else _WORD_PATTERN
+    previous_tokens = [m.group().lower() for m in pattern.finditer(previous)][-max_tokens:]
+    current_matches = list(pattern.finditer(current))[:max_tokens]
+    current_tokens = [m.group().lower() for m in current_matches]
+    for k in range(min(len(previous_tokens), len(current_tokens)), 1 if cjk else 0, -1):
+        if previous_tokens[-k:] == current_tokens[:k]:
+            return current[current_matches[k - 1].end():].lstrip(" ,.;:!?，。、；：！？")
+    return current
+
+
+def segment_rms(audio):
+    """float32 音频的均方根音量，换算到 int16 刻度以便和 VAD 阈值对照。"""
+    return float(np.sqrt(np.dot(audio, audio) / audio.size)) * 32768 if audio.size else 0.0
+
+
+def speech_segments(asr_segments, no_speech_prob=GATE_NO_SPEECH_PROB, min_logprob=GATE_MIN_LOGPROB):
+    """去掉 Whisper 判为没有人声、或置信度过低的片段 (静音和噪声上常见的幻觉输出)。"""
+    return [s for s in asr_segments if s.get("no_speech_prob", 0.0) <= no_speech_prob and s.get("avg_logprob", 0.0) >= min_logprob]
+
+
+class SubtitlePipeline:
+    """四级字幕流水线。各级处理函数由调用方提供，语段以字典在各级之间传递：
+
+    - transcribe_fn(segment) -> segment/None : 读取 segment['audio'] (16kHz、已归一化的float32只读视图)，写入识别结果
+    - translate_fn(segment)  -> segment/None : 写入翻译结果；也可传入带 translate_segments(list) 的批量翻译器
+                                               或异步翻译服务 (AsyncTranslationService)
+    - sink_fn(segment)                       : 更新界面、记录会议、上传Notion
+    - partial_fn(segment) (可选)             : 显示草稿字幕；segment['partial'] 为 True，不会被翻译或记录
+    spool (可选) 为 audio_spool.SessionSpool 时，音频写入落盘文件而不是内存环形缓冲区。
+    source (可选) 为多路采集时的来源标签，写入 segment['source']。
+    backpressure (可选) 为 backpressure.BackpressureController 时，识别跟不上实时会自动追赶。
+    tracer (可选) 为 latency_trace.LatencyTracer 时，定稿语段带 segment['trace'] 时间戳，输出级处理完即记录延迟。
+    reopen_fn(stream) (可选) -> (新stream, 采样率)：音频流中断时用它重新打开设备，失败返回 (None, None)。
+    返回 None 表示该语段到此为止 (例如没识别出文字)。
+    """
+
+    def __init__(self, stream, segmenter, transcribe_fn, translate_fn, sink_fn, stop_event, sample_rate=TARGET_RATE, queue_size=PIPELINE_QUEUE_SIZE,
+                 partial_fn=None, spool=None, source=None, tracer=None, backpressure=None, reopen_fn=None):
+        self.stream, self.segmenter = stream, segmenter  # stream 为 audio_capture.CallbackCapture
+        self.sample_rate = sample_rate
+        self.resampler = PolyphaseResampler(sample_rate, TARGET_RATE)
+        self.spool, self.source = spool, source  # source: 多路采集时的来源标签 (如 "麦克风")，写入每个语段
+        self.ring = spool if spool is not None else AudioRingBuffer(TARGET_RATE * RING_BUFFER_SECONDS)
+        self.transcribe_fn = transcribe_fn
+        self.tracer, self.backpressure = tracer, backpressure
+        self.reopen_fn = reopen_fn if STREAM_RECOVERY_SECONDS > 0 else None
+        self.partial_fn = partial_fn if PARTIAL_SUBTITLES else None
+        self.pending_partial, self.partial_lock = None, threading.Lock()
+        self.last_partial_end = 0
+        self.last_final_text = ""  # 上一段定稿的原始识别文本，用于去掉重叠部分
+        self.stop_event = stop_event
+        self.asr_queue = queue.Queue(maxsize=queue_size)
+        self.translate_queue = queue.Queue(maxsize=queue_size)
+        self.sink_queue = queue.Queue(maxsize=queue_size)
+        self.stages = [
+            ("识别", self.asr_queue, self._transcribe, self.translate_queue),
+            ("翻译", self.translate_queue, translate_fn, self.sink_queue),
+            ("输出", self.sink_queue, sink_fn, None),
+        ]
+        self.dropped_segments = 0
+        self.expired_segments = 0
+        self.silent_segments = 0  # 音量过低、未送识别
+        self.noise_segments = 0  # 识别结果被判为噪声/幻觉而丢弃
+        self.segment_count = 0
+        self.recoveries, self.recovery_downtime = 0, 0.0  # 音频流恢复次数及累计中断时长
+        self.fatal_error = None
+
+    def queue_depths(self):
+        """各级队列当前积压的语段数，积压最多的一级就是瓶颈。"""
+        return {name: q.qsize() for name, q, _, _ in self.stages}
+
+    def stats_line(self):
+        depths = " ".join(f"{name}={depth}/{q.maxsize}" for (name, q, _, _), depth in zip(self.stages, self.queue_depths().values()))
+        return (f"[流水线{f' {self.source}' if self.source else ''}] 队列深度 {depths} | 已采集 {self.segment_count} 段, 丢弃 {self.dropped_segments} 段, 过期 {self.expired_segments} 段, "
+                f"静音跳过 {self.silent_segments} 段, 噪声丢弃 {self.noise_segments} 段"
+                + (f", 断流恢复 {self.recoveries} 次 (共中断 {self.recovery_downtime:.1f} 秒)" if self.recoveries else ""))
+
+    def run(self):
+        """启动全部工作线程并阻塞，直到采集停止且已采集的语段全部处理完毕。"""
+        threads = [threading.Thread(target=self._capture_loop, name="采集", daemon=True)]
+        threads += [threading.Thread(target=self._batch_stage_loop if hasattr(stage[2], "fill_from_cache") else self._stage_loop,
+                                     args=stage, name=stage[0], daemon=True) for stage in self.stages]
+        for t in threads: t.start()
+        last_stats = time.time()
+        while any(t.is_alive() for t in threads):
+            threads[-1].join(timeout=0.5)
+            if PIPELINE_STATS_SECONDS and time.time() - last_stats >= PIPELINE_STATS_SECONDS:
+                print(self.stats_line()); last_stats = time.time()
+                if self.tracer: print(self.tracer.stats_line())
+                if self.backpressure: print(self.backpressure.stats_line())
+        print(self.stats_line())
+        if self.backpressure: print(self.backpressure.stats_line())
+        if hasattr(self.stages[1][2], "stats_line"): print(self.stages[1][2].stats_line())
+
+    def _enqueue_segment(self, start, end, continued):
+        self.segment_count += 1
+        segment = {"id": self.segment_count, "start": start, "end": end, "continued": continued, "audio": self.ring.view(start, end), "captured_at": time.time(),
+                   "source": self.source}
+        if self.tracer: self.tracer.start(segment)
+        with self.partial_lock: self.pending_partial = None  # 这句话已定稿，尚未执行的草稿作废
+        if self.spool is not None: self.spool.index_segment(self.segment_count, start, end, continued)
+        while True:
+            try:
+                self.asr_queue.put_nowait(segment); return
+            except queue.Full:
+                # 采集级绝不阻塞：识别跟不上时丢弃最旧的语段
+                try: self.asr_queue.get_nowait(); self.dropped_segments += 1
+                except queue.Empty: pass
+                print(f"[警告] 识别积压，已丢弃最旧语段 (累计 {self.dropped_segments} 段)。")
+
+    def _capture_loop(self):
+        frame_len = frame_samples(self.sample_rate)
+        scratch = np.empty(frame_len, dtype=np.float32)  # 每帧复用的转换缓冲
+        while not self.stop_event.is_set():
+            try:
+                frame = self.resampler.process(int16_to_float32(self.stream.read_frame(frame_len), out=scratch))
+                end = self.ring.write(frame)
+                for segment in self.segmenter.feed(frame, end): self._enqueue_segment(*segment)
+                if self.partial_fn: self._schedule_partial(end)
+            except IOError as e:
+                if e.errno in STREAM_FATAL_ERRNOS:
+                    if self.reopen_fn and self._recover_stream(e):
+                        frame_len = frame_samples(self.sample_rate); scratch = np.empty(frame_len, dtype=np.float32)  # 新流的采样率可能不同
+                        continue
+                    if self.stop_event.is_set(): break  # 恢复期间会话已被结束
+                    print("[错误] 音频流中断。"); self.fatal_error = e; break
+                print(f"[错误] IO错误: {e}"); time.sleep(1)
+            except Exception as e: print(f"[错误] 采集出错: {e}"); time.sleep(1)
+        self.asr_queue.put(_END)
+
+    def _recover_stream(self, error):
+        """音频流中断：先把正在说的这句定稿，再反复尝试重新打开设备，直到成功、超时或会话结束。"""
+        print(f"[恢复] 音频流中断 ({error.errno})，正在重新打开设备...")
+        lost_at = time.time()
+        segment = self.segmenter.flush(self.ring.written)
+        if segment is not None: self._enqueue_segment(*segment)
+        delay = STREAM_RETRY_SECONDS
+        while not self.stop_event.is_set() and time.time() - lost_at < STREAM_RECOVERY_SECONDS:
+            try: stream, sample_rate = self.reopen_fn(self.stream)
+            except Exception as e: print(f"[恢复] 重新打开设备失败: {e}"); stream = None
+            if stream is not None:
+                self.stream = stream
+                if sample_rate != self.sample_rate: self.sample_rate, self.resampler = sample_rate, PolyphaseResampler(sample_rate, TARGET_RATE)
+                self.recoveries += 1; self.recovery_downtime += time.time() - lost_at
+                print(f"[恢复] 音频流已恢复，中断 {time.time() - lost_at:.2f} 秒 (本次会话第 {self.recoveries} 次)。")
+                return True
+            self.stop_event.wait(delay); delay = min(delay * 2, STREAM_RETRY_MAX_SECONDS)
+        return False
+
+    def _schedule_partial(self, end):
+        """正在说话且识别空闲时，每隔 PARTIAL_HOP_SECONDS 为当前这句话登记一次草稿识别 (只保留最新的一次)。"""
+        start = self.segmenter.start
+        if start is None or end - self.last_partial_end < PARTIAL_HOP_SECONDS * TARGET_RATE: return
+        if end - start < PARTIAL_MIN_SECONDS * TARGET_RATE or not self.asr_queue.empty(): return
+        self.last_partial_end = end
+        with self.partial_lock:
+            self.pending_partial = {"id": None, "partial": True, "start": start, "end": end, "continued": self.segmenter.continued, "source": self.source}
+
+    def _run_partial(self):
+        with self.partial_lock: segment, self.pending_partial = self.pending_partial, None
+        if segment is None or not self.ring.is_valid(segment["start"]): return
+        segment["audio"] = self.ring.view(segment["start"], segment["end"])
+        result = self._gated_transcribe(segment, count=False)
+        if result is None: return
+        if result["continued"]: result["text"] = stitch_overlap(self.last_final_text, result["text"])
+        if result["text"]: self.partial_fn(result)
+
+    def _transcribe(self, segment):
+        if not self.ring.is_valid(segment["start"]):
+            # 识别积压太久，语段所在的缓冲区已被新音频覆盖
+            self.expired_segments += 1; return None
+        result = self._gated_transcribe(segment)
+        raw_text = result["text"] if result is not None else ""
+        if result is not None and result["continued"]:
+            result["text"] = stitch_overlap(self.last_final_text, raw_text)
+            if not result["text"]: result = None
+        self.last_final_text = raw_text
+        return result
+
+    def _gated_transcribe(self, segment, count=True):
+        """识别前后的静音/噪声闸门：音量过低不识别；结果只保留可信的片段，什么都不剩就返回 None。"""
+        if segment_rms(segment["audio"]) < GATE_MIN_RMS:
+            if count: self.silent_segments += 1
+            return None
+        started = time.time()
+        result = self.transcribe_fn(segment)
+        if count and self.backpressure: self.backpressure.observe(segment, time.time() - started)
+        if result is None or "asr_segments" not in result: return result
+        asr_segments = result.pop("asr_segments")
+        kept = speech_segments(asr_segments)
+        if len(kept) == len(asr_segments): return result
+        result["text"] = "".join(s["text"] for s in kept).strip()
+        if result["text"]: return result
+        if count: self.noise_segments += 1
+        return None
+
+    def _stage_loop(self, name, in_queue, fn, out_queue):
+        # 识别级空闲时顺便处理草稿字幕；定稿语段始终优先
+        idle_fn = self._run_partial if in_queue is self.asr_queue and self.partial_fn else None
+        trace_key = _TRACE_STAGES.get(name)
+        catch_up = in_queue is self.asr_queue and self.backpressure is not None
+        while True:
+            try:
+                segment = in_queue.get(timeout=0.1 if idle_fn else None)
+            except queue.Empty:
+                try: idle_fn()
+                except Exception as e: print(f"[错误] 草稿识别出错: {e}")
+                continue
+            ended = segment is _END
+            segments = [] if ended else [segment]
+            if catch_up and not ended: segments, ended = self._catch_up(segment)
+            for segment in segments:
+                if trace_key: stamp(segment, f"{trace_key}_start")
+                try:
+                    result = fn(segment)
+                except Exception as e:
+                    print(f"[错误] {name}阶段出错: {e}")
+                    if trace_key != "translate": continue
+                    result = _fallback_untranslated([segment])[0]  # 翻译出错也不能丢掉识别出的原文
+                if out_queue is None:
+                    if self.tracer: self.tracer.finish(segment)  # 输出级：已显示，记录这一段的延迟
+                elif result is not None:
+                    if trace_key: stamp(result, f"{trace_key}_end")
+                    out_queue.put(result)
+            if ended:
+                if out_queue is not None: out_queue.put(_END)
+                return
+
+    def _catch_up(self, segment):
+        """识别级取到语段时把队列里积压的一并取出，交给背压策略丢弃过期的、合并相邻的。返回 (要识别的语段, 是否已到结尾)。"""
+        segments, ended = [segment], False
+        while True:
+            try: item = self.asr_queue.get_nowait()
+            except queue.Empty: break
+            if item is _END: ended = True; break
+            segments.append(item)
+        if len(segments) == 1: return segments, ended
+        return [self._merge(group) for group in self.backpressure.plan(segments)], ended
+
+    def _merge(self, group):
+        """把相邻语段合并成一段：音频取第一段起点到最后一段终点的连续区间 (强制切断处的重叠自然消失)。"""
+        if len(group) == 1: return group[0]
+        merged = dict(group[0], end=group[-1]["end"], merged=len(group))
+        merged["audio"] = self.ring.view(merged["start"], merged["end"])
+        return merged
+
+    def _batch_stage_loop(self, name, in_queue, translator, out_queue):
+        """批量版的处理循环：拿到第一段后在 window_seconds 内继续收集，最多凑满 translator.batch_size 段。
+
+        translator 带 submit() (异步翻译服务) 时只提交不等待，结果由 _resequence_loop 按提交顺序输出。
+        """
+        submit = getattr(translator, "submit", None)
+        pending = queue.Queue()  # (批次, Future或None)，按提交顺序排列
+        emitter = threading.Thread(target=self._resequence_loop, args=(name, pending, out_queue), name=f"{name}排序", daemon=True)
+        emitter.start()
+        ended = False
+        while not ended:
+            segment = in_queue.get()
+            if segment is _END: break
+            if translator.fill_from_cache(segment):
+                _stamp_all([segment], "translate_start", "translate_end")
+                pending.put(([segment], None)); continue  # 翻译记忆命中：不必等待凑批
+            batch, deadline = [segment], time.time() + translator.window_seconds
+            while len(batch) < translator.batch_size:
+                try: segment = in_queue.get(timeout=max(0.0, deadline - time.time()))
+                except queue.Empty: break
+                if segment is _END: ended = True; break
+                translator.fill_from_cache(segment)  # 命中的随批次一起输出，不再占用请求
+                batch.append(segment)
+            _stamp_all(batch, "translate_start")
+            if submit:
+                future = submit(batch)
+                future.add_done_callback(lambda _, batch=batch: _stamp_all(batch, "translate_end"))  # 翻译完成的时间，不含排序等待
+                pending.put((batch, future)); continue
+            try:
+                translator.translate_segments(batch)
+            except Exception as e:
+                print(f"[错误] {name}阶段出错: {e}"); _fallback_untranslated(batch)  # 整批照常输出，原文不丢
+            _stamp_all(batch, "translate_end")
+            pending.put((batch, None))
+        pending.put(_END)
+        emitter.join()
+
+    def _resequence_loop(self, name, pending, out_queue):
+        """按提交顺序等待每一批的结果：后提交的先翻译完也要排在前面的批次之后输出。"""
+        while True:
+            item = pending.get()
+            if item is _END: break
+            batch, future = item
+            if future is not None:
+                try: future.result()
+                except Exception as e: print(f"[错误] {name}阶段出错: {e}"); _fallback_untranslated(batch)
+            for segment in batch: out_queue.put(segment)
+        out_queue.put(_END)
+
+
+def _fallback_untranslated(segments):
+    """翻译出错时，还没有译文的语段先以原文代替并标记 translation_fallback，照常显示和记录。"""
+    for segment in segments:
+        if "translation" not in segment: segment["translation"], segment["translation_fallback"] = segment["text"], True
+    return segments
+
+
+def _stamp_all(segments, *names):
+    for segment in segments:
+        for name in names: stamp(segment, name)
+
+
+def run_pipelines(pipelines):
+    """同时运行多条流水线 (每个输入设备一条)，全部结束后返回；任一条音频流中断时通过 fatal_error 反映出来。"""
+    if len(pipelines) == 1: pipelines[0].run(); return
+    threads = [threading.Thread(target=pipeline.run, name=f"流水线{i + 1}", daemon=True) for i, pipeline in enumerate(pipelines)]
+    for t in threads: t.start()
+    for t in threads: t.join()
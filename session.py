@@ -0,0 +1,145 @@
+# ==============================================================================
+#           字幕/会议会话 (Capture Session) v1.0
+# ==============================================================================
+# 版本说明:
+# - 【核心新增】把各入口脚本 (v1.0.py / aa.PY / ma.py) 里逐字相同的会话流程收拢到这里：
+#              打开各采集设备 (断流恢复)、会议日志与滚动摘要、识别调度与背压、合并/异步翻译、
+#              延迟追踪、流水线运行、收尾和会议归档。入口脚本只保留界面、按键和Notion上传的写法，
+#              后续改动流水线时不必再同步修改三份副本。
+# - 【脚本差异】通过参数传入：track_language (按检测到的语言决定翻译方向)、max_segment_s (单句最长时长)、
+#              upload_realtime (实时字幕模式每段的上传函数)、archive (会议结束后的归档函数)。
+# - 【线程约定】本函数在工作线程中运行，只通过文本变量更新界面；结束后由调用方回到界面线程重置按键。
+# ==============================================================================
+import threading
+
+
+def run_capture_session(residency, devices, is_meeting_mode, english_var, chinese_var, stop_event, open_stream,
+                        upload_realtime=None, archive=None, track_language=False, max_segment_s=None):
+    """运行一次字幕或会议会话，直到 stop_event 被设置，会议模式下随后完成归档。
+
+    residency 为 model_residency.ResidencyManager (已注册 whisper/gemini/notion)；devices 为 [(设备索引, 来源标签或None), ...]；
+    open_stream(pyaudio实例, 设备索引) -> (stream, 采样率)；upload_realtime(notion客户端, 原文, 译文) 在实时字幕模式下每段调用一次；
+    archive(notion客户端, 开始时间, 逐字稿块, 摘要, 训练数据) 在会议结束、纪要写入本地文件后调用。
+    """
+    print("\n[日志] 开始动态导入核心库..."); english_var.set("正在加载核心库..."); chinese_var.set("")
+    try:
+        import pyaudio; from datetime import datetime
+        from audio_capture import VAD_MAX_SEGMENT_SECONDS, CaptureHost, VadSegmenter; from pipeline import SubtitlePipeline, run_pipelines; from asr_server import FairAsrScheduler, get_asr_model; from translation import TRANSLATE_FAILED, AsyncTranslationService, SegmentTranslator; from language_tracker import LanguageTracker; from meeting_journal import MeetingJournal; from meeting_summary import MeetingSummarizer, RollingSummary; from audio_spool import AUDIO_SPOOL, SessionSpool; from latency_trace import LATENCY_TRACE, LatencyTracer; from backpressure import BackpressureController, SharedFallback
+    except ImportError as e: error_msg = f"核心库导入失败: {e}"; print(f"[错误] {error_msg}"); english_var.set(error_msg); return
+    print("[日志] 开始初始化AI模型和Notion客户端..."); english_var.set("正在初始化模型..."); chinese_var.set("请稍候...")
+    try:
+        whisper_model, gemini_model, notion_client = residency.get("whisper", "gemini", "notion")  # 上次会话加载过的直接复用
+        print("[日志] 模型与客户端初始化完毕。")
+    except Exception as e: error_msg = f"模型初始化失败: {e}"; print(f"[错误] {error_msg}"); english_var.set(error_msg); return
+    # 【断流恢复】CaptureHost 记住各设备的名称，音频流中断时重新枚举设备并重开，模型、队列和会议记录都保留
+    audio_host = CaptureHost(pyaudio, open_stream); streams = []
+    for index, label in devices:
+        print(f"[日志] 正在尝试以弹性模式启动设备索引 {index} 的音频流...")
+        stream, sample_rate = audio_host.open(index)
+        if stream: streams.append((stream, sample_rate, index, label))
+        else: print(f"[警告] 无法为设备索引 {index} 打开音频流。")
+    if not streams: error_msg = f"错误：无法为设备索引 {', '.join(str(index) for index, _ in devices)} 打开音频流。"; print(f"[错误] {error_msg}"); english_var.set(error_msg); audio_host.terminate(); return
+    # 【会议日志】每段字幕立即追加写入磁盘，崩溃后再次开始会议会接着写入
+    journal = MeetingJournal.open_meeting() if is_meeting_mode else None
+    start_time = journal.start_time if journal else datetime.now()
+    rolling_summary = RollingSummary(MeetingSummarizer(gemini_model), journal) if journal else None  # 会议中每隔几分钟在后台更新要点
+    if not stop_event.is_set(): english_var.set("... Listening ..."); chinese_var.set("")
+
+    # 【流水线】采集 → 识别 → 翻译 → 输出 分别在独立线程中运行，采集永不等待识别和翻译
+    # 【多路采集】多个设备共用同一个识别模型，按来源轮询调度，谁也不会饿死谁
+    asr_scheduler = FairAsrScheduler(whisper_model) if len(streams) > 1 else None
+    language_trackers = []
+
+    # 【背压】各路共用一个备用小模型，只加载一次
+    shared_fallback = SharedFallback(get_asr_model)
+
+    def make_transcriber(label, backpressure):
+        scheduled = asr_scheduler.client(label) if asr_scheduler else None
+        # 【语言跟踪】检测一次语言后显式传 language=，定期或置信度下降时才重新检测 (每路分别跟踪)
+        language_tracker = LanguageTracker() if track_language else None
+        if language_tracker: language_trackers.append(language_tracker)
+
+        def transcribe_segment(segment):
+            model = backpressure.model(whisper_model)  # 背压可能已换用更小的模型
+            if scheduled: model = scheduled.using(model)  # 多路采集时换了模型也仍经调度器公平轮询
+            # 音频已在采集级重采样为16kHz float32
+            result = language_tracker.transcribe(model, segment['audio'], fp16=False) if language_tracker else model.transcribe(segment['audio'], fp16=False)
+            segment['text'] = result['text'].strip()
+            segment['asr_segments'] = result.get('segments', [])  # 供流水线按 no_speech_prob/avg_logprob 过滤噪声
+            if not segment['text']: return None
+            if language_tracker: segment['language'] = result.get('language', 'en')
+            return segment
+        return transcribe_segment
+
+    def source_tag(segment):
+        return f"[{segment['source']}] " if segment.get('source') else ""
+
+    def show_partial(segment):
+        # 草稿字幕：边说边显示原文，译文保留上一句，整句定稿并翻译后再一起刷新
+        english_var.set(f"{source_tag(segment)}{segment['text']} …")
+
+    def translation_target(segment):
+        # 根据检测到的语言决定翻译方向：中文 -> 英文，英文 (或其他语言) -> 中文
+        return "English" if 'zh' in segment['language'] else "Simplified Chinese"
+
+    # 【合并翻译】同一时间窗内到达的多个语段合成一次Gemini请求；【异步并发】慢请求超时先显示原文
+    translator = AsyncTranslationService(SegmentTranslator(gemini_model, target_fn=translation_target if track_language else None))
+
+    # 【延迟追踪】每段记录采集结束→识别→翻译→显示→上传的时间，定期打印 p50/p95/p99，会话结束保存CSV/JSON
+    tracer = LatencyTracer() if LATENCY_TRACE else None
+
+    def upload_segment(segment, input_text, output_text):
+        upload_realtime(notion_client, input_text, output_text)
+        if tracer: tracer.record_upload(segment)
+
+    def deliver_segment(segment):
+        # UI更新：上方原文，下方译文 (input=原文, output=译文)
+        input_text, output_text = segment['text'], segment['translation']
+        english_var.set(f"{source_tag(segment)}{input_text}")
+        chinese_var.set(output_text)
+        if output_text == TRANSLATE_FAILED: return
+        if segment.get('translation_fallback'):
+            # 翻译超时，界面上先显示了原文：会议记录只记原文，不进训练数据和Notion
+            if is_meeting_mode: journal.append(segment)
+            return
+        if is_meeting_mode:
+            journal.append(segment)  # 无论源语言是什么，归档时都整理为 en 和 cn 格式
+        elif upload_realtime:  # 实时字幕模式
+            threading.Thread(target=upload_segment, args=(segment, input_text, output_text), daemon=True).start()
+
+    def make_pipeline(stream, sample_rate, index, label):
+        segmenter = VadSegmenter(max_segment_s=max_segment_s or VAD_MAX_SEGMENT_SECONDS)
+        # 【背压】识别跟不上实时时合并或丢弃积压语段，必要时换用更小的模型，字幕落后有上限
+        backpressure = BackpressureController(segmenter, fallback=shared_fallback)
+        # 【音频落盘】会议音频保存到磁盘 (多路时每个设备一份)，可事后用更大的模型重新转写
+        spool = SessionSpool.create(suffix=str(index) if label else "") if journal and AUDIO_SPOOL else None
+        return SubtitlePipeline(stream, segmenter, make_transcriber(label, backpressure), translator, deliver_segment, stop_event, sample_rate=sample_rate,
+                                partial_fn=show_partial, spool=spool, source=label, tracer=tracer, backpressure=backpressure, reopen_fn=audio_host.reopen)
+
+    pipelines = [make_pipeline(*stream_info) for stream_info in streams]
+    run_pipelines(pipelines)
+    translator.close()
+    if tracer: tracer.close()
+    for language_tracker in language_trackers: print(language_tracker.stats_line())
+    if asr_scheduler: print(asr_scheduler.stats_line())
+    if any(pipeline.fatal_error for pipeline in pipelines): english_var.set("音频流中断，请重启。"); chinese_var.set("")
+    for pipeline in pipelines:
+        pipeline.stream.stop_stream(); pipeline.stream.close()  # 恢复过的话 pipeline.stream 是新打开的流
+        if pipeline.spool: pipeline.spool.close()
+    audio_host.terminate()
+    if is_meeting_mode and journal.segment_count:
+        english_var.set("会议结束，正在处理..."); chinese_var.set("请稍候...")
+        ai_summary = ""
+        try:
+            print("\n[归档流程] 步骤 1/5: 开始生成AI摘要...")
+            # 【滚动摘要】会议中已在后台提炼了要点，这里只补最后一段增量再生成报告
+            ai_summary = rolling_summary.finish(); print("[归档流程] 步骤 1/5: 成功！")
+        except Exception as e: print(f"[错误] 生成AI摘要失败: {e}"); ai_summary = "AI摘要生成失败。"
+        filename = f"meeting_log_{start_time.strftime('%Y-%m-%d_%H-%M-%S')}.txt"
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(f"===== AI 会议纪要 =====\n\n--- AI 分析摘要 ---\n{ai_summary}\n\n--- 完整逐字稿 ---\n"); journal.write_transcript(f)
+        print(f"[日志] 完整纪要已保存到本地文件: {filename}")
+        journal.mark_archived()
+        if archive: archive(notion_client, start_time, journal.iter_chunks(2000, limit=100), ai_summary, list(journal.iter_training_pairs()))
+    elif journal: rolling_summary.stop(); journal.mark_archived()  # 没有任何字幕，无需归档
+    if journal: journal.close()
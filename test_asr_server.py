@@ -0,0 +1,21 @@
+import numpy as np
+
+from asr_server import spool_reference
+from audio_capture import AudioRingBuffer
+from audio_spool import SessionSpool
+
+
+def test_spool_view_is_sent_as_file_reference(tmp_path):
+    spool = SessionSpool(str(tmp_path / "session"))
+    spool.write(np.arange(1000, dtype=np.float32))
+    path, offset, length = spool_reference(spool.view(200, 700))
+    mapped = np.memmap(path, dtype=np.float32, mode="r", offset=offset, shape=(length,))  # 服务端的读法
+    np.testing.assert_array_equal(mapped, np.arange(200, 700))
+    spool.close()
+
+
+def test_ring_and_plain_arrays_are_copied():
+    ring = AudioRingBuffer(100)
+    ring.write(np.arange(50, dtype=np.float32))
+    assert spool_reference(ring.view(10, 40)) is None
+    assert spool_reference(np.zeros(10, dtype=np.float32)) is None
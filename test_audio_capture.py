@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from audio_capture import AudioRingBuffer, PolyphaseResampler, VadSegmenter
+
+RATE = 16000
+FRAME = 480  # 30ms
+
+
+def tone(seconds, amplitude=8000, freq=220):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (np.sin(2 * np.pi * freq * t) * amplitude).astype(np.int16)
+
+
+def segment_all(segmenter, audio):
+    """按30ms一帧喂入，收集切出的语段，最后 flush。"""
+    segments = []
+    for end in range(FRAME, len(audio) + 1, FRAME):
+        segments += segmenter.feed(audio[end - FRAME:end], end)
+    last = segmenter.flush(len(audio) - len(audio) % FRAME)
+    return segments + ([last] if last else [])
+
+
+def make_segmenter(**options):
+    defaults = dict(sample_rate=RATE, mode="vad", silence_ms=300, min_speech_ms=250, pre_roll_ms=300, max_segment_s=8, overlap_ms=1000)
+    return VadSegmenter(**{**defaults, **options})
+
+
+class TestVadSegmenter:
+    def test_speech_between_pauses_is_one_segment_with_pre_roll(self):
+        audio = np.concatenate([np.zeros(RATE, np.int16), tone(2), np.zeros(RATE, np.int16)])
+        segments = segment_all(make_segmenter(), audio)
+        assert len(segments) == 1
+        start, end, continued = segments[0]
+        assert RATE - int(0.3 * RATE) - FRAME <= start <= RATE  # 起音前保留约300ms
+        assert 3 * RATE <= end <= 3 * RATE + int(0.4 * RATE)  # 停顿300ms后结束
+        assert not continued
+
+    def test_short_blip_is_dropped(self):
+        audio = np.concatenate([np.zeros(RATE, np.int16), tone(0.1), np.zeros(RATE, np.int16)])
+        assert segment_all(make_segmenter(), audio) == []
+
+    def test_long_speech_is_cut_with_overlap(self):
+        segments = segment_all(make_segmenter(max_segment_s=4, overlap_ms=1000), tone(10))
+        assert len(segments) >= 3
+        for (_, previous_end, _), (start, end, continued) in zip(segments, segments[1:]):
+            assert continued
+            assert start == previous_end - RATE  # 与上一段重叠1秒
+        assert all(end - start <= 4 * RATE + FRAME for start, end, _ in segments)
+        assert segments[-1][1] == len(tone(10)) - len(tone(10)) % FRAME  # 一直说到最后也不丢
+
+    def test_loud_speech_does_not_raise_noise_floor_into_silence(self):
+        segments = segment_all(make_segmenter(max_segment_s=8), tone(20))
+        assert segments[-1][1] >= 19 * RATE
+
+    def test_fixed_mode_cuts_every_max_seconds(self):
+        segments = segment_all(make_segmenter(mode="fixed", max_segment_s=2, overlap_ms=0), np.zeros(5 * RATE, np.int16))
+        first_cut = -(-2 * RATE // FRAME) * FRAME  # 在达到2秒的那一帧末尾切断
+        assert segments[0][:2] == (0, first_cut)
+        assert segments[1][0] == first_cut  # 定长模式不重叠、不丢静音
+
+
+class TestPolyphaseResampler:
+    def test_streaming_matches_one_shot(self):
+        signal = np.random.default_rng(0).standard_normal(48000).astype(np.float32) * 0.1
+        whole = PolyphaseResampler(48000).process(signal)
+        streaming = PolyphaseResampler(48000)
+        pieces = [streaming.process(signal[i:i + 1024]) for i in range(0, len(signal), 1024)]
+        np.testing.assert_allclose(np.concatenate(pieces), whole, atol=1e-5)
+
+    @pytest.mark.parametrize("in_rate", [48000, 44100, 8000])
+    def test_output_length_follows_ratio(self, in_rate):
+        resampler = PolyphaseResampler(in_rate)
+        produced = sum(len(resampler.process(np.zeros(in_rate // 10, np.float32))) for _ in range(10))
+        assert abs(produced - RATE) <= 1
+
+    def test_in_band_tone_keeps_amplitude(self):
+        t = np.arange(48000) / 48000
+        out = PolyphaseResampler(48000).process((0.5 * np.sin(2 * np.pi * 1000 * t)).astype(np.float32))
+        steady = out[len(out) // 4:-len(out) // 4]
+        assert np.sqrt(np.mean(steady ** 2)) == pytest.approx(0.5 / np.sqrt(2), rel=0.02)
+
+    def test_same_rate_passes_through(self):
+        frame = np.ones(160, np.float32)
+        assert PolyphaseResampler(RATE).process(frame) is frame
+
+
+class TestAudioRingBuffer:
+    def test_view_across_wraparound_is_contiguous_and_read_only(self):
+        ring = AudioRingBuffer(10)
+        ring.write(np.arange(8, dtype=np.float32))
+        ring.write(np.arange(8, 14, dtype=np.float32))
+        view = ring.view(6, 14)
+        np.testing.assert_array_equal(view, np.arange(6, 14))
+        assert not view.flags.writeable
+        assert view.base is ring.data or view.base is ring.data.base  # 零拷贝
+
+    def test_overwritten_and_unwritten_ranges_return_none(self):
+        ring = AudioRingBuffer(10)
+        ring.write(np.arange(25, dtype=np.float32))
+        assert ring.view(14, 20) is None  # 已被覆盖
+        assert ring.view(20, 26) is None  # 尚未写入
+        np.testing.assert_array_equal(ring.view(15, 25), np.arange(15, 25))
+
+    def test_write_larger_than_capacity_keeps_latest(self):
+        ring = AudioRingBuffer(4)
+        assert ring.write(np.arange(10, dtype=np.float32)) == 10
+        np.testing.assert_array_equal(ring.view(6, 10), [6, 7, 8, 9])
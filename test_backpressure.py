@@ -0,0 +1,82 @@
+import time
+
+from backpressure import ASR_RTF_HIGH, BackpressureController, SharedFallback
+
+RATE = 16000
+
+
+class FakeSegmenter:
+    sample_rate = RATE
+
+    def __init__(self, seconds=8.0): self.max_seconds = seconds
+
+    def set_max_seconds(self, seconds): self.max_seconds = seconds
+
+
+def backlog(ages, seconds=2):
+    """按采集顺序排列的积压语段，ages 为各段已落后的秒数。"""
+    now = time.time()
+    return [{"start": i * seconds * RATE, "end": (i + 1) * seconds * RATE, "captured_at": now - age} for i, age in enumerate(ages)]
+
+
+def controller(policy="merge,drop", rtf=None, **options):
+    control = BackpressureController(FakeSegmenter(), policy=policy, max_lag=15, **options)
+    control.rtf = rtf
+    return control
+
+
+class TestPlan:
+    def test_keeps_segments_separate_when_keeping_up(self):
+        segments = backlog([6, 4, 2])
+        assert controller(rtf=0.3).plan(segments) == [[s] for s in segments]
+
+    def test_merges_adjacent_segments_when_rtf_is_high(self):
+        segments = backlog([6, 4, 2])
+        control = controller(rtf=ASR_RTF_HIGH + 0.5)
+        assert control.plan(segments) == [segments]
+        assert control.merged_segments == 2
+
+    def test_merges_when_oldest_segment_lags_too_long_even_with_low_rtf(self):
+        segments = backlog([14, 12, 2])
+        segments[0]["captured_at"] -= 2  # 最早一段落后 16 秒 > max_lag：实时率不高也要合并追赶 (未启用 drop)
+        groups = controller(policy="merge", rtf=0.3).plan(segments)
+        assert groups == [segments]
+
+    def test_drops_stale_segments_but_always_keeps_the_newest(self):
+        segments = backlog([40, 30, 20])
+        control = controller(policy="drop", rtf=0.3)
+        assert control.plan(segments) == [[segments[-1]]]
+        assert control.stale_segments == 2
+
+    def test_merge_groups_never_exceed_whisper_window(self):
+        segments = backlog([10, 9, 8, 7, 6, 5, 4, 3], seconds=8)
+        groups = controller(rtf=2.0).plan(segments)
+        assert all(group[-1]["end"] - group[0]["start"] <= 30 * RATE for group in groups)
+        assert sum(len(group) for group in groups) == len(segments)
+
+    def test_off_policy_leaves_backlog_untouched(self):
+        segments = backlog([40, 30, 20])
+        assert controller(policy="off", rtf=5.0).plan(segments) == [[s] for s in segments]
+
+
+class TestChunk:
+    @staticmethod
+    def observe(control, cost):
+        for seconds in [2, 4, 6, 8, 3, 5]:
+            control.observe({"start": 0, "end": seconds * RATE, "captured_at": time.time()}, cost(seconds))
+
+    def test_grows_only_when_per_call_overhead_is_the_bottleneck(self):
+        control = controller(policy="chunk")
+        self.observe(control, lambda seconds: 3 + 0.6 * seconds)
+        assert control.segmenter.max_seconds > 8
+
+    def test_does_not_grow_when_per_second_cost_cannot_keep_up(self):
+        control = controller(policy="chunk")
+        self.observe(control, lambda seconds: 0.1 + 1.1 * seconds)
+        assert control.segmenter.max_seconds == 8
+
+
+def test_model_policy_without_fallback_warns_once(capsys):
+    fallback = SharedFallback(load_model=lambda name: name, name="")
+    for _ in range(3): assert "model" not in controller(policy="model", fallback=fallback).actions
+    assert capsys.readouterr().out.count("ASR_FALLBACK_MODEL") == 1
@@ -0,0 +1,47 @@
+import queue
+
+import pytest
+
+from pipeline import _END, SubtitlePipeline, stitch_overlap
+
+
+class TestStitchOverlap:
+    @pytest.mark.parametrize("previous, current, expected", [
+        ("we should ship the release", "ship the release on Friday", "on Friday"),
+        ("We should SHIP it.", "ship it, then test", "then test"),
+        ("今天我们讨论发布计划", "发布计划和测试安排", "和测试安排"),
+        ("hello world", "something else entirely", "something else entirely"),
+        ("", "keep me", "keep me"),
+    ])
+    def test_removes_repeated_prefix(self, previous, current, expected):
+        assert stitch_overlap(previous, current) == expected
+
+    def test_single_cjk_character_is_not_treated_as_overlap(self):
+        assert stitch_overlap("我们开会", "会议继续") == "会议继续"
+
+    def test_only_compares_up_to_max_tokens(self):
+        words = " ".join(f"w{i}" for i in range(10))
+        assert stitch_overlap(words, words + " tail", max_tokens=3) == words + " tail"
+
+
+class FailingTranslator:
+    window_seconds, batch_size = 0.01, 4
+
+    def fill_from_cache(self, segment):
+        if segment["text"] == "cached": segment["translation"] = "缓存"
+        return "translation" in segment
+
+    def translate_segments(self, segments):
+        raise RuntimeError("gemini down")
+
+
+def test_failed_translation_batch_still_reaches_sink():
+    pipeline = SubtitlePipeline.__new__(SubtitlePipeline)  # 只测翻译级，不需要音频流
+    in_queue, out_queue = queue.Queue(), queue.Queue()
+    for text in ["cached", "a", "b"]: in_queue.put({"text": text})
+    in_queue.put(_END)
+    pipeline._batch_stage_loop("翻译", in_queue, FailingTranslator(), out_queue)
+    delivered = list(iter(out_queue.get, _END))
+    assert [s["text"] for s in delivered] == ["cached", "a", "b"]
+    assert delivered[0]["translation"] == "缓存" and "translation_fallback" not in delivered[0]
+    assert all(s["translation"] == s["text"] and s["translation_fallback"] for s in delivered[1:])
@@ -0,0 +1,72 @@
+import pytest
+
+from translation import TRANSLATE_FAILED, SegmentTranslator, TranslationCache, normalize_text, parse_numbered_lines
+
+
+class TestParseNumberedLines:
+    def test_splits_reply_by_number(self):
+        assert parse_numbered_lines("[1] 你好\n[2] 下一页", 2) == ["你好", "下一页"]
+
+    def test_tolerates_order_whitespace_and_chatter(self):
+        reply = "Sure, here you go:\n  [2]   第二句  \n[1] 第一句\n"
+        assert parse_numbered_lines(reply, 2) == ["第一句", "第二句"]
+
+    def test_missing_empty_and_out_of_range_numbers_are_none(self):
+        assert parse_numbered_lines("[1] 一\n[3]\n[4] 多出来的", 3) == ["一", None, None]
+
+
+@pytest.mark.parametrize("text", ["OK", "ok.", "  Ok!  ", "OK…"])
+def test_normalize_text_ignores_case_space_and_punctuation(text):
+    assert normalize_text(text) == "ok"
+
+
+class TestTranslationCache:
+    def test_normalized_lookup_hits(self, tmp_path):
+        cache = TranslationCache(str(tmp_path / "cache.db"))
+        cache.put("Next slide.", "Simplified Chinese", "下一页")
+        assert cache.get("next   SLIDE", "Simplified Chinese") == "下一页"
+        assert cache.get("next slide", "English") is None  # 目标语言不同
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_lru_evicts_oldest_from_memory_but_sqlite_keeps_it(self, tmp_path):
+        cache = TranslationCache(str(tmp_path / "cache.db"), capacity=2)
+        for text in ["a", "b", "c"]: cache.put(text, "zh", text.upper())
+        assert list(cache.memory) == [("zh", "b"), ("zh", "c")]
+        assert cache.get("a", "zh") == "A"  # 从SQLite读回并放回内存
+        assert ("zh", "a") in cache.memory and ("zh", "b") not in cache.memory
+
+    def test_persists_across_instances_with_hit_counts(self, tmp_path):
+        path = str(tmp_path / "cache.db")
+        cache = TranslationCache(path)
+        cache.put("thanks", "zh", "谢谢")
+        cache.get("thanks", "zh"); cache.get("Thanks!", "zh")
+        cache.flush()
+        reopened = TranslationCache(path)
+        assert reopened.get("thanks", "zh") == "谢谢"
+        assert reopened.db.execute("SELECT hits FROM translations").fetchone()[0] == 2
+
+    def test_failed_or_empty_translations_are_not_cached(self, tmp_path):
+        cache = TranslationCache(str(tmp_path / "cache.db"))
+        cache.put("hello", "zh", TRANSLATE_FAILED); cache.put("world", "zh", ""); cache.put("...", "zh", "点")
+        assert not cache.memory
+        assert cache.db.execute("SELECT COUNT(*) FROM translations").fetchone()[0] == 0
+
+
+class FakeGemini:
+    def __init__(self): self.prompts = []
+
+    def generate_content(self, prompt):
+        self.prompts.append(prompt)
+        lines = [line for line in prompt.splitlines() if line.startswith("[")]
+        return type("Reply", (), {"text": "\n".join(f"{line.split(']')[0]}] 译:{line.split('] ', 1)[1]}" for line in lines)})()
+
+
+def test_segment_translator_checks_cache_once_and_batches_misses(tmp_path):
+    gemini = FakeGemini()
+    translator = SegmentTranslator(gemini, cache=TranslationCache(str(tmp_path / "cache.db")))
+    translator.cache.put("ok", "Simplified Chinese", "好")
+    segments = [{"text": "ok"}, {"text": "first"}, {"text": "second"}]
+    translator.translate_segments(segments)
+    assert [s["translation"] for s in segments] == ["好", "译:first", "译:second"]
+    assert len(gemini.prompts) == 1  # 两条未命中合并成一次请求
+    assert (translator.cache.hits, translator.cache.misses) == (1, 2)
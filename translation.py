@@ -0,0 +1,274 @@
+# ==============================================================================
+#           翻译公共模块 (Translation Utils) v1.2
+# ==============================================================================
+# 版本说明:
+# - 【核心新增】合并翻译：短时间内到达的多个语段合并成一次Gemini请求，
+#              每行带编号发送，返回后按编号拆回各自的语段，请求数不再与语段数1:1。
+# - 【自适应批量】持续统计每批翻译的耗时，p95 超出预算就缩小批量，余量充足再放大。
+# - 【稳妥回退】返回结果缺行或编号对不上时，缺的那几条单独再翻译一次。
+# - 【v1.1 新增】翻译记忆：常见短句 ("OK"、"next slide"、产品名等) 按“目标语言 + 规范化原文”
+#              缓存，内存LRU + 本地SQLite持久化，命中时不再请求Gemini，立即显示；统计命中率。
+# - 【v1.2 新增】异步翻译服务：独立线程里的 asyncio 事件循环并发发出翻译请求，
+#              同时在途的请求数有上限，每个请求有截止时间；超时的语段先显示原文，
+#              晚到的译文仍写入翻译记忆。先完成的结果由流水线按原顺序重新排队后再显示。
+# ==============================================================================
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+TRANSLATE_BATCH_WINDOW_MS = int(os.getenv("TRANSLATE_BATCH_WINDOW_MS", "200"))  # 等待凑批的最长时间
+TRANSLATE_MAX_BATCH = int(os.getenv("TRANSLATE_MAX_BATCH", "8"))
+TRANSLATE_P95_BUDGET_SECONDS = float(os.getenv("TRANSLATE_P95_BUDGET_SECONDS", "2.5"))  # 单批翻译耗时的p95预算
+TRANSLATION_CACHE = os.getenv("TRANSLATION_CACHE", "on").lower() != "off"
+TRANSLATION_CACHE_PATH = os.getenv("TRANSLATION_CACHE_PATH", "translation_cache.sqlite3")
+TRANSLATION_CACHE_SIZE = int(os.getenv("TRANSLATION_CACHE_SIZE", "2000"))  # 内存LRU条数
+TRANSLATION_CACHE_FLUSH_HITS = 50  # 命中次数攒够这么多再一次写回SQLite，不在翻译线程里逐条提交
+TRANSLATE_MAX_IN_FLIGHT = int(os.getenv("TRANSLATE_MAX_IN_FLIGHT", "3"))  # 同时在途的翻译请求数上限
+TRANSLATE_DEADLINE_SECONDS = float(os.getenv("TRANSLATE_DEADLINE_SECONDS", "4"))  # 超过这个时间先显示原文
+TRANSLATE_FAILED = "[翻译失败]"
+DEFAULT_TARGET = "Simplified Chinese"
+
+_NUMBERED_LINE = re.compile(r"^\s*\[(\d+)\]\s*(.*)$")
+
+
+def percentile(values, q):
+    """简单分位数 (最近邻法)，values 为空时返回 0。"""
+    if not values: return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def single_prompt(text, target):
+    return f"Translate to {target}, returning only the translation:\n{text}"
+
+
+def batch_prompt(texts, target):
+    lines = "\n".join(f"[{i}] {' '.join(text.split())}" for i, text in enumerate(texts, 1))
+    return (f"Translate each numbered line to {target}. Reply with exactly one line per input in the form \"[n] translation\", "
+            f"keeping the same numbers and adding nothing else.\n{lines}")
+
+
+def parse_numbered_lines(reply, count):
+    """把 “[n] 译文” 形式的回复拆回列表，缺失的编号位置为 None。"""
+    results = [None] * count
+    for line in reply.splitlines():
+        match = _NUMBERED_LINE.match(line)
+        if match and 1 <= int(match.group(1)) <= count and match.group(2).strip():
+            results[int(match.group(1)) - 1] = match.group(2).strip()
+    return results
+
+
+def normalize_text(text):
+    """缓存键用的规范化：忽略大小写、多余空白和首尾标点。"""
+    return " ".join(text.lower().split()).strip(" .,!?;:…。，！？；：、")
+
+
+class TranslationCache:
+    """翻译记忆：内存LRU在前，本地SQLite在后；键为 (目标语言, 规范化原文)。"""
+
+    def __init__(self, path=TRANSLATION_CACHE_PATH, capacity=TRANSLATION_CACHE_SIZE):
+        self.capacity = capacity
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+        self.pending_hits = {}  # 键 -> 尚未写回数据库的命中次数
+        self.db = None
+        try:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS translations (target TEXT, source TEXT, translation TEXT, hits INTEGER DEFAULT 0, "
+                            "updated_at REAL, PRIMARY KEY (target, source))")
+            self.db.commit()
+        except sqlite3.Error as e:
+            print(f"[警告] 翻译缓存数据库不可用，仅使用内存缓存: {e}"); self.db = None
+
+    def get(self, text, target):
+        key = (target, normalize_text(text))
+        if not key[1]: return None
+        with self.lock:
+            translation = self.memory.get(key)
+            if translation is None and self.db is not None:
+                row = self.db.execute("SELECT translation FROM translations WHERE target = ? AND source = ?", key).fetchone()
+                if row: translation = row[0]; self._remember(key, translation)
+            if translation is None: self.misses += 1; return None
+            self.memory.move_to_end(key); self.hits += 1
+            if self.db is not None:
+                self.pending_hits[key] = self.pending_hits.get(key, 0) + 1
+                if sum(self.pending_hits.values()) >= TRANSLATION_CACHE_FLUSH_HITS: self._flush_hits()
+            return translation
+
+    def put(self, text, target, translation):
+        key = (target, normalize_text(text))
+        if not key[1] or not translation or translation == TRANSLATE_FAILED: return
+        with self.lock:
+            self._remember(key, translation)
+            if self.db is not None:
+                self.db.execute("INSERT OR REPLACE INTO translations (target, source, translation, hits, updated_at) VALUES (?, ?, ?, "
+                                "COALESCE((SELECT hits FROM translations WHERE target = ? AND source = ?), 0), ?)",
+                                (*key, translation, *key, time.time()))
+                self._flush_hits()  # 本来就要提交，顺便写回攒下的命中次数
+                self.db.commit()
+
+    def flush(self):
+        """把攒下的命中次数写回数据库 (会话结束时调用)。"""
+        with self.lock:
+            if self.db is not None and self.pending_hits: self._flush_hits(); self.db.commit()
+
+    def _flush_hits(self):
+        """调用时需持有 lock；由调用方负责 commit。"""
+        now = time.time()
+        self.db.executemany("UPDATE translations SET hits = hits + ?, updated_at = ? WHERE target = ? AND source = ?",
+                            [(count, now, *key) for key, count in self.pending_hits.items()])
+        self.pending_hits = {}
+
+    def _remember(self, key, translation):
+        self.memory[key] = translation; self.memory.move_to_end(key)
+        while len(self.memory) > self.capacity: self.memory.popitem(last=False)
+
+    def stats_line(self):
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0
+        return f"[翻译缓存] 命中 {self.hits} / 查询 {total} (命中率 {rate:.1f}%)，内存中 {len(self.memory)} 条"
+
+
+class SegmentTranslator:
+    """字幕流水线的翻译级：批量翻译语段并写入 segment['translation']，失败时写入 “[翻译失败]”。
+
+    target_fn(segment) 返回目标语言 (如 "English")，默认一律译为简体中文。
+    cache 默认使用本地翻译记忆 (TRANSLATION_CACHE=off 可关闭)。
+    """
+
+    def __init__(self, gemini_model, target_fn=None, window_ms=TRANSLATE_BATCH_WINDOW_MS, max_batch=TRANSLATE_MAX_BATCH,
+                 p95_budget=TRANSLATE_P95_BUDGET_SECONDS, cache=None):
+        self.gemini_model = gemini_model
+        self.cache = cache if cache is not None else (TranslationCache() if TRANSLATION_CACHE else None)
+        self.target_fn = target_fn or (lambda segment: DEFAULT_TARGET)
+        self.window_seconds = window_ms / 1000
+        self.max_batch, self.p95_budget = max_batch, p95_budget
+        self.batch_size = max_batch
+        self.latencies = deque(maxlen=20)
+        self.lock = threading.Lock()
+        self.request_count = self.segment_count = 0
+
+    def generate(self, prompt):
+        with self.lock: self.request_count += 1
+        return self.gemini_model.generate_content(prompt).text.strip()
+
+    def translate_texts(self, texts, target):
+        """翻译一组同一目标语言的文本，返回等长列表，失败项为 None。"""
+        if len(texts) == 1:
+            try: return [self.generate(single_prompt(texts[0], target))]
+            except Exception as e: print(f"[错误] Gemini翻译失败: {e}"); return [None]
+        try:
+            results = parse_numbered_lines(self.generate(batch_prompt(texts, target)), len(texts))
+        except Exception as e:
+            print(f"[错误] Gemini批量翻译失败: {e}"); results = [None] * len(texts)
+        missing = [i for i, r in enumerate(results) if r is None]
+        if missing: print(f"[警告] 批量翻译缺少 {len(missing)}/{len(texts)} 行，逐条补译。")
+        for i in missing:
+            results[i] = self.translate_texts([texts[i]], target)[0]
+        return results
+
+    def fill_from_cache(self, segment):
+        """翻译记忆里有这句话就直接填入译文并返回 True。每个语段只查一次，未命中会记在 segment['cache_checked']。"""
+        if self.cache is None or "translation" in segment: return "translation" in segment
+        if segment.get("cache_checked"): return False  # 流水线凑批前已查过 (异步服务传入的副本也带着这个标记)
+        translation = self.cache.get(segment["text"], self.target_fn(segment))
+        if translation is None: segment["cache_checked"] = True; return False
+        segment["translation"] = translation
+        return True
+
+    def translate_segments(self, segments):
+        """批量翻译一组语段 (可混合不同目标语言)，就地写入译文并原样返回；已在翻译记忆中的不再请求。"""
+        pending = [segment for segment in segments if not self.fill_from_cache(segment)]
+        if not pending: return segments
+        started = time.time()
+        groups = {}
+        for segment in pending: groups.setdefault(self.target_fn(segment), []).append(segment)
+        for target, group in groups.items():
+            for segment, translation in zip(group, self.translate_texts([s["text"] for s in group], target)):
+                segment["translation"] = translation if translation else TRANSLATE_FAILED
+                if self.cache is not None: self.cache.put(segment["text"], target, translation)
+        self.record_latency(time.time() - started, len(pending))
+        return segments
+
+    def __call__(self, segment):
+        return self.translate_segments([segment])[0]
+
+    def record_latency(self, seconds, batch_len):
+        with self.lock:
+            self.segment_count += batch_len
+            self.latencies.append(seconds)
+            p95 = percentile(self.latencies, 95)
+            if p95 > self.p95_budget and self.batch_size > 1:
+                self.batch_size = max(1, self.batch_size // 2)
+                self.latencies.clear()  # 批量已调整，旧样本不再有代表性
+                print(f"[翻译] p95耗时 {p95:.2f}s 超出预算，批量缩小为 {self.batch_size}。")
+            elif p95 < self.p95_budget * 0.6 and batch_len >= self.batch_size and self.batch_size < self.max_batch:
+                self.batch_size += 1
+
+    def stats_line(self):
+        average = self.segment_count / self.request_count if self.request_count else 0
+        line = (f"[翻译] 共 {self.segment_count} 段 / {self.request_count} 次请求 (平均每次 {average:.1f} 段), "
+                f"当前批量 {self.batch_size}, p95耗时 {percentile(self.latencies, 95):.2f}s")
+        return f"{line}\n{self.cache.stats_line()}" if self.cache is not None else line
+
+
+class AsyncTranslationService:
+    """包装 SegmentTranslator 的异步翻译服务：submit(语段列表) 立即返回 Future，不阻塞调用线程。
+
+    - 同时在途的请求不超过 max_in_flight 个 (超时的请求真正结束前仍占着名额，慢的Gemini不会越压越多)；
+    - 从提交起超过 deadline 秒仍无结果的语段，译文先填原文并标记 segment['translation_fallback']。
+    其余属性 (fill_from_cache / window_seconds / batch_size / stats_line) 转发给内部的翻译器。
+    """
+
+    def __init__(self, translator, max_in_flight=TRANSLATE_MAX_IN_FLIGHT, deadline=TRANSLATE_DEADLINE_SECONDS):
+        self.translator = translator
+        self.max_in_flight, self.deadline = max_in_flight, deadline
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="翻译请求")
+        self.loop = asyncio.new_event_loop()
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        self.timeout_count = 0
+        threading.Thread(target=self.loop.run_forever, name="翻译事件循环", daemon=True).start()
+
+    def __getattr__(self, name):
+        return getattr(self.translator, name)
+
+    def submit(self, segments):
+        return asyncio.run_coroutine_threadsafe(self._translate(segments), self.loop)
+
+    async def _translate(self, segments):
+        work = [dict(segment) for segment in segments]  # 超时后后台请求仍在进行，不能让它再改动已显示的语段
+        try:
+            await asyncio.wait_for(self._run(work), self.deadline)
+            for segment, done in zip(segments, work): segment["translation"] = done["translation"]
+        except asyncio.TimeoutError:
+            waiting = [segment for segment in segments if "translation" not in segment]  # 已从翻译记忆填好的保留原译文
+            self.timeout_count += len(waiting)
+            print(f"[警告] 翻译超过 {self.deadline:.1f} 秒未返回，先显示原文 (累计 {self.timeout_count} 段)。")
+            for segment in waiting: segment["translation"], segment["translation_fallback"] = segment["text"], True
+        except Exception as e:
+            print(f"[错误] 异步翻译出错: {e}")
+            for segment in segments: segment.setdefault("translation", TRANSLATE_FAILED)
+        return segments
+
+    async def _run(self, work):
+        await self.semaphore.acquire()
+        request = self.loop.run_in_executor(self.executor, self.translator.translate_segments, work)
+        request.add_done_callback(lambda _: self.semaphore.release())
+        await asyncio.shield(request)
+
+    def stats_line(self):
+        return f"{self.translator.stats_line()}\n[翻译] 超时改显示原文 {self.timeout_count} 段 (截止 {self.deadline:.1f}s, 并发上限 {self.max_in_flight})"
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.executor.shutdown(wait=False)
+        if self.translator.cache is not None: self.translator.cache.flush()
@@ -0,0 +1,80 @@
+# ==============================================================================
+#           启动预热 (Startup Warm Import) v1.0
+# ==============================================================================
+# 版本说明:
+# - 【核心新增】字幕窗口先显示，google.generativeai、notion_client、pyaudio、numpy (以及本地加载时的
+#              whisper/torch) 等重量级模块改在后台线程里立即开始导入；工作线程用到时直接取用已导入的模块，
+#              后台还没导入完的由Python的导入锁自动等待，不会重复导入。
+# - 【预加载模型】STARTUP_WARM=models 时导入完成后接着在后台加载模型 (由调用方传入 after，如 residency.preload)。
+# - 【冷启动耗时】导入完成后打印“窗口显示用时 + 各模块导入耗时”，并追加一行到 startup_times.jsonl，
+#              便于按入口脚本跟踪冷启动时间的变化。入口脚本须把本模块放在第一条import，
+#              tkinter、dotenv 等的导入耗时才会计入。
+# ==============================================================================
+import importlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+PROCESS_STARTED = time.perf_counter()  # 入口脚本的第一条import就是本模块，以此近似程序启动的时刻 (不含解释器自身启动)
+
+load_dotenv()
+STARTUP_WARM = os.getenv("STARTUP_WARM", "models").lower()  # models=预导入并预加载模型 | imports=只预导入 | off=用到时再导入
+STARTUP_LOG = os.getenv("STARTUP_LOG", "startup_times.jsonl")  # 留空则不记录
+COMMON_MODULES = ["numpy", "pyaudio", "google.generativeai", "notion_client", "audio_capture", "pipeline", "asr_server", "translation"]
+
+
+def heavy_modules(*extra):
+    """入口脚本需要预导入的模块：公共部分 + extra；识别模型在本进程内加载时再加上 whisper (会连带导入torch)。"""
+    from asr_server import ASR_SERVER_MODE
+    return COMMON_MODULES + list(extra) + (["whisper"] if ASR_SERVER_MODE == "off" else [])
+
+
+class WarmImporter:
+    """后台逐个导入模块并计时。窗口显示后调用 window_shown()，两件事都完成时打印并记录冷启动耗时。"""
+
+    def __init__(self, entry, modules, after=None, mode=STARTUP_WARM):
+        self.entry, self.modules, self.after, self.mode = entry, modules, after, mode
+        self.timings, self.failed = {}, {}
+        self.window_seconds = self.imports_done = None
+        self.reported = False
+        self.lock = threading.Lock()
+
+    def start(self):
+        if self.mode == "off": return
+        threading.Thread(target=self._run, name="启动预热", daemon=True).start()
+
+    def _run(self):
+        for name in self.modules:
+            started = time.perf_counter()
+            try: importlib.import_module(name)
+            except Exception as e: self.failed[name] = repr(e)  # 留给工作线程导入时按原来的方式报错
+            self.timings[name] = time.perf_counter() - started
+        with self.lock: self.imports_done = time.perf_counter() - PROCESS_STARTED
+        self._maybe_report()
+        if self.after and self.mode == "models":
+            try: self.after()
+            except Exception as e: print(f"[警告] 启动时预加载模型失败，将在使用时重试: {e}")
+
+    def window_shown(self):
+        with self.lock: self.window_seconds = time.perf_counter() - PROCESS_STARTED
+        self._maybe_report()
+
+    def _maybe_report(self):
+        with self.lock:
+            if self.reported or self.window_seconds is None or self.imports_done is None: return
+            self.reported = True
+        breakdown = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in sorted(self.timings.items(), key=lambda item: -item[1]))
+        print(f"[启动] {self.entry}: 窗口显示用时 {self.window_seconds:.2f} 秒，后台导入完成于 {self.imports_done:.2f} 秒 "
+              f"(共 {sum(self.timings.values()):.2f} 秒: {breakdown})")
+        for name, error in self.failed.items(): print(f"[警告] 预导入 {name} 失败: {error}")
+        if not STARTUP_LOG: return
+        record = {"entry": self.entry, "at": datetime.now().isoformat(timespec="seconds"), "window_seconds": round(self.window_seconds, 3),
+                  "imports_done_seconds": round(self.imports_done, 3), "imports": {name: round(s, 3) for name, s in self.timings.items()},
+                  "failed": sorted(self.failed)}
+        try:
+            with open(STARTUP_LOG, "a", encoding="utf-8") as f: f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e: print(f"[警告] 无法写入启动耗时记录: {e}")